@@ -1,3 +1,4 @@
 """
 ezaddress package
-"""
\ No newline at end of file
+"""
+default_app_config = 'ezaddress.apps.EzAddressConfig'
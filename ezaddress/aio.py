@@ -0,0 +1,152 @@
+"""
+ezaddress asyncio support; requires python 3.5 or later.
+
+The ORM is synchronous, so resolution runs on a small thread pool owned by
+an `AddressResolver`, of `EZADDRESS_RESOLVER_WORKERS` threads by default. 
+Values passed to `ato_address` by coroutines running concurrently are 
+resolved together with a single `to_addresses` call, in a single thread 
+hop, rather than each waiting on a thread of its own.
+
+Django opens a database connection per thread, so each thread of the pool
+holds its own. As for requests, they're closed around every call once past
+their `CONN_MAX_AGE` or unusable, and are only kept between calls if 
+`CONN_MAX_AGE` is set; size the pool with the connections the database 
+allows in mind.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import LOOKUP_BATCH_SIZE, to_address, to_addresses
+from .routers import unpin
+
+
+
+__all__ = ['AddressResolver', 'resolver', 'ato_address', 'ato_addresses',
+           'aget', 'afirst', 'acount', 'alist']
+
+
+def resolver_workers():
+    return getattr(settings, 'EZADDRESS_RESOLVER_WORKERS', 4)
+
+
+def _call(func, *args, **kwargs):
+    # as for requests, don't keep connections past their maximum age nor
+    # reads pinned to the primary database past the call
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        unpin()
+        close_old_connections()
+
+
+def _resolve_batch(values):
+    """Returns a (result, exception) pair for each of `values`. Should any
+    value fail to resolve, each is resolved on its own so that only failing
+    values get an exception.
+    """
+    try:
+        return [(addr, None) for addr in to_addresses(values)]
+    except Exception:
+        pass
+    
+    results = []
+    for value in values:
+        try:
+            results.append((to_address(value), None))
+        except Exception as ex:
+            results.append((None, ex))
+    return results
+
+
+def _deliver(batch, job):
+    exception = job.exception()
+    results = job.result() if exception is None else \
+              [(None, exception)] * len(batch)
+    for ((value, future), (result, ex)) in zip(batch, results):
+        if future.cancelled():
+            continue
+        if ex is None:
+            future.set_result(result)
+        else:
+            future.set_exception(ex)
+
+
+class AddressResolver(object):
+    """Resolves address values for coroutines on a pool of `workers`
+    threads, `EZADDRESS_RESOLVER_WORKERS` if not given. Values submitted
+    through `resolve` during the same iteration of an event loop are 
+    resolved as one batch of up to `max_batch` values.
+    """
+    
+    def __init__(self, workers=None, max_batch=LOOKUP_BATCH_SIZE):
+        self.workers = workers or resolver_workers()
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._batches = {}
+    
+    def run(self, func, *args, **kwargs):
+        """Calls `func` on the resolver's threads and returns an awaitable
+        for its result.
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(
+            self._executor, functools.partial(_call, func, *args, **kwargs))
+    
+    async def resolve(self, value):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self._batches.get(loop)
+        if batch is None:
+            batch = self._batches[loop] = []
+            loop.call_soon(self._flush, loop)
+        batch.append((value, future))
+        if len(batch) >= self.max_batch:
+            self._flush(loop)
+        return await future
+    
+    async def resolve_many(self, values):
+        return await self.run(to_addresses, list(values))
+    
+    def _flush(self, loop):
+        batch = self._batches.pop(loop, None)
+        if batch:
+            job = self.run(_resolve_batch, [value for (value, _) in batch])
+            job.add_done_callback(functools.partial(_deliver, batch))
+    
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+
+resolver = AddressResolver()
+
+
+async def ato_address(value):
+    """Asynchronous `to_address`."""
+    return await resolver.resolve(value)
+
+
+async def ato_addresses(values):
+    """Asynchronous `to_addresses`."""
+    return await resolver.resolve_many(values)
+
+
+async def aget(queryset, *args, **kwargs):
+    return await resolver.run(queryset.get, *args, **kwargs)
+
+
+async def afirst(queryset):
+    return await resolver.run(queryset.first)
+
+
+async def acount(queryset):
+    return await resolver.run(queryset.count)
+
+
+async def alist(queryset):
+    """Evaluates `queryset`, returning its results as a list."""
+    return await resolver.run(list, queryset)
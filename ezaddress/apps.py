@@ -0,0 +1,61 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError
+from django.db.models.signals import post_save, post_delete, pre_save
+
+
+
+class EzAddressConfig(AppConfig):
+    name = 'ezaddress'
+    verbose_name = 'ezAddress'
+    
+    def ready(self):
+        from .autocomplete import update_address_index, \
+             index_created_addresses, update_region_index
+        from .cache import regions, region_cache_enabled, update_regions, \
+             update_addresses
+        from .geocoder import update_geocoder
+        from .models import snapshot_region, update_formatted
+        from .parser import update_parser
+        from .routers import reset_pinning
+        from .signals import addresses_created
+        
+        for model_name in ('Country', 'State'):
+            model = self.get_model(model_name)
+            for signal in (post_save, post_delete):
+                signal.connect(update_regions, sender=model,
+                    dispatch_uid='ezaddress_update_regions_%s' % model_name)
+                signal.connect(update_parser, sender=model,
+                    dispatch_uid='ezaddress_update_parser_%s' % model_name)
+            pre_save.connect(snapshot_region, sender=model,
+                dispatch_uid='ezaddress_snapshot_region_%s' % model_name)
+            post_save.connect(update_region_index, sender=model,
+                dispatch_uid='ezaddress_update_region_index_%s' % model_name)
+            post_save.connect(update_formatted, sender=model,
+                dispatch_uid='ezaddress_update_formatted_%s' % model_name)
+        
+        for signal in (post_save, post_delete):
+            signal.connect(update_geocoder, sender=self.get_model('State'),
+                dispatch_uid='ezaddress_update_geocoder')
+        
+        address = self.get_model('Address')
+        for signal in (post_save, post_delete):
+            signal.connect(update_addresses, sender=address,
+                dispatch_uid='ezaddress_update_addresses')
+        post_save.connect(update_address_index, sender=address,
+            dispatch_uid='ezaddress_update_address_index')
+        addresses_created.connect(index_created_addresses, sender=address,
+            dispatch_uid='ezaddress_index_created_addresses')
+        
+        for signal in (request_started, request_finished):
+            signal.connect(reset_pinning, 
+                dispatch_uid='ezaddress_reset_pinning')
+        
+        if (region_cache_enabled() and 
+            getattr(settings, 'EZADDRESS_REGION_CACHE_WARM', False)):
+            try:
+                regions.warm()
+            except DatabaseError:
+                # tables may not exist yet i.e. before initial migrate
+                pass
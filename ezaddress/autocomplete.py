@@ -0,0 +1,98 @@
+"""
+ezaddress autocompletion index
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import Address, AddressToken, State, _chunked, region_changed
+from .utils import tokenize
+
+
+
+__all__ = ['autocomplete_enabled', 'address_tokens', 'index_addresses',
+           'rebuild_index']
+
+
+# fields whose update calls for an address to be indexed again
+INDEXED_FIELDS = ('raw', 'street', 'town_city', 'postal_code', 'state')
+
+
+def autocomplete_enabled():
+    return getattr(settings, 'EZADDRESS_AUTOCOMPLETE', False)
+
+
+def address_tokens(addr):
+    """Returns the tokens indexed for an address: the normalized words of
+    its components and of its state and country names.
+    """
+    values = [addr.raw, addr.street, addr.town_city, addr.postal_code]
+    if addr.state:
+        values += [addr.state.name, addr.state.country.name]
+    max_length = AddressToken._meta.get_field('token').max_length
+    return sorted(set(token[:max_length] for token in tokenize(*values)))
+
+
+def index_addresses(addrs, replace=True):
+    """Stores the tokens of `addrs`, replacing their existing ones unless
+    `replace` is unset, as for new addresses.
+    """
+    addrs = [addr for addr in addrs if addr.pk]
+    with transaction.atomic():
+        if replace:
+            for chunk in _chunked([addr.pk for addr in addrs]):
+                AddressToken.objects.filter(address_id__in=chunk).delete()
+        AddressToken.objects.bulk_create([
+            AddressToken(token=token, address_id=addr.pk)
+            for addr in addrs for token in address_tokens(addr)])
+
+
+def rebuild_index(queryset=None, batch_size=1000):
+    """Indexes addresses, by default all of them, one batch per transaction
+    and returns the number indexed.
+    """
+    if queryset is None:
+        queryset = Address.objects.all()
+    queryset = queryset.select_related('state__country').order_by('pk')
+    
+    count, last_pk = 0, 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        index_addresses(batch)
+        count += len(batch)
+        last_pk = batch[-1].pk
+    return count
+
+
+def update_address_index(sender, instance, created=False, update_fields=None,
+                         raw=False, **kwargs):
+    """`post_save` handler indexing addresses as they're saved."""
+    if not autocomplete_enabled() or raw:
+        return
+    if update_fields is not None and \
+       not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    index_addresses([instance], replace=not created)
+
+
+def index_created_addresses(sender, addresses, **kwargs):
+    """`addresses_created` handler indexing addresses stored in bulk."""
+    if autocomplete_enabled():
+        index_addresses(addresses, replace=False)
+
+
+def update_region_index(sender, instance, created=False, raw=False,
+                        using=DEFAULT_DB_ALIAS, **kwargs):
+    """`post_save` handler indexing the addresses of a Country or State
+    whose name changed again, as their names are indexed.
+    """
+    if not autocomplete_enabled() or created or raw or \
+       not region_changed(instance):
+        return
+    if isinstance(instance, State):
+        addresses = Address.objects.filter(state=instance)
+    else:
+        addresses = Address.objects.filter(state__country=instance)
+    # once committed, so the index never holds names rolled back
+    transaction.on_commit(lambda: rebuild_index(addresses), using=using)
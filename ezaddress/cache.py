@@ -0,0 +1,408 @@
+"""
+ezaddress caches
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .instrumentation import count
+from .utils import normalize
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    basestring = (str, bytes)
+    unicode = str
+
+
+__all__ = ['RegionCache', 'regions', 'region_cache_enabled', 
+           'AddressMemo', 'addresses', 'address_cache_enabled']
+
+
+def region_cache_enabled():
+    return getattr(settings, 'EZADDRESS_REGION_CACHE', False)
+
+
+def address_cache_enabled():
+    return getattr(settings, 'EZADDRESS_ADDRESS_CACHE', False)
+
+
+class RegionCache(object):
+    """A process-local cache of Country and State objects.
+    
+    Both tables are loaded in full on first use and then kept in memory,
+    keyed by name and code; states by name and country as their names are
+    only unique within a country. Lookups which miss the cache fall through
+    to the database so rows created by other processes are still found; 
+    those missing there too are remembered until a region is created. The 
+    cache is cleared whenever a Country or State is saved or deleted; if the
+    `EZADDRESS_REGION_CACHE_BACKEND` setting names a Django cache, shared
+    counters kept there clear the caches of all other processes as well, 
+    and their missing entries as regions are created.
+    """
+    GENERATION_KEY = 'ezaddress:regions:generation'
+    # bumped as regions are created, dropping the missing entries of caches
+    # and the lookups of parsers
+    CREATIONS_KEY = 'ezaddress:regions:creations'
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._generation = None
+        self._creations = None
+    
+    @property
+    def backend(self):
+        alias = getattr(settings, 'EZADDRESS_REGION_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+    
+    def _load(self):
+        Country = apps.get_model('ezaddress', 'Country')
+        State = apps.get_model('ezaddress', 'State')
+        data = {
+            'country': {}, 'country_code': {},
+            'state': {}, 'state_code': {},
+            # (key, value) pairs of lookups found in neither
+            'missing': set(),
+        }
+        for country in Country.objects.order_by('pk'):
+            data['country'][country.name] = country
+            if country.code:
+                data['country_code'].setdefault(country.code, country)
+        for state in State.objects.select_related('country').order_by('pk'):
+            data['state'][(state.name, state.country_id)] = state
+            if state.code:
+                key = (state.country_id, state.code)
+                data['state_code'].setdefault(key, state)
+        return data
+    
+    def _get_data(self):
+        version = self.version()
+        if version is not None:
+            (generation, creations) = version
+            if generation != self._generation:
+                self._data, self._generation = None, generation
+            if creations != self._creations:
+                data = self._data
+                if data is not None:
+                    data['missing'] = set()
+                self._creations = creations
+        
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+                data = self._data
+        return data
+    
+    def warm(self):
+        self._get_data()
+    
+    def clear(self):
+        with self._lock:
+            self._data = None
+    
+    def invalidate(self):
+        """Clears the cache of this process and of every other process 
+        sharing the configured cache backend.
+        """
+        self.clear()
+        self._incr(self.GENERATION_KEY)
+    
+    def _incr(self, key):
+        backend = self.backend
+        if backend is None:
+            return None
+        try:
+            return backend.incr(key)
+        except ValueError:
+            backend.set(key, 1, None)
+            return 1
+    
+    def version(self):
+        """Returns the (generation, creations) counters shared through the
+        configured cache backend, which change as any process changes or
+        creates regions, or None if there's no backend.
+        """
+        backend = self.backend
+        if backend is None:
+            return None
+        values = backend.get_many([self.GENERATION_KEY, self.CREATIONS_KEY])
+        return (values.get(self.GENERATION_KEY), 
+                values.get(self.CREATIONS_KEY))
+    
+    def created(self, obj):
+        """Adds a Country or State created by this process to the cache and
+        has other processes drop their missing entries.
+        """
+        previous = self._creations
+        self.add(obj)
+        creations = self._incr(self.CREATIONS_KEY)
+        # unless other processes created regions meanwhile, the missing
+        # entries are up to date
+        if creations is not None and creations == (previous or 0) + 1:
+            self._creations = creations
+    
+    def add(self, obj):
+        """Adds a newly created Country or State to the cache."""
+        data = self._data
+        if data is None:
+            return
+        if obj._meta.model_name == 'country':
+            keys = [('country', obj.name)]
+            if obj.code:
+                keys.append(('country_code', obj.code))
+        else:
+            keys = [('state', (obj.name, obj.country_id))]
+            if obj.code:
+                keys.append(('state_code', (obj.country_id, obj.code)))
+        for (key, value) in keys:
+            data[key].setdefault(value, obj)
+            data['missing'].discard((key, value))
+    
+    def _lookup(self, queryset, key, value, **lookup):
+        data = self._get_data()
+        obj = data[key].get(value)
+        if obj is not None:
+            count('cache_hits')
+        elif (key, value) in data['missing']:
+            count('cache_hits')
+            raise queryset.model.DoesNotExist(
+                '%s matching query does not exist.' % 
+                queryset.model._meta.object_name)
+        else:
+            # may have been created by another process since cache was loaded
+            try:
+                obj = queryset.get(**lookup)
+            except queryset.model.DoesNotExist:
+                data['missing'].add((key, value))
+                raise
+            data[key][value] = obj
+        return obj
+    
+    def country(self, name):
+        Country = apps.get_model('ezaddress', 'Country')
+        return self._lookup(Country.objects, 'country', name, name=name)
+    
+    def country_by_code(self, code):
+        Country = apps.get_model('ezaddress', 'Country')
+        return self._lookup(Country.objects, 'country_code', code, code=code)
+    
+    def state(self, name, country):
+        State = apps.get_model('ezaddress', 'State')
+        return self._lookup(State.objects.select_related('country'), 
+                            'state', (name, getattr(country, 'pk', None)),
+                            name=name, country=country)
+    
+    def state_by_code(self, country, code):
+        State = apps.get_model('ezaddress', 'State')
+        return self._lookup(State.objects.select_related('country'),
+                            'state_code', (country.pk, code),
+                            country=country, code=code)
+    
+    def find_countries(self, names):
+        """Returns a name to Country mapping of the cached countries among 
+        `names`; names not in the cache are left out.
+        """
+        cached = self._get_data()['country']
+        found = dict((n, cached[n]) for n in names if n in cached)
+        count('cache_hits', len(found))
+        return found
+    
+    def find_states(self, keys):
+        """Returns a (name, country pk) to State mapping of the cached 
+        states among `keys`.
+        """
+        cached = self._get_data()['state']
+        found = dict((k, cached[k]) for k in keys if k in cached)
+        count('cache_hits', len(found))
+        return found
+
+
+regions = RegionCache()
+
+
+def update_regions(sender, instance, created=False, using=DEFAULT_DB_ALIAS,
+                   **kwargs):
+    """Signal handler keeping the region cache in step with the database.
+    New rows are added once their transaction commits, so rows rolled back
+    are never cached. Changes and deletions clear the cache of this process
+    at once and invalidate those of other processes once committed, as 
+    before then they'd load the rows as they were again.
+    """
+    if created:
+        transaction.on_commit(lambda: regions.created(instance), using=using)
+    else:
+        regions.clear()
+        transaction.on_commit(regions.invalidate, using=using)
+
+
+# address dict entries folded as by fingerprints, and those compared as is
+_FOLDED_ENTRIES = ('raw', 'street', 'town_city', 'postal_code')
+_EXACT_ENTRIES = ('state', 'state_code', 'country', 'country_code')
+
+# fields whose update changes the values an address is resolved from
+_KEYED_FIELDS = ('raw', 'street', 'town_city', 'postal_code', 'state')
+
+
+class AddressMemo(object):
+    """A bounded cache of the addresses which strings and dicts resolved to,
+    keyed by the normalized value and holding the address pk and 
+    fingerprint.
+    
+    Entries are kept in process memory, the least recently used evicted 
+    beyond `EZADDRESS_ADDRESS_CACHE_SIZE` entries, or in the Django cache 
+    named by `EZADDRESS_ADDRESS_CACHE_BACKEND`; either way they expire after
+    `EZADDRESS_ADDRESS_CACHE_TTL` seconds. In-memory entries are dropped
+    when their address is saved or deleted; entries whose address no longer
+    has the stored fingerprint are discarded when read, which covers the 
+    entries of other processes.
+    """
+    KEY_PREFIX = 'ezaddress:address:'
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_pk = {}
+        self.hits = self.misses = self.evictions = 0
+    
+    @property
+    def backend(self):
+        alias = getattr(settings, 'EZADDRESS_ADDRESS_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+    
+    @property
+    def max_size(self):
+        return getattr(settings, 'EZADDRESS_ADDRESS_CACHE_SIZE', 10000)
+    
+    @property
+    def ttl(self):
+        return getattr(settings, 'EZADDRESS_ADDRESS_CACHE_TTL', 3600)
+    
+    def key(self, value):
+        """Returns the cache key of a string or dict address value, or None
+        for values which resolve to no address.
+        """
+        if isinstance(value, basestring):
+            parts = ['s', ' '.join(unicode(value).lower().split())]
+        elif value.get('raw'):
+            parts = ['d'] + [normalize(value.get(name)) 
+                             for name in _FOLDED_ENTRIES]
+            parts += [unicode(value.get(name) or '').strip() 
+                      for name in _EXACT_ENTRIES]
+        else:
+            return None
+        digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return self.KEY_PREFIX + digest
+    
+    def get(self, key, fetch):
+        """Returns the address cached for `key`, read by `fetch` given its pk
+        and fingerprint, or None if there's none or it's stale.
+        """
+        cached = self._get(key)
+        obj = fetch(*cached) if cached is not None else None
+        with self._lock:
+            if obj is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if cached is not None and obj is None:
+            self.delete(key)
+        elif obj is not None:
+            count('cache_hits')
+        return obj
+    
+    def _get(self, key):
+        backend = self.backend
+        if backend is not None:
+            return backend.get(key)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            (pk, fingerprint, expires) = entry
+            if expires is not None and expires <= time.time():
+                self._remove(key)
+                return None
+            # most recently used entries are kept last
+            del self._entries[key]
+            self._entries[key] = entry
+            return (pk, fingerprint)
+    
+    def set(self, key, addr):
+        backend = self.backend
+        if backend is not None:
+            backend.set(key, (addr.pk, addr.fingerprint), self.ttl)
+            return
+        
+        ttl = self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (addr.pk, addr.fingerprint, expires)
+            self._keys_by_pk.setdefault(addr.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_pk.get(entry[0])
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_pk[entry[0]]
+    
+    def delete(self, key):
+        backend = self.backend
+        if backend is not None:
+            backend.delete(key)
+        with self._lock:
+            self._remove(key)
+    
+    def discard(self, pk):
+        """Drops the in-memory entries of the address with `pk`."""
+        with self._lock:
+            for key in list(self._keys_by_pk.get(pk, ())):
+                self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_pk.clear()
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self):
+        """Returns the number of hits, misses and evictions so far, the
+        resulting hit rate and the number of in-memory entries.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries), 'hits': self.hits, 
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+
+addresses = AddressMemo()
+
+
+def update_addresses(sender, instance, update_fields=None, **kwargs):
+    """Signal handler dropping the cached values of saved or deleted 
+    addresses, unless only fields they aren't resolved from were saved.
+    """
+    if update_fields is not None and \
+       not set(update_fields) & set(_KEYED_FIELDS):
+        return
+    addresses.discard(instance.pk)
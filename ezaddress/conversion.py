@@ -0,0 +1,82 @@
+"""
+ezaddress Addressable conversion
+"""
+from django.db import transaction
+
+from .models import Address, AddressValue, _chunked, _state_str, \
+     _to_address_str, to_addresses
+
+
+
+__all__ = ['convert_addressables']
+
+
+# the Addressable fields read for each object, state and country last
+_ADDRESSABLE_VALUES = ('pk', 'addr_raw', 'addr_street', 'addr_town',
+                       'postal_code', 'addr_state_id', 'addr_state__name', 
+                       'addr_state__code', 'addr_state__country__name',
+                       'addr_state__country__code')
+
+
+def _address_value(row):
+    """Returns the `AddressValue` for a row of `_ADDRESSABLE_VALUES`, which
+    keeps the state the row refers to, or None if the row holds no address.
+    """
+    (pk, raw, street, town_city, postal_code, state_id,
+     state, state_code, country, country_code) = row
+    value = {
+        'raw': raw, 'street': street, 'town_city': town_city,
+        'postal_code': postal_code,
+    }
+    if state_id is not None:
+        value.update(state_id=state_id, state=state, state_code=state_code,
+                     country=country, country_code=country_code)
+    if not raw:
+        # as the raw value is required, use the address string instead
+        value['raw'] = _to_address_str(**dict(
+            value, state=_state_str(state, country) if state else None))
+    return AddressValue(**value) if value['raw'] else None
+
+
+def convert_addressables(model, field_name='address', batch_size=1000,
+                         start_after=0, checkpoint=None):
+    """Points the `field_name` AddressField of the objects of the Addressable
+    `model` at the deduplicated addresses held by their `addr_*` fields,
+    walking the table in primary key order one batch per transaction.
+    
+    Objects whose field is already set are skipped, so an interrupted run
+    resumes where it stopped when started again; `start_after` skips the
+    objects up to a primary key as well. `checkpoint` is called with the
+    last primary key of each batch once it is committed.
+    
+    Returns the number of objects converted.
+    """
+    field = model._meta.get_field(field_name)
+    if field.related_model is not Address:
+        raise ValueError('%s.%s is not an address field.' % (
+                         model.__name__, field_name))
+    
+    queryset = model._base_manager.filter(**{field.attname: None})\
+                    .order_by('pk').values_list(*_ADDRESSABLE_VALUES)
+    converted, last_pk = 0, start_after
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            break
+        
+        rows = [(row[0], _address_value(row)) for row in rows]
+        rows_to_convert = [(pk, value) for (pk, value) in rows if value]
+        with transaction.atomic():
+            addrs = to_addresses(value for (pk, value) in rows_to_convert)
+            pks = {}
+            for ((pk, value), addr) in zip(rows_to_convert, addrs):
+                pks.setdefault(addr.pk, []).append(pk)
+            for (addr_pk, obj_pks) in pks.items():
+                for chunk in _chunked(obj_pks):
+                    model._base_manager.filter(pk__in=chunk)\
+                                       .update(**{field.attname: addr_pk})
+        converted += len(rows_to_convert)
+        last_pk = rows[-1][0]
+        if checkpoint is not None:
+            checkpoint(last_pk)
+    return converted
@@ -0,0 +1,272 @@
+"""
+ezaddress deduplication utilities
+"""
+import re
+import zlib
+
+from django.db import transaction
+
+from .models import Address, AddressToken, LOOKUP_BATCH_SIZE, _chunked
+from .utils import normalize
+
+
+
+__all__ = ['backfill_fingerprints', 'merge_addresses', 
+           'find_duplicate_addresses', 'merge_duplicate_addresses']
+
+
+def backfill_fingerprints(batch_size=1000, force=False, dry_run=False,
+                          pks=None):
+    """Computes the fingerprint of addresses which have none, or of all 
+    addresses if `force` is set, walking the table in primary key order one
+    batch per transaction. An address whose fingerprint is already held by
+    another address is merged into that one. `pks` limits the walk to the
+    addresses with those primary keys.
+    
+    Stored fingerprints which are stale, as those of the batch may be with
+    `force` set, are cleared rather than taken for the fingerprint of their
+    address; those of addresses yet to be walked are computed again when
+    reached.
+    
+    Returns the number of addresses fingerprinted and merged.
+    """
+    queryset = Address._base_manager.order_by('pk')
+    if not force:
+        queryset = queryset.filter(fingerprint=None)
+    
+    fingerprinted, merged = 0, 0
+    for batch in _batches(queryset, batch_size, pks):
+        values = dict((addr.pk, addr.get_fingerprint()) for addr in batch)
+        stale = [addr.pk for addr in batch 
+                 if addr.fingerprint not in (None, values[addr.pk])]
+        owners = {}
+        for chunk in _chunked(set(values.values())):
+            for addr in Address._base_manager.filter(fingerprint__in=chunk):
+                if addr.pk in values:
+                    continue
+                elif addr.get_fingerprint() == addr.fingerprint:
+                    owners[addr.fingerprint] = addr.pk
+                else:
+                    stale.append(addr.pk)
+        
+        with transaction.atomic():
+            if not dry_run:
+                for chunk in _chunked(stale):
+                    Address._base_manager.filter(pk__in=chunk)\
+                                         .update(fingerprint=None)
+            for addr in batch:
+                value = values[addr.pk]
+                owner = owners.setdefault(value, addr.pk)
+                if owner != addr.pk:
+                    merged += 1
+                    if not dry_run:
+                        merge_addresses(owner, [addr.pk])
+                elif value != addr.fingerprint:
+                    fingerprinted += 1
+                    if not dry_run:
+                        Address._base_manager.filter(pk=addr.pk)\
+                                             .update(fingerprint=value)
+    return fingerprinted, merged
+
+
+def _batches(queryset, batch_size, pks=None):
+    """Yields the objects of `queryset` in primary key order, `batch_size`
+    at a time, limited to those with `pks` if given. Each batch is read once
+    the previous one is processed.
+    """
+    if pks is not None:
+        size = min(batch_size, LOOKUP_BATCH_SIZE)
+        for chunk in _chunked(sorted(set(pks)), size):
+            batch = list(queryset.filter(pk__in=chunk))
+            if batch:
+                yield batch
+        return
+    
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def _address_relations():
+    """Returns the foreign keys from any model, including AddressFields, 
+    which point to Address. Autocompletion tokens are left out as they're
+    deleted along with their address.
+    """
+    return [rel.field for rel in Address._meta.get_fields(include_hidden=True)
+            if (rel.one_to_many or rel.one_to_one) and rel.auto_created 
+                and not rel.concrete and rel.related_model is not AddressToken]
+
+
+def merge_addresses(survivor, duplicates):
+    """Points every foreign key to the `duplicates` addresses at `survivor`
+    instead, then deletes the duplicates. Both may be addresses or pks.
+    """
+    survivor_pk = getattr(survivor, 'pk', survivor)
+    duplicate_pks = [getattr(d, 'pk', d) for d in duplicates]
+    duplicate_pks = [pk for pk in duplicate_pks if pk != survivor_pk]
+    if not duplicate_pks:
+        return
+    
+    with transaction.atomic():
+        for field in _address_relations():
+            field.model._base_manager\
+                 .filter(**{'%s__in' % field.name: duplicate_pks})\
+                 .update(**{field.name: survivor_pk})
+        Address._base_manager.filter(pk__in=duplicate_pks).delete()
+
+
+# words spelled out before addresses are compared
+ABBREVIATIONS = {
+    'st': 'street', 'str': 'street', 'rd': 'road', 'ave': 'avenue', 
+    'av': 'avenue', 'cres': 'crescent', 'cl': 'close', 'dr': 'drive', 
+    'ln': 'lane', 'blvd': 'boulevard', 'hwy': 'highway', 'est': 'estate',
+}
+
+# signatures are split into bands of rows; addresses sharing any band are
+# compared, which finds most pairs at least 0.55 similar
+MINHASH_BANDS = 12
+MINHASH_ROWS = 4
+
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [((i * 0x9e3779b1 + 1) % _PRIME, (i * 0x85ebca6b + 7) % _PRIME)
+                 for i in range(1, MINHASH_BANDS * MINHASH_ROWS + 1)]
+
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def _numbers(text):
+    """Returns the digit runs of `text`, e.g. house and flat numbers, which
+    addresses must share to be duplicates however similar they are.
+    """
+    return tuple(sorted(_NUMBER_RE.findall(text or '')))
+
+
+def _shingles(text):
+    """Returns the character trigrams of the normalized `text`."""
+    words = [ABBREVIATIONS.get(word, word) for word in normalize(text).split()]
+    if not words:
+        return frozenset()
+    text = ' %s ' % ' '.join(words)
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _minhash(shingles):
+    hashes = [zlib.crc32(s.encode('utf-8')) & 0xffffffff for s in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes)
+            for (a, b) in _PERMUTATIONS]
+
+
+def _similarity(a, b):
+    return float(len(a & b)) / len(a | b)
+
+
+def _find(parents, pk):
+    while parents[pk] != pk:
+        parents[pk] = parents[parents[pk]]
+        pk = parents[pk]
+    return pk
+
+
+def _block_clusters(rows, threshold):
+    """Returns the clusters of near-duplicates among `rows`, addresses of a 
+    single state given as (pk, postal code, shingles) tuples.
+    """
+    buckets = {}
+    for (pk, postal_code, shingles) in rows:
+        signature = _minhash(shingles)
+        for band in range(MINHASH_BANDS):
+            key = (band, tuple(signature[band * MINHASH_ROWS:
+                                         (band + 1) * MINHASH_ROWS]))
+            buckets.setdefault(key, []).append(pk)
+    
+    found = dict((pk, (postal_code, shingles)) 
+                 for (pk, postal_code, shingles) in rows)
+    pairs = set()
+    for pks in buckets.values():
+        for (i, pk1) in enumerate(pks):
+            for pk2 in pks[i + 1:]:
+                pairs.add((pk1, pk2))
+    links = []
+    for (pk1, pk2) in pairs:
+        similarity = _similarity(found[pk1][1], found[pk2][1])
+        if similarity >= threshold:
+            links.append((-similarity, pk1, pk2))
+    
+    # the most similar addresses are linked first; clusters never join 
+    # addresses with distinct postal codes, which tell them apart
+    parents = dict((pk, pk) for pk in found)
+    postal_codes = dict((pk, found[pk][0]) for pk in found)
+    for (similarity, pk1, pk2) in sorted(links):
+        root1, root2 = _find(parents, pk1), _find(parents, pk2)
+        code1, code2 = postal_codes[root1], postal_codes[root2]
+        if root1 == root2 or (code1 and code2 and code1 != code2):
+            continue
+        root1, root2 = min(root1, root2), max(root1, root2)
+        parents[root2] = root1
+        postal_codes[root1] = code1 or code2
+    
+    clusters = {}
+    for pk in sorted(found):
+        clusters.setdefault(_find(parents, pk), []).append(pk)
+    return [pks for pks in clusters.values() if len(pks) > 1]
+
+
+def find_duplicate_addresses(queryset=None, threshold=0.7):
+    """Yields clusters of near-duplicate addresses, by default among all of
+    them, as lists of pks in ascending order.
+    
+    Addresses are compared by the trigrams of their street and town/city, or
+    of their raw value if they have neither, with common abbreviations 
+    spelled out. Only addresses of the same state with the same numbers,
+    such as house and flat numbers, and with the same postal code unless 
+    either has none, are compared and only those sharing a band of their 
+    MinHash signatures, so the work grows with the size of the largest 
+    state rather than the square of the table. Addresses whose trigram sets
+    have a Jaccard similarity of at least `threshold` end up in the same
+    cluster.
+    """
+    if queryset is None:
+        queryset = Address._base_manager.all()
+    state_ids = queryset.order_by().values_list('state_id', flat=True)\
+                        .distinct()
+    for state_id in sorted(state_ids, key=lambda pk: (pk is not None, pk)):
+        # neighbouring buildings or flats differ by their numbers alone, so 
+        # only addresses with the same numbers are compared
+        blocks = {}
+        rows = queryset.filter(state_id=state_id).order_by('pk')\
+                       .values_list('pk', 'postal_code', 'street', 
+                                    'town_city', 'raw')
+        for (pk, postal_code, street, town_city, raw) in rows.iterator():
+            text = '%s %s' % (street, town_city) if street or town_city \
+                   else raw
+            shingles = _shingles(text)
+            if shingles:
+                blocks.setdefault(_numbers(text), []).append(
+                    (pk, normalize(postal_code), shingles))
+        clusters = []
+        for block in blocks.values():
+            clusters.extend(_block_clusters(block, threshold))
+        for cluster in sorted(clusters):
+            yield cluster
+
+
+def merge_duplicate_addresses(queryset=None, threshold=0.7, dry_run=False,
+                              callback=None):
+    """Merges each cluster found by `find_duplicate_addresses` into its 
+    oldest address using `merge_addresses`, calling `callback` with each
+    cluster first. Returns the number of clusters and of addresses merged.
+    """
+    clusters = merged = 0
+    for cluster in find_duplicate_addresses(queryset, threshold):
+        if callback is not None:
+            callback(cluster)
+        clusters += 1
+        merged += len(cluster) - 1
+        if not dry_run:
+            merge_addresses(cluster[0], cluster[1:])
+    return clusters, merged
@@ -0,0 +1,56 @@
+"""
+ezaddress data export
+"""
+import csv
+import json
+
+from .models import Address
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    unicode = str
+
+
+__all__ = ['EXPORT_FORMATS', 'EXPORT_FIELDS', 'dump_addresses']
+
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+# CSV columns; the keys of `Address.as_dict`
+EXPORT_FIELDS = ('raw', 'street', 'town_city', 'postal_code', 'state',
+                 'state_code', 'country', 'country_code', 'latitude',
+                 'longitude', 'altitude', 'gps_error')
+
+
+def _encoded(addr):
+    if sys.version > '3':
+        return addr
+    return dict((k, unicode(v).encode('utf-8')) for (k, v) in addr.items())
+
+
+def dump_addresses(stream, format='jsonl', queryset=None, chunk_size=2000):
+    """Writes addresses, by default all of them, to `stream` as JSON lines
+    or CSV rows shaped as by `Address.as_dict`. Returns the number of
+    addresses written.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError('Unsupported export format: %s' % format)
+    if queryset is None:
+        queryset = Address.objects.all()
+    
+    if format == 'csv':
+        writer = csv.DictWriter(stream, EXPORT_FIELDS, lineterminator='\n')
+        writer.writeheader()
+        write = lambda addr: writer.writerow(_encoded(addr))
+    else:
+        write = lambda addr: stream.write(
+            json.dumps(addr, sort_keys=True) + '\n')
+    
+    count = 0
+    for addr in queryset.iter_dicts(chunk_size):
+        write(addr)
+        count += 1
+    return count
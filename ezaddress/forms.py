@@ -1,7 +1,11 @@
+from django.db import transaction
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 from django import forms
 
-from .models import Address, to_address
+from .instrumentation import instrumented
+from .models import Address, to_address, to_addresses
+from .utils import clean_gps_values
 
 
 
@@ -13,11 +17,25 @@ if sys.version > '3':
     unicode = str
 
 
-__all__ = ['AddressWidget', 'AddressField']
+__all__ = ['AddressWidget', 'AddressField', 'prefetch_addresses',
+           'AddressFormMixin', 'AddressFormSetMixin']
 
 
 class AddressWidget(forms.TextInput):
-    pass
+    """A text input which, given the url of the autocomplete view, exposes
+    it to scripts as its `data-autocomplete-url` attribute.
+    """
+    
+    def __init__(self, attrs=None, autocomplete_url=None):
+        super(AddressWidget, self).__init__(attrs)
+        self.autocomplete_url = autocomplete_url
+    
+    def build_attrs(self, extra_attrs=None, **kwargs):
+        attrs = super(AddressWidget, self).build_attrs(extra_attrs, **kwargs)
+        if self.autocomplete_url:
+            attrs.setdefault('data-autocomplete-url', 
+                             force_text(self.autocomplete_url))
+        return attrs
 
 
 class AddressField(forms.ModelChoiceField):
@@ -26,32 +44,93 @@ class AddressField(forms.ModelChoiceField):
     def __init__(self, *args, **kwargs):
         kwargs['queryset'] = Address.objects.none()
         super(AddressField, self).__init__(*args, **kwargs)
+        # the submitted value and the address resolved for it in advance
+        self._prefetched = None
     
-    def to_python(self, value):
+    def _clean_value(self, value):
         if value is None or value == '':
             return None
         
-        # check for garbage lat/lng/alt entries
-        for field in ['latitude', 'longitude', 'altitude']:
-            if field in value:
-                if value[field]:
-                    try:
-                        value[field] = float(value[field])
-                    except:
-                        raise forms.ValidationError(
-                            _('Invalid value for %(field)s'),
-                            code='invalid', params={'field': field})
-                else:
-                    value[field] = None
-        
-        # also check for garbage gps_error entry
-        field = 'gps_error'
-        if field in value:
+        # check for garbage lat/lng/alt and gps_error entries
+        if isinstance(value, dict):
             try:
-                value[field] = int(value[field])
-            except:
+                clean_gps_values(value)
+            except ValueError as ex:
                 raise forms.ValidationError(
                     _('Invalid value for %(field)s'),
-                    code='invalid', params={'field': field})
+                    code='invalid', params={'field': ex.args[0]})
+        return value
+    
+    @instrumented('form_field')
+    def to_python(self, value):
+        value = self._clean_value(value)
+        if value is None:
+            return None
+        
+        prefetched = self._prefetched
+        if prefetched is not None and prefetched[0] == value:
+            return prefetched[1]
         return to_address(value)
 
+
+def prefetch_addresses(form_list):
+    """Resolves the values submitted to the `AddressField`s of all bound 
+    forms of `form_list` with a single `to_addresses` call, so countries 
+    and states are looked up together and new addresses inserted in bulk,
+    and hands each field its address for when the form is cleaned.
+    
+    Values which fail validation are left for their field to report when 
+    cleaned. Should any value be rejected by `to_addresses`, none are 
+    prefetched and each field resolves its own value instead.
+    """
+    pending = []
+    for form in form_list:
+        if not form.is_bound:
+            continue
+        for (name, field) in form.fields.items():
+            if not isinstance(field, AddressField) or field.disabled:
+                continue
+            value = field.widget.value_from_datadict(
+                form.data, form.files, form.add_prefix(name))
+            try:
+                cleaned = field._clean_value(value)
+            except forms.ValidationError:
+                continue
+            prefetched = field._prefetched
+            if cleaned is not None and \
+               (prefetched is None or prefetched[0] != cleaned):
+                pending.append((field, cleaned))
+    if not pending:
+        return
+    
+    try:
+        with transaction.atomic():
+            results = to_addresses(value for (field, value) in pending)
+    except (forms.ValidationError, ValueError):
+        return
+    for ((field, value), addr) in zip(pending, results):
+        field._prefetched = (value, addr)
+
+
+class AddressFormMixin(object):
+    """Form mixin resolving the values of all the `AddressField`s of a form
+    together with `prefetch_addresses` before the form is cleaned.
+    """
+    
+    def full_clean(self):
+        prefetch_addresses([self])
+        super(AddressFormMixin, self).full_clean()
+
+
+class AddressFormSetMixin(object):
+    """Formset mixin resolving the values of the `AddressField`s of all its 
+    forms together with `prefetch_addresses` before they are cleaned, in
+    place of a `to_address` call per field. Validation errors are still
+    reported on the fields they belong to.
+    """
+    
+    def full_clean(self):
+        if self.is_bound:
+            prefetch_addresses(self.forms)
+        super(AddressFormSetMixin, self).full_clean()
+
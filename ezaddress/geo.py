@@ -0,0 +1,202 @@
+"""
+ezaddress spatial lookups
+"""
+import math
+
+from django.db import models
+from django.db.models import Q
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+__all__ = ['encode_geohash', 'distance', 'GeoQuerySet', 'GeoManager']
+
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 12
+
+# candidate sets at least this large have their distances computed with
+# numpy, when available
+NUMPY_REFINE_THRESHOLD = 500
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# sorts after every geohash character, so that [cell, cell + _CELL_END)
+# spans all the geohashes within a cell
+_CELL_END = '~'
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Returns the geohash of a point, or an empty string for points with
+    no latitude or longitude.
+    """
+    if latitude is None or longitude is None:
+        return ''
+    
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, index, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        index <<= 1
+        if value >= middle:
+            index |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[index])
+            bits, index = 0, 0
+    return ''.join(chars)
+
+
+def _cell_size(precision):
+    """Returns the (height, width) in degrees of geohash cells."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return (180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits)
+
+
+def _covering_cells(south, west, north, east):
+    """Returns the geohash cells, at most four, which together cover a box
+    that doesn't cross the antimeridian. An empty list is returned for
+    boxes too large for any cell short of the whole world.
+    """
+    precision = 0
+    while precision < GEOHASH_PRECISION:
+        height, width = _cell_size(precision + 1)
+        if height < north - south or width < east - west:
+            break
+        precision += 1
+    if precision == 0:
+        return []
+    
+    # cells are at least as large as the box, so the box spans no more than
+    # two cells each way and those holding its corners cover it
+    return sorted(set(encode_geohash(lat, lng, precision)
+                      for lat in (south, north) for lng in (west, east)))
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """Returns the great-circle distance in kilometres between two points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _distances(latitude, longitude, points):
+    """Returns the distances in kilometres from a point to a list of
+    (lat, lng) pairs.
+    """
+    if numpy is None or len(points) < NUMPY_REFINE_THRESHOLD:
+        return [distance(latitude, longitude, lat, lng)
+                for (lat, lng) in points]
+    
+    coords = numpy.radians(numpy.array(points, dtype=float))
+    phi1, lambda1 = math.radians(latitude), math.radians(longitude)
+    a = numpy.sin((coords[:, 0] - phi1) / 2) ** 2 + \
+        math.cos(phi1) * numpy.cos(coords[:, 0]) * \
+        numpy.sin((coords[:, 1] - lambda1) / 2) ** 2
+    values = 2 * EARTH_RADIUS_KM * \
+             numpy.arcsin(numpy.minimum(1.0, numpy.sqrt(a)))
+    return values.tolist()
+
+
+def _radius_bbox(latitude, longitude, radius):
+    """Returns the (south, west, north, east) box enclosing a circle."""
+    d_lat = math.degrees(radius / EARTH_RADIUS_KM)
+    south, north = latitude - d_lat, latitude + d_lat
+    if south <= -90 or north >= 90:
+        # the circle covers a pole, and so every longitude
+        return (max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+    
+    d_lng = math.degrees(radius / (EARTH_RADIUS_KM *
+                                   math.cos(math.radians(latitude))))
+    if d_lng >= 180:
+        return (south, -180.0, north, 180.0)
+    west, east = longitude - d_lng, longitude + d_lng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return (south, west, north, east)
+
+
+class GeoQuerySet(models.QuerySet):
+    """A QuerySet for models with `latitude`, `longitude` and `geohash`
+    fields, such as `Address` and `GPSLocatable` models, which adds spatial
+    lookups that need no spatial database.
+    
+    Candidates are found using the lat/lng index and geohash prefixes, then
+    distances are computed exactly in Python.
+    """
+    
+    def within_bbox(self, south, west, north, east):
+        """Filters objects to those within a bounding box. Boxes crossing
+        the antimeridian have a `west` greater than `east`.
+        """
+        if west <= east:
+            boxes = [(west, east)]
+        else:
+            boxes = [(west, 180.0), (-180.0, east)]
+        
+        lng_q, cell_q = Q(), Q()
+        for (box_west, box_east) in boxes:
+            lng_q |= Q(longitude__range=(box_west, box_east))
+            cells = _covering_cells(south, box_west, north, box_east)
+            if not cells:
+                cell_q = None
+            elif cell_q is not None:
+                for cell in cells:
+                    cell_q |= Q(geohash__gte=cell,
+                                geohash__lt=cell + _CELL_END)
+        
+        query = self.filter(lng_q, latitude__range=(south, north))
+        if cell_q is not None:
+            query = query.filter(cell_q)
+        return query
+    
+    def within_radius(self, latitude, longitude, radius):
+        """Returns a list of the objects within `radius` kilometres of a
+        point, nearest first, each with its `distance` from it set.
+        """
+        candidates = list(self.within_bbox(
+            *_radius_bbox(latitude, longitude, radius)))
+        distances = _distances(latitude, longitude,
+                               [(obj.latitude, obj.longitude)
+                                for obj in candidates])
+        
+        found = []
+        for (obj, value) in zip(candidates, distances):
+            if value <= radius:
+                obj.distance = value
+                found.append(obj)
+        found.sort(key=lambda obj: obj.distance)
+        return found
+    
+    def nearest(self, latitude, longitude, k=1, radius=1.0):
+        """Returns a list of the `k` objects nearest to a point, nearest
+        first, each with its `distance` from it set. The search starts
+        within `radius` kilometres and widens until enough are found.
+        """
+        limit = math.pi * EARTH_RADIUS_KM
+        while True:
+            bbox = _radius_bbox(latitude, longitude, radius)
+            if radius >= limit or self.within_bbox(*bbox).count() >= k:
+                found = self.within_radius(latitude, longitude, radius)
+                if radius >= limit or len(found) >= k:
+                    return found[:k]
+            radius *= 4
+
+
+class GeoManager(models.Manager.from_queryset(GeoQuerySet)):
+    pass
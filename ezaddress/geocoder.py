@@ -0,0 +1,275 @@
+"""
+ezaddress offline reverse geocoding
+"""
+import math
+import threading
+
+from django.apps import apps
+from django.db import transaction
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .autocomplete import autocomplete_enabled, rebuild_index
+from .dedupe import backfill_fingerprints
+from .geo import EARTH_RADIUS_KM
+from .models import Address, _chunked, _formatted_expr
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    unicode = str
+
+
+__all__ = ['StateIndex', 'ReverseGeocoder', 'geocoder', 'reverse_geocode',
+           'reverse_geocode_many', 'backfill_states']
+
+
+# points looked up with numpy at once, bounding the distance matrix held
+NUMPY_BATCH_SIZE = 1000
+
+
+def _unit_vector(latitude, longitude):
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam),
+            math.sin(phi))
+
+
+def _chord(distance):
+    """Returns the straight line length, on the unit sphere, of an arc of
+    `distance` kilometres on the surface of the earth.
+    """
+    angle = min(distance / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+class StateIndex(object):
+    """A KD-tree of the reference points of states, answering which state a
+    point is nearest to.
+    
+    Points are indexed as vectors on the unit sphere, whose straight line
+    distances order them as great-circle distances do, so lookups are not
+    thrown off near the poles or the antimeridian.
+    """
+    
+    def __init__(self, states):
+        self.states = [state for state in states
+                       if state.latitude is not None and
+                          state.longitude is not None]
+        self.vectors = [_unit_vector(state.latitude, state.longitude)
+                        for state in self.states]
+        self._tree = self._build(list(range(len(self.states))), 0)
+    
+    def __len__(self):
+        return len(self.states)
+    
+    def _build(self, indexes, depth):
+        # nodes are (index, axis, left, right) tuples
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.vectors[i][axis])
+        middle = len(indexes) // 2
+        return (indexes[middle], axis,
+                self._build(indexes[:middle], depth + 1),
+                self._build(indexes[middle + 1:], depth + 1))
+    
+    def _nearest(self, vector):
+        """Returns the index of the state nearest to `vector` and the square
+        of their distance.
+        """
+        best = [None, float('inf')]
+        
+        def search(node):
+            if node is None:
+                return
+            (index, axis, left, right) = node
+            point = self.vectors[index]
+            distance = (point[0] - vector[0]) ** 2 + \
+                       (point[1] - vector[1]) ** 2 + \
+                       (point[2] - vector[2]) ** 2
+            if distance < best[1]:
+                best[:] = [index, distance]
+            
+            offset = vector[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            search(near)
+            # the far side may only hold a nearer point if the splitting 
+            # plane is nearer than the best point so far
+            if offset * offset < best[1]:
+                search(far)
+        
+        search(self._tree)
+        return best[0], best[1]
+    
+    def nearest(self, latitude, longitude, max_distance=None):
+        """Returns the state whose reference point is nearest to a point,
+        or None if there's none within `max_distance` kilometres.
+        """
+        if not self.states:
+            return None
+        index, distance = self._nearest(_unit_vector(latitude, longitude))
+        if max_distance is not None and \
+           distance > _chord(max_distance) ** 2:
+            return None
+        return self.states[index]
+    
+    def nearest_many(self, points, max_distance=None):
+        """Returns the nearest state, or None, for each (latitude, longitude)
+        pair of `points`, comparing the points with every state at once
+        when numpy is available.
+        """
+        points = list(points)
+        if numpy is None or not self.states:
+            return [self.nearest(lat, lng, max_distance)
+                    for (lat, lng) in points]
+        
+        limit = _chord(max_distance) ** 2 if max_distance is not None \
+                else None
+        vectors = numpy.array(self.vectors)
+        results = []
+        for start in range(0, len(points), NUMPY_BATCH_SIZE):
+            coords = numpy.radians(numpy.array(
+                points[start:start + NUMPY_BATCH_SIZE], dtype=float))
+            cos_phi = numpy.cos(coords[:, 0])
+            batch = numpy.column_stack((
+                cos_phi * numpy.cos(coords[:, 1]),
+                cos_phi * numpy.sin(coords[:, 1]),
+                numpy.sin(coords[:, 0])))
+            # |a - b|^2 = 2 - 2 a.b for unit vectors
+            distances = 2 - 2 * batch.dot(vectors.T)
+            nearest = distances.argmin(axis=1)
+            for (row, index) in enumerate(nearest):
+                if limit is not None and distances[row, index] > limit:
+                    results.append(None)
+                else:
+                    results.append(self.states[index])
+        return results
+
+
+class ReverseGeocoder(object):
+    """Finds the state of points using a `StateIndex` of the stored states
+    which have a reference point, built on first use.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+    
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    State = apps.get_model('ezaddress', 'State')
+                    self._index = StateIndex(
+                        State.objects.exclude(latitude=None)
+                                     .exclude(longitude=None)
+                                     .select_related('country')
+                                     .order_by('pk'))
+                index = self._index
+        return index
+    
+    def clear(self):
+        """Drops the index, which is built again when next needed."""
+        with self._lock:
+            self._index = None
+    
+    def reverse_geocode(self, latitude, longitude, max_distance=None):
+        return self._get_index().nearest(latitude, longitude, max_distance)
+    
+    def reverse_geocode_many(self, points, max_distance=None):
+        return self._get_index().nearest_many(points, max_distance)
+
+
+geocoder = ReverseGeocoder()
+
+
+def reverse_geocode(latitude, longitude, max_distance=None):
+    """Returns the state whose reference point is nearest to a point, or
+    None if there's none within `max_distance` kilometres; see
+    `StateIndex`.
+    """
+    return geocoder.reverse_geocode(latitude, longitude, max_distance)
+
+
+def reverse_geocode_many(points, max_distance=None):
+    """Returns the state, or None, of each (latitude, longitude) pair of
+    `points`; see `reverse_geocode`.
+    """
+    return geocoder.reverse_geocode_many(points, max_distance)
+
+
+def update_geocoder(sender, instance, **kwargs):
+    """Signal handler dropping the index of the default geocoder as states
+    change.
+    """
+    geocoder.clear()
+
+
+def backfill_states(batch_size=1000, max_distance=None, dry_run=False,
+                    progress=None):
+    """Sets the state of addresses which have a latitude and longitude but
+    no state to the one found by `reverse_geocode_many`, walking the table
+    in primary key order one batch per transaction.
+    
+    Addresses with neither a street nor a town/city keep being shown by 
+    their raw value. As the state is part of the fingerprint of the others,
+    those given a state are fingerprinted again by `backfill_fingerprints`
+    once all batches are done, merging them into any address they now 
+    duplicate. `progress` is called with the number of addresses examined 
+    and given a state so far after each batch.
+    
+    Returns the number of addresses examined and given a state.
+    """
+    queryset = Address._base_manager.filter(state=None)\
+                      .exclude(latitude=None).exclude(longitude=None)\
+                      .order_by('pk')
+    stats = {'examined': 0, 'updated': 0}
+    updated, last_pk = [], 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).values_list(
+            'pk', 'latitude', 'longitude')[:batch_size])
+        if not rows:
+            break
+        
+        states = reverse_geocode_many(
+            [(lat, lng) for (pk, lat, lng) in rows],
+            max_distance)
+        groups = {}
+        for ((pk, lat, lng), state) in zip(rows, states):
+            if state is not None:
+                groups.setdefault(state.pk, (state, []))[1].append(pk)
+        
+        stats['examined'] += len(rows)
+        stats['updated'] += sum(len(pks) for (state, pks) in groups.values())
+        if not dry_run and groups:
+            with transaction.atomic():
+                for (state, pks) in groups.values():
+                    _set_state(state, pks)
+            for (state, pks) in groups.values():
+                updated.extend(pks)
+                if autocomplete_enabled():
+                    for chunk in _chunked(pks):
+                        rebuild_index(Address.objects.filter(pk__in=chunk))
+        last_pk = rows[-1][0]
+        if progress is not None:
+            progress(stats)
+    if updated:
+        backfill_fingerprints(batch_size, pks=updated)
+    return stats
+
+
+def _set_state(state, pks):
+    """Sets the state of the addresses with `pks`, clearing their 
+    fingerprint.
+    """
+    formatted = _formatted_expr('raw', 'street', 'town_city', 'postal_code',
+                                unicode(state))
+    for chunk in _chunked(pks):
+        Address._base_manager.filter(pk__in=chunk).update(
+            state=state, formatted=formatted, fingerprint=None)
@@ -0,0 +1,202 @@
+"""
+ezaddress data import
+"""
+import csv
+import json
+from collections import deque
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+from .export import EXPORT_FORMATS
+from .models import Address, Country, State, to_addresses
+from .utils import clean_gps_values
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    basestring = (str, bytes)
+    unicode = str
+
+
+__all__ = ['IMPORT_FORMATS', 'read_addresses', 'clean_row',
+           'import_addresses']
+
+
+# files written by `dump_addresses` can be imported again
+IMPORT_FORMATS = EXPORT_FORMATS
+
+# entries of address dicts and the fields they're stored in, which bound
+# their length
+_STORED_ENTRIES = (
+    ('raw', Address, 'raw'), ('street', Address, 'street'),
+    ('town_city', Address, 'town_city'), 
+    ('postal_code', Address, 'postal_code'), ('state', State, 'name'),
+    ('country', Country, 'name'),
+)
+
+
+def read_addresses(stream, format='jsonl'):
+    """Yields the rows of a CSV or JSON lines stream, leaving JSON lines to
+    be parsed by `clean_row`. Blank CSV cells are left out of the rows as
+    CSV can't tell them from missing values.
+    """
+    if format not in IMPORT_FORMATS:
+        raise ValueError('Unsupported import format: %s' % format)
+    
+    if format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield line.strip()
+        return
+    
+    for row in csv.DictReader(stream):
+        if sys.version < '3':
+            row = dict((k.decode('utf-8'), (v or '').decode('utf-8'))
+                       for (k, v) in row.items() if k)
+        yield dict((k, v) for (k, v) in row.items() if k and v)
+
+
+def clean_row(row):
+    """Returns the address dict for a row read by `read_addresses`, its GPS
+    entries coerced as by `forms.AddressField`, and None; or else None and
+    the reason the row is rejected.
+    """
+    value = row
+    if isinstance(row, basestring):
+        try:
+            value = json.loads(row)
+        except ValueError:
+            return None, 'Invalid JSON'
+    if not isinstance(value, dict):
+        return None, 'Not an address object'
+    if not value.get('raw'):
+        return None, 'Missing raw value'
+    for (entry, model, field_name) in _STORED_ENTRIES:
+        max_length = model._meta.get_field(field_name).max_length
+        if isinstance(value.get(entry), basestring) and \
+           len(value[entry]) > max_length:
+            return None, 'Value too long for %s' % entry
+    
+    try:
+        clean_gps_values(value)
+    except ValueError as ex:
+        return None, 'Invalid value for %s' % ex.args[0]
+    return value, None
+
+
+def _clean_rows(rows):
+    # run by the worker processes
+    return [clean_row(row) for row in rows]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _cleaned_chunks(rows, workers, chunk_size):
+    """Yields each chunk of `rows` along with the result of `clean_row` for
+    each of its rows, cleaning chunks in `workers` processes ahead of those
+    being stored when `workers` is above one.
+    """
+    chunks = _chunks(rows, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, _clean_rows(chunk)
+        return
+    
+    if ProcessPoolExecutor is None:
+        raise ValueError('Importing with several workers requires the '
+                         'concurrent.futures module.')
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(_clean_rows, chunk)))
+            # bounds the rows read ahead of those stored
+            if len(pending) > workers * 2:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+def _error_message(ex):
+    if isinstance(ex, ValidationError):
+        return '; '.join(unicode(message) for message in ex.messages)
+    return unicode(ex)
+
+
+def _store(items, reject):
+    """Resolves the values of `items`, (row, value) pairs, in one transaction
+    and returns the number stored. Should any value be rejected, by 
+    validation or the database, values are resolved one at a time instead
+    to single it out.
+    """
+    try:
+        with transaction.atomic():
+            to_addresses(value for (row, value) in items)
+        return len(items)
+    except (ValidationError, ValueError, DatabaseError):
+        pass
+    
+    stored = 0
+    for (row, value) in items:
+        try:
+            with transaction.atomic():
+                to_addresses([value])
+            stored += 1
+        except (ValidationError, ValueError, DatabaseError) as ex:
+            reject(row, _error_message(ex))
+    return stored
+
+
+def import_addresses(rows, workers=1, chunk_size=1000, dry_run=False,
+                     reject=None, progress=None):
+    """Resolves the rows yielded by `read_addresses` into addresses with
+    `to_addresses`, one chunk per transaction.
+    
+    Rows are validated, and their GPS values coerced, by `clean_row` in
+    `workers` processes while the database is written. `reject` is called
+    with each invalid row and the reason it's rejected and `progress` with
+    the stats after each chunk. With `dry_run` set rows are only validated.
+    
+    Returns the number of rows read, imported and rejected as a dict.
+    """
+    stats = {'rows': 0, 'imported': 0, 'rejected': 0}
+    
+    def rejected(row, error):
+        stats['rejected'] += 1
+        if reject is not None:
+            reject(row, error)
+    
+    for (chunk, results) in _cleaned_chunks(rows, workers, chunk_size):
+        items = []
+        for (row, (value, error)) in zip(chunk, results):
+            if error is None:
+                items.append((row, value))
+            else:
+                rejected(row, error)
+        
+        stats['rows'] += len(chunk)
+        if dry_run:
+            stats['imported'] += len(items)
+        elif items:
+            stats['imported'] += _store(items, rejected)
+        if progress is not None:
+            progress(stats)
+    return stats
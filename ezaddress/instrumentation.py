@@ -0,0 +1,163 @@
+"""
+ezaddress instrumentation
+"""
+import functools
+import logging
+import threading
+import timeit
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .signals import address_resolved
+
+
+
+__all__ = ['instrumented', 'StatsReporter', 'log_measurement']
+
+
+logger = logging.getLogger('ezaddress')
+
+_local = threading.local()
+_callbacks_cache = {}
+
+
+def _callbacks():
+    """Returns the callbacks named by the `EZADDRESS_INSTRUMENTATION`
+    setting, a dotted path or list of dotted paths.
+    """
+    paths = getattr(settings, 'EZADDRESS_INSTRUMENTATION', None)
+    if not paths:
+        return ()
+    if not isinstance(paths, (list, tuple)):
+        paths = (paths,)
+    
+    key = tuple(paths)
+    callbacks = _callbacks_cache.get(key)
+    if callbacks is None:
+        callbacks = _callbacks_cache[key] = \
+            tuple(import_string(path) for path in paths)
+    return callbacks
+
+
+def _query_count(log, marker):
+    """Returns the number of queries logged after `marker`. Counting back
+    to the marker, rather than comparing lengths, stays accurate once the
+    size limit of the log is reached.
+    """
+    count = 0
+    for query in reversed(log):
+        if query is marker:
+            break
+        count += 1
+    return count
+
+
+def count(name, value=1):
+    """Adds to a count of the measurement under way in this thread, if any.
+    """
+    measurement = getattr(_local, 'measurement', None)
+    if measurement is not None:
+        measurement[name] += value
+
+
+def _on_resolved(sender, address, outcome, **kwargs):
+    measurement = getattr(_local, 'measurement', None)
+    if measurement is not None:
+        measurement['outcomes'][outcome] += 1
+        if not (address.street or address.town_city):
+            measurement['raw'] += 1
+
+address_resolved.connect(_on_resolved, 
+                         dispatch_uid='ezaddress.instrumentation')
+
+
+def instrumented(operation):
+    """Decorates an address resolution function so each call is measured
+    and reported to the callbacks configured in the
+    `EZADDRESS_INSTRUMENTATION` setting, as a dict of:
+      
+      operation:  name of the function called
+      duration:   wall time of the call, in seconds
+      queries:    number of SQL queries issued
+      outcomes:   count of addresses resolved by outcome; see `signals`
+      raw:        number of values resolved to raw-only addresses
+      cache_hits: number of region lookups served by the region cache
+    
+    Calls made while another is measured in the same thread are counted as
+    part of that one. Without callbacks configured calls aren't measured.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            callbacks = _callbacks()
+            if not callbacks or getattr(_local, 'measurement', None) \
+               is not None:
+                return func(*args, **kwargs)
+            
+            measurement = {'outcomes': Counter(), 'raw': 0, 'cache_hits': 0}
+            logs = []
+            for conn in connections.all():
+                log = conn.queries_log
+                logs.append((conn, conn.force_debug_cursor, log,
+                             log[-1] if log else None))
+                conn.force_debug_cursor = True
+            
+            _local.measurement = measurement
+            start = timeit.default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = timeit.default_timer() - start
+                _local.measurement = None
+                queries = 0
+                for (conn, force_debug_cursor, log, marker) in logs:
+                    conn.force_debug_cursor = force_debug_cursor
+                    queries += _query_count(log, marker)
+                
+                report = dict(measurement, operation=operation,
+                              duration=duration, queries=queries,
+                              outcomes=dict(measurement['outcomes']))
+                for callback in callbacks:
+                    try:
+                        callback(report)
+                    except Exception:
+                        logger.exception('ezaddress instrumentation '
+                                         'callback failed')
+        return wrapper
+    return decorator
+
+
+def log_measurement(report):
+    """A callback which logs measurements to the `ezaddress` logger."""
+    logger.debug('%(operation)s took %(duration).6fs and %(queries)d '
+                 'queries', report, extra={'measurement': report})
+
+
+class StatsReporter(object):
+    """A callback reporting measurements to a statsd style client, one
+    providing `timing(name, ms)` and `incr(name, count)`. To use it, create
+    one in a module of your project and name it in the settings:
+        
+        # myproject/metrics.py
+        ezaddress_reporter = StatsReporter(statsd_client)
+        
+        # settings.py
+        EZADDRESS_INSTRUMENTATION = 'myproject.metrics.ezaddress_reporter'
+    """
+    
+    def __init__(self, client, prefix='ezaddress'):
+        self.client = client
+        self.prefix = prefix
+    
+    def __call__(self, report):
+        name = '%s.%s' % (self.prefix, report['operation'])
+        self.client.timing(name + '.time', report['duration'] * 1000)
+        self.client.incr(name + '.queries', report['queries'])
+        for (outcome, value) in report['outcomes'].items():
+            self.client.incr('%s.%s' % (name, outcome), value)
+        for key in ('raw', 'cache_hits'):
+            if report[key]:
+                self.client.incr('%s.%s' % (name, key), report[key])
@@ -0,0 +1,3 @@
+"""
+ezaddress.management package
+"""
\ No newline at end of file
@@ -0,0 +1,3 @@
+"""
+ezaddress.management.commands package
+"""
\ No newline at end of file
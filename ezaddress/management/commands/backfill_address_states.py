@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from ezaddress.geocoder import backfill_states
+
+
+
+class Command(BaseCommand):
+    help = ('Sets the state of addresses with a latitude and longitude but '
+            'no state to the state whose reference point is nearest.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of addresses processed per transaction.')
+        parser.add_argument('--max-distance', type=float, default=None,
+            help='Distance in kilometres beyond which states are not '
+                 'considered.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+            help='Report changes without making them.')
+    
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write('Examined %d addresses...' % 
+                                  stats['examined'])
+        
+        stats = backfill_states(options['batch_size'], 
+                                options['max_distance'], 
+                                options['dry_run'], progress)
+        message = 'set the state of %(updated)d of %(examined)d ' \
+                  'addresses.' % stats
+        if options['dry_run']:
+            self.stdout.write('Would have %s' % message)
+        else:
+            self.stdout.write(message.capitalize())
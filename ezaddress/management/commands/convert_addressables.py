@@ -0,0 +1,40 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ezaddress.conversion import convert_addressables
+
+
+
+class Command(BaseCommand):
+    help = ('Points the AddressField of the objects of an Addressable model '
+            'at deduplicated addresses holding their addr_* fields.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('model',
+            help='The Addressable model, as app_label.ModelName.')
+        parser.add_argument('--field', default='address',
+            help='Name of the AddressField to set.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of objects converted per transaction.')
+        parser.add_argument('--start-after', type=int, default=0,
+            help='Primary key of the last object converted by a previous '
+                 'run, as reported by its checkpoints.')
+    
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as ex:
+            raise CommandError(str(ex))
+        
+        def checkpoint(last_pk):
+            if options['verbosity'] > 0:
+                self.stdout.write('Converted objects up to pk %d...' % 
+                                  last_pk)
+        
+        try:
+            count = convert_addressables(
+                model, options['field'], options['batch_size'],
+                options['start_after'], checkpoint)
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        self.stdout.write('Converted %d objects.' % count)
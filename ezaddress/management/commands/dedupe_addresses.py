@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ezaddress.dedupe import backfill_fingerprints
+
+
+
+class Command(BaseCommand):
+    help = ('Computes missing address fingerprints, merging addresses whose '
+            'fingerprint is already held by another into that address.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of addresses processed per transaction.')
+        parser.add_argument('--force', action='store_true', default=False,
+            help='Recompute the fingerprint of every address.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+            help='Report changes without making them.')
+    
+    def handle(self, *args, **options):
+        fingerprinted, merged = backfill_fingerprints(
+            options['batch_size'], options['force'], options['dry_run'])
+        message = 'fingerprinted %d addresses and merged %d duplicates.' % (
+                  fingerprinted, merged)
+        if options['dry_run']:
+            self.stdout.write('Would have %s' % message)
+        else:
+            self.stdout.write(message.capitalize())
@@ -0,0 +1,43 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ezaddress.export import EXPORT_FORMATS, dump_addresses
+
+
+
+class Command(BaseCommand):
+    help = ('Writes every address, as returned by Address.as_dict, as JSON '
+            'lines or CSV.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+            help='File to write; by default addresses are written to '
+                 'standard output.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS,
+            help='Output format; by default guessed from the file '
+                 'extension, else jsonl.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+            help='Number of addresses read per query.')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format']
+        if format is None:
+            format = 'csv' if path and path.endswith('.csv') else 'jsonl'
+        
+        if not path:
+            dump_addresses(self.stdout, format,
+                           chunk_size=options['chunk_size'])
+            return
+        
+        if sys.version > '3':
+            stream = io.open(path, 'w', encoding='utf-8', newline='')
+        else:
+            stream = open(path, 'wb')
+        with stream:
+            count = dump_addresses(stream, format,
+                                   chunk_size=options['chunk_size'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Wrote %d addresses to %s.' % (count, path))
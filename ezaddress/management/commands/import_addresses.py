@@ -0,0 +1,83 @@
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ezaddress.importer import IMPORT_FORMATS, import_addresses, \
+     read_addresses
+
+
+
+class Command(BaseCommand):
+    help = ('Resolves the addresses of a CSV or JSON lines file, as written '
+            'by dump_addresses, into addresses.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+            help='CSV or JSON lines file with address dict entries.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+            help='Input format; by default guessed from the file '
+                 'extension, else jsonl.')
+        parser.add_argument('--workers', type=int, default=1,
+            help='Number of processes validating rows.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help='Number of rows imported per transaction.')
+        parser.add_argument('--rejects',
+            help='File to write the rejected rows to, as JSON lines with '
+                 'row and error entries.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+            help='Validate rows without importing them.')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format']
+        if format is None:
+            format = 'csv' if path.endswith('.csv') else 'jsonl'
+        
+        rejects = None
+        if options['rejects']:
+            rejects = io.open(options['rejects'], 'w', encoding='utf-8')
+        
+        def reject(row, error):
+            if rejects is not None:
+                line = json.dumps({'row': row, 'error': error},
+                                  sort_keys=True)
+                rejects.write(line if sys.version > '3' else
+                              line.decode('utf-8'))
+                rejects.write(u'\n')
+        
+        started = time.time()
+        
+        def rate(count):
+            return count / max(time.time() - started, 0.001)
+        
+        def progress(stats):
+            if options['verbosity'] > 0:
+                self.stdout.write('Processed %d rows (%d rows/s)...' % (
+                                  stats['rows'], rate(stats['rows'])))
+        
+        try:
+            if sys.version > '3':
+                stream = io.open(path, encoding='utf-8', newline='')
+            else:
+                stream = open(path, 'rb')
+            with stream:
+                stats = import_addresses(
+                    read_addresses(stream, format), options['workers'],
+                    options['chunk_size'], options['dry_run'], reject,
+                    progress)
+        except (IOError, ValueError) as ex:
+            raise CommandError(str(ex))
+        finally:
+            if rejects is not None:
+                rejects.close()
+        
+        stats['rate'] = rate(stats['rows'])
+        message = ('%(imported)d rows and rejected %(rejected)d '
+                   '(%(rate)d rows/s).' % stats)
+        if options['dry_run']:
+            self.stdout.write('Would have imported %s' % message)
+        else:
+            self.stdout.write('Imported %s' % message)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ezaddress.regions import DEFAULT_REGIONS_FILE, read_regions, \
+     load_regions
+
+
+
+class Command(BaseCommand):
+    help = ('Creates or updates countries and states from a regions file, '
+            'by default the bundled ISO 3166 countries and subdivisions.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_REGIONS_FILE,
+            help='CSV, JSON or JSON lines file with country_code, country, '
+                 'state_code and state entries.')
+        parser.add_argument('--batch-size', type=int, default=500,
+            help='Number of rows loaded per transaction.')
+    
+    def handle(self, *args, **options):
+        def progress(count):
+            if options['verbosity'] > 0:
+                self.stdout.write('Loaded %d rows...' % count)
+        
+        try:
+            stats = load_regions(read_regions(options['path']), 
+                                 options['batch_size'], progress)
+        except (IOError, ValueError) as ex:
+            raise CommandError(str(ex))
+        
+        if options['verbosity'] > 0:
+            self.stdout.write(
+                'Loaded %(rows)d rows: %(countries_created)d countries '
+                'created, %(countries_updated)d updated; %(states_created)d '
+                'states created, %(states_updated)d updated.' % stats)
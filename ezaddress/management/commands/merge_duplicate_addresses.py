@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from ezaddress.dedupe import merge_duplicate_addresses
+
+
+
+class Command(BaseCommand):
+    help = ('Finds near-duplicate addresses, such as spelling variants, and '
+            'reports them or, with --merge, merges each group into its '
+            'oldest address.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.7,
+            help='Similarity, between 0 and 1, from which addresses are '
+                 'considered duplicates.')
+        parser.add_argument('--merge', action='store_true', default=False,
+            help='Merge the duplicates found, pointing foreign keys at the '
+                 'oldest address and deleting the others; by default they '
+                 'are only reported.')
+    
+    def handle(self, *args, **options):
+        def report(cluster):
+            if options['verbosity'] > 1:
+                self.stdout.write('%d <- %s' % (
+                    cluster[0], ', '.join(str(pk) for pk in cluster[1:])))
+        
+        dry_run = not options['merge']
+        clusters, merged = merge_duplicate_addresses(
+            threshold=options['threshold'], dry_run=dry_run, callback=report)
+        message = 'merged %d addresses into %d others.' % (merged, clusters)
+        if dry_run:
+            self.stdout.write('Would have %s' % message)
+        else:
+            self.stdout.write(message.capitalize())
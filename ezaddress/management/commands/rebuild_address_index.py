@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ezaddress.autocomplete import rebuild_index
+
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the autocompletion index of every address.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of addresses indexed per transaction.')
+    
+    def handle(self, *args, **options):
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write('Indexed %d addresses.' % count)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def clear_duplicate_fingerprints(apps, schema_editor):
+    # keep the fingerprint of the oldest address in a set of duplicates only;
+    # `dedupe_addresses` merges the others once they're fingerprinted again
+    Address = apps.get_model('ezaddress', 'Address')
+    addresses = Address.objects.using(schema_editor.connection.alias)
+    addresses.filter(fingerprint='').update(fingerprint=None)
+    groups = addresses.exclude(fingerprint=None)\
+                    .values('fingerprint')\
+                    .annotate(count=Count('pk'), survivor=Min('pk'))\
+                    .filter(count__gt=1).order_by()
+    for group in list(groups):
+        addresses.filter(fingerprint=group['fingerprint'])\
+                 .exclude(pk=group['survivor'])\
+                 .update(fingerprint=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ezaddress', '0003_address_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='address',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40, null=True),
+        ),
+        migrations.RunPython(clear_duplicate_fingerprints, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='address',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# rows read and updated at once; each needs three query parameters
+BATCH_SIZE = 200
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=12):
+    # a copy of ezaddress.geo.encode_geohash as of this migration
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, index, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        index <<= 1
+        if value >= middle:
+            index |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[index])
+            bits, index = 0, 0
+    return ''.join(chars)
+
+
+def set_geohashes(apps, schema_editor):
+    Address = apps.get_model('ezaddress', 'Address')
+    addresses = Address.objects.using(schema_editor.connection.alias)
+    rows = addresses.exclude(latitude=None).exclude(longitude=None)\
+                    .values_list('pk', 'latitude', 'longitude')\
+                    .order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        geohashes = [models.When(pk=pk, then=models.Value(
+                         encode_geohash(latitude, longitude)))
+                     for (pk, latitude, longitude) in batch]
+        pks = [pk for (pk, latitude, longitude) in batch]
+        addresses.filter(pk__in=pks).update(geohash=models.Case(
+            *geohashes, output_field=models.CharField()))
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ezaddress', '0004_unique_address_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AlterIndexTogether(
+            name='address',
+            index_together=set([('latitude', 'longitude')]),
+        ),
+        migrations.RunPython(set_geohashes, migrations.RunPython.noop),
+    ]
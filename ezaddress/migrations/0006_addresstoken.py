@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ezaddress', '0005_address_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=40)),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ezaddress.Address')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='addresstoken',
+            index_together=set([('token', 'address')]),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+
+# copies of the helpers of ezaddress.models as of this migration
+
+def _state_str(name, country_name):
+    value = name
+    if value:
+        value += ', '
+    value += country_name
+    return value
+
+
+def _unless_blank(field, then):
+    return models.Case(models.When(**{field: '', 'then': Value('')}),
+                       default=then, output_field=models.CharField())
+
+
+def _formatted_expr(raw, street, town_city, postal_code, state_str):
+    sep = Value(', ')
+    town_part = _unless_blank(town_city, Concat(
+        _unless_blank(street, sep), F(town_city),
+        _unless_blank(postal_code, Concat(Value(' '), F(postal_code))),
+    ))
+    prefix = Concat(F(street), town_part, models.Case(
+        models.When(**{street: '', town_city: '', 'then': Value('')}),
+        default=sep, output_field=models.CharField()))
+    return models.Case(
+        models.When(models.Q(**{street: '', town_city: ''}) & 
+                    ~models.Q(**{raw: ''}), then=F(raw)),
+        default=Concat(prefix, Value(state_str)),
+        output_field=models.CharField())
+
+
+def set_formatted(apps, schema_editor):
+    Address = apps.get_model('ezaddress', 'Address')
+    State = apps.get_model('ezaddress', 'State')
+    db = schema_editor.connection.alias
+    addresses = Address.objects.using(db)
+    addresses.filter(state=None).update(formatted=models.F('raw'))
+    states = State.objects.using(db).select_related('country').order_by()
+    for state in states:
+        state_str = _state_str(state.name, state.country.name)
+        addresses.filter(state=state).update(formatted=_formatted_expr(
+            'raw', 'street', 'town_city', 'postal_code', state_str))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ezaddress', '0006_addresstoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='formatted',
+            field=models.CharField(blank=True, editable=False, max_length=320),
+        ),
+        migrations.RunPython(set_formatted, migrations.RunPython.noop),
+    ]
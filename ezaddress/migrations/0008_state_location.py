@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ezaddress', '0007_address_formatted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='state',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction, IntegrityError, DEFAULT_DB_ALIAS
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 from django.db.models.fields.related import ForeignObject
@@ -7,7 +10,20 @@ try:
 except ImportError:
     from django.db.models.fields.related import \
          ReverseSingleRelatedObjectDescriptor as ForwardManyToOneDescriptor
+from django.utils import six
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.module_loading import import_string
+from django.conf import settings
+
+from .cache import addresses, address_cache_enabled, regions, \
+     region_cache_enabled
+from .geo import encode_geohash, GeoQuerySet
+from .instrumentation import instrumented
+from .parser import parser
+from .routers import pin_to_primary
+from .signals import address_resolved, addresses_created, \
+     MATCHED, UPDATED, CREATED
+from .utils import fingerprint, tokenize
 
 
 
@@ -19,122 +35,546 @@ if sys.version > '3':
     unicode = str
 
 
-__all__ = ['Country', 'State', 'Address', 'AddressField']
+__all__ = ['Country', 'State', 'Address', 'AddressToken', 'AddressValue',
+           'AddressField']
+
+
+GPS_FIELDS = ('latitude', 'longitude', 'altitude', 'gps_error')
+# fields the fingerprint of an address is computed from
+FINGERPRINT_FIELDS = ('raw', 'street', 'town_city', 'postal_code', 'state',
+                      'state_id')
+# fields making up the string of an address, and of an Addressable, the
+# state last
+FORMATTED_FIELDS = ('raw', 'street', 'town_city', 'postal_code', 'state')
+ADDRESSABLE_FORMATTED_FIELDS = ('addr_raw', 'addr_street', 'addr_town',
+                                'postal_code', 'addr_state')
 
 
 class InconsistentDictError(Exception):
     pass
 
 
-def _to_address(value):
-    """Converts a dict with proper address keys into an Address object."""
-    raw = value.get('raw', '')
-    country = value.get('country', '')
-    country_code = value.get('country_code', '')
-    state = value.get('state', '')
-    state_code = value.get('state_code', '')
-    postal_code = value.get('postal_code', '')
-    street = value.get('street', '')
-    town_city = value.get('town_city', '')
-    latitude = value.get('latitude', None)
-    longitude = value.get('longitude', None)
-    altitude = value.get('altitude', None)
-    gps_error = value.get('gps_error', None)
+def _clean_code(model, code, name, message_fmt):
+    """Returns a code which fits the code field of `model`. Codes which are
+    too long are dropped if they merely repeat the name, else rejected.
+    """
+    if len(code) > model._meta.get_field('code').max_length:
+        if code != name:
+            raise ValueError(_(message_fmt) % code)
+        code = ''
+    return code
+
+
+def _clean_country_code(code, name):
+    return _clean_code(Country, code, name,
+                       'Invalid country code (too long): %s')
+
+
+def _clean_state_code(code, name):
+    return _clean_code(State, code, name,
+                       'Invalid state code (too long): %s')
+
+
+def _parse_address_dict(value):
+    """Extracts the address entries from a dict, applying defaults. Returns
+    None if the dict has no `raw` entry and raises InconsistentDictError if
+    only one of country and state is provided.
+    """
+    entry = dict(
+        raw = value.get('raw', ''),
+        country = value.get('country', ''),
+        country_code = value.get('country_code', ''),
+        state = value.get('state', ''),
+        state_code = value.get('state_code', ''),
+        postal_code = value.get('postal_code', ''),
+        street = value.get('street', ''),
+        town_city = value.get('town_city', ''),
+        latitude = value.get('latitude', None),
+        longitude = value.get('longitude', None),
+        altitude = value.get('altitude', None),
+        gps_error = value.get('gps_error', None),
+    )
     
     # raw value is mandatory; if not present dict isn't an Address equivalent
-    if not raw:
+    if not entry['raw']:
         return None
     
     # require both or none of country and state, not either 
-    if ((country or state) and not (country and state)):
+    if ((entry['country'] or entry['state']) and 
+        not (entry['country'] and entry['state'])):
         raise InconsistentDictError
+    return entry
+
+
+def _get_country(name):
+    if not name:
+        return None
+    if region_cache_enabled():
+        return regions.country(name)
+    return Country.objects.get(name=name)
+
+
+def _get_state(name, country):
+    if not name:
+        return None
+    # state names are only unique within a country
+    if region_cache_enabled():
+        return regions.state(name, country)
+    return State.objects.get(name=name, country=country)
+
+
+def _to_address(value):
+    """Converts a dict with proper address keys into an Address object."""
+    entry = _parse_address_dict(value)
+    if entry is None:
+        return None
+    
+    country = entry['country']
+    state = entry['state']
     
     # handle country
     try:
-        country_obj = Country.objects.get(name=country)
+        country_obj = _get_country(country)
     except Country.DoesNotExist:
         if country:
-            if len(country_code) > Country._meta.get_field('code').max_length:
-                if country_code != country:
-                    message_fmt = 'Invalid country code (too long): %s' 
-                    raise ValueError(_(message_fmt) % country_code)
-                country_code = ''
-            country_obj = Country.objects.create(name=country, code=country_code)
+            country_code = _clean_country_code(entry['country_code'], country)
+            country_obj = _create_or_get(
+                Country(name=country, code=country_code), name=country)
         else:
             country_obj = None
     
     # handle state
     try:
-        state_obj = State.objects.get(name=state)
+        state_obj = _get_state(state, country_obj)
     except State.DoesNotExist:
         if state:
-            if len(state_code) > State._meta.get_field('code').max_length:
-                if state_code != state:
-                    message_fmt = 'Invalid state code (too long): %s'
-                    raise ValueError(_(message_fmt) % state_code)
-                state_code = ''
-            state_obj = State.objects.create(name=state, code=state_code, 
-                                             country=country_obj)
+            state_code = _clean_state_code(entry['state_code'], state)
+            state_obj = _create_or_get(
+                State(name=state, code=state_code, country=country_obj),
+                name=state, country=country_obj)
         else:
             state_obj = None
     
     # handle address
-    try:
-        if not (street or town_city):
-            addr_obj = Address.objects.get(raw=raw)
-        else:
-            addr_obj = Address.objects.get(
-                street = street,
-                town_city = town_city,
-                postal_code = postal_code,
-                state = state_obj,
-            )
-    except Address.DoesNotExist:
-        addr_obj = Address(
-            raw = raw,
-            street = street,
-            town_city = town_city,
-            postal_code = postal_code,
-            state = state_obj,
-            latitude = latitude,
-            longitude = longitude,
-            altitude = altitude,
-            gps_error = gps_error,
-        )
+    value = _entry_fingerprint(entry, state_obj)
+    addr_obj = Address.objects.filter(fingerprint=value).first()
+    if addr_obj is None:
+        new_obj = _new_address(entry, state_obj)
+        addr_obj = _create_or_get(new_obj, fingerprint=value)
+        if addr_obj is new_obj:
+            return _resolved(addr_obj, CREATED)
     
-    addr_obj.save()
+    # only write GPS values which changed
+    changed = _update_gps_fields(addr_obj, entry)
+    if changed:
+        addr_obj.save(update_fields=changed)
+        return _resolved(addr_obj, UPDATED)
+    return _resolved(addr_obj, MATCHED)
+
+
+def _update_gps_fields(addr_obj, entry):
+    """Sets the GPS values of `entry` which differ from those of `addr_obj`
+    on it and returns the names of the fields changed. Values missing from
+    `entry` never clear stored ones.
+    """
+    changed = []
+    for field in GPS_FIELDS:
+        value = entry[field]
+        if value is not None and value != getattr(addr_obj, field):
+            setattr(addr_obj, field, value)
+            changed.append(field)
+    return changed
+
+
+def _resolved(addr_obj, outcome):
+    address_resolved.send(sender=Address, address=addr_obj, outcome=outcome)
     return addr_obj
 
 
+def _create_or_get(obj, **lookup):
+    """Saves the new `obj` and returns it, unless a concurrent writer stored
+    a conflicting row first, in which case that row is returned instead.
+    """
+    # the row is read back from the primary if it's already there
+    pin_to_primary()
+    try:
+        with transaction.atomic():
+            obj.save()
+        return obj
+    except IntegrityError:
+        exc_info = sys.exc_info()
+        try:
+            return obj.__class__._default_manager.get(**lookup)
+        except obj.__class__.DoesNotExist:
+            # no conflicting row, so the error is of another kind
+            six.reraise(*exc_info)
+
+
+def _raw_address(raw):
+    """Returns the address stored for a raw value only, creating it if need
+    be.
+    """
+    value = fingerprint(raw)
+    addr_obj = Address.objects.filter(fingerprint=value).first()
+    if addr_obj is None:
+        new_obj = Address(raw=raw)
+        addr_obj = _create_or_get(new_obj, fingerprint=value)
+        if addr_obj is new_obj:
+            return _resolved(addr_obj, CREATED)
+    return _resolved(addr_obj, MATCHED)
+
+
+def _entry_fingerprint(entry, state_obj):
+    return fingerprint(entry['raw'], entry['street'], entry['town_city'], 
+                       entry['postal_code'], state_obj.pk if state_obj else None)
+
+
+def _new_address(entry, state_obj):
+    addr_obj = Address(
+        raw = entry['raw'],
+        street = entry['street'],
+        town_city = entry['town_city'],
+        postal_code = entry['postal_code'],
+        state = state_obj,
+        latitude = entry['latitude'],
+        longitude = entry['longitude'],
+        altitude = entry['altitude'],
+        gps_error = entry['gps_error'],
+        geohash = encode_geohash(entry['latitude'], entry['longitude']),
+    )
+    addr_obj.formatted = addr_obj._format_address()
+    return addr_obj
+
+
+_parsers = {}
+
+
+def _parse_raw(raw):
+    """Parses a raw address string into an address dict using the callable
+    named by the `EZADDRESS_PARSER` setting, e.g. 'ezaddress.parser.parse'.
+    Returns None without a parser or if the string can't be parsed.
+    """
+    path = getattr(settings, 'EZADDRESS_PARSER', None)
+    if not path:
+        return None
+    parse = _parsers.get(path)
+    if parse is None:
+        parse = _parsers[path] = import_string(path)
+    return parse(raw)
+
+
+@instrumented('to_address')
 def to_address(value):
     if value is None:
         return None
     
     if isinstance(value, Address):
         return value
+    elif isinstance(value, AddressValue):
+        return value.to_address()
     elif isinstance(value, (int, long)):
         # assume value is model primary key
         return value
-    elif isinstance(value, basestring):
-        addr_obj = Address(raw = value)
-        addr_obj.save()
+    elif isinstance(value, (basestring, dict)):
+        if not address_cache_enabled():
+            return _resolve_value(value)
+        
+        key = addresses.key(value)
+        if key is None:
+            return _resolve_value(value)
+        
+        def fetch(pk, value_fingerprint):
+            return _cached_address(pk, value_fingerprint, value)
+        addr_obj = addresses.get(key, fetch)
+        if addr_obj is None:
+            addr_obj = _resolve_value(value)
+            addresses.set(key, addr_obj)
         return addr_obj
-    elif isinstance(value, dict):
-        try:
-            return _to_address(value)
-        except InconsistentDictError:
-            return Address.objects.create(raw=value['raw'])
     
     # value not in any of the recognized formats
     raise ValidationError(_('Invalid address value.'))
 
 
+def _resolve_value(value):
+    if isinstance(value, basestring):
+        parsed = _parse_raw(value)
+        if parsed is not None:
+            return _to_address(parsed)
+        return _raw_address(value)
+    try:
+        return _to_address(value)
+    except InconsistentDictError:
+        return _raw_address(value['raw'])
+
+
+def _cached_address(pk, value_fingerprint, value):
+    """Returns the address with `pk` which `value` was cached as resolving
+    to, updating its GPS values as `to_address` would, or None if it no 
+    longer has the fingerprint it was cached with.
+    """
+    addr_obj = Address.objects.filter(pk=pk, fingerprint=value_fingerprint)\
+                              .first()
+    if addr_obj is None:
+        return None
+    if isinstance(value, dict):
+        entry = dict((field, value.get(field)) for field in GPS_FIELDS)
+        changed = _update_gps_fields(addr_obj, entry)
+        if changed:
+            addr_obj.save(update_fields=changed)
+            return _resolved(addr_obj, UPDATED)
+    return _resolved(addr_obj, MATCHED)
+
+
+# number of values bound into a single IN or OR lookup; kept well below the
+# 999 host parameters allowed by older SQLite builds
+LOOKUP_BATCH_SIZE = 200
+
+
+def _chunked(items, size=LOOKUP_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _bulk_insert(objs, *keys):
+    """Inserts `objs` using `bulk_create` and returns the stored objects.
+    
+    Where the backend doesn't return ids from bulk inserts, primary keys are
+    read back using the `keys` fields, which must identify a row uniquely.
+    Should a concurrent writer have stored any of the rows first, each of
+    the objects is created or fetched on its own instead.
+    """
+    if not objs:
+        return objs
+    pin_to_primary()
+    manager = objs[0].__class__._default_manager
+    key_of = lambda obj: tuple(getattr(obj, k) for k in keys)
+    try:
+        with transaction.atomic():
+            manager.bulk_create(objs)
+    except IntegrityError:
+        return [_create_or_get(obj, **dict(zip(keys, key_of(obj))))
+                for obj in objs]
+    
+    if objs[0].pk is None:
+        pks = {}
+        for chunk in _chunked(set(getattr(obj, keys[0]) for obj in objs)):
+            rows = manager.filter(**{'%s__in' % keys[0]: chunk})\
+                          .values_list(*(keys + ('pk',))).order_by()
+            pks.update((row[:-1], row[-1]) for row in rows)
+        for obj in objs:
+            obj.pk = pks[key_of(obj)]
+    return objs
+
+
+@instrumented('to_addresses')
+def to_addresses(values):
+    """Converts an iterable of address values into Address objects in bulk.
+    
+    Gives the same results as calling `to_address` on each value in turn but
+    resolves countries, states and existing addresses with one query per
+    batch of values and inserts the new rows using `bulk_create`. Results
+    are returned in input order. `AddressValue`s with a `state_id` keep 
+    that state rather than having it looked up by name.
+    """
+    values = list(values)
+    results = [None] * len(values)
+    entries = []
+    state_pks = {}
+    
+    # entries are (index, raw, entry) tuples; entry is None for values which
+    # are stored as raw-only addresses
+    for i, value in enumerate(values):
+        if isinstance(value, AddressValue):
+            if value.pk is not None:
+                results[i] = value.to_address()
+                continue
+            if value.state_id is not None:
+                state_pks[i] = value.state_id
+            value = value._address_value()
+        
+        if value is None:
+            continue
+        elif isinstance(value, (Address, int, long)):
+            results[i] = value
+        elif isinstance(value, basestring):
+            parsed = _parse_raw(value)
+            if parsed is not None:
+                entries.append((i, value, _parse_address_dict(parsed)))
+            else:
+                entries.append((i, value, None))
+        elif isinstance(value, dict):
+            try:
+                entry = _parse_address_dict(value)
+            except InconsistentDictError:
+                entries.append((i, value['raw'], None))
+                continue
+            if entry is not None:
+                entries.append((i, entry['raw'], entry))
+        else:
+            raise ValidationError(_('Invalid address value.'))
+    
+    parsed = [entry for (i, raw, entry) in entries 
+              if entry and i not in state_pks]
+    countries = _resolve_countries(parsed)
+    states = _resolve_states(parsed, countries)
+    known_states = {}
+    for chunk in _chunked(set(state_pks.values())):
+        known_states.update(State.objects.select_related('country')
+                                         .in_bulk(chunk))
+    
+    def state_of(i, entry):
+        if i in state_pks:
+            return known_states[state_pks[i]]
+        return states.get(_state_key(entry, countries))
+    
+    # find existing addresses for all entries
+    fingerprints = {}
+    for (i, raw, entry) in entries:
+        if entry:
+            fingerprints[i] = _entry_fingerprint(entry, state_of(i, entry))
+        else:
+            fingerprints[i] = fingerprint(raw)
+    
+    found = {}
+    for chunk in _chunked(set(fingerprints.values())):
+        for addr_obj in Address.objects.filter(fingerprint__in=chunk):
+            found[addr_obj.fingerprint] = addr_obj
+    
+    # values repeated within the batch map to the first new address
+    # created for them, as with `to_address`
+    pending, outcomes, updates = [], {}, {}
+    for (i, raw, entry) in entries:
+        addr_obj = found.get(fingerprints[i])
+        if addr_obj is None:
+            if entry is None:
+                addr_obj = Address(raw=raw, formatted=raw)
+            else:
+                addr_obj = _new_address(entry, state_of(i, entry))
+            addr_obj.fingerprint = fingerprints[i]
+            found[addr_obj.fingerprint] = addr_obj
+            pending.append((i, addr_obj))
+            outcomes[i] = CREATED
+            continue
+        
+        outcomes[i] = MATCHED
+        if entry is not None:
+            changed = _update_gps_fields(addr_obj, entry)
+            if changed and addr_obj.pk:
+                updates.setdefault(addr_obj.pk, (addr_obj, set()))[1]\
+                       .update(changed)
+                outcomes[i] = UPDATED
+            elif changed:
+                # a pending new address, inserted along with its geohash
+                _set_geohash(addr_obj, {})
+    
+    stored = _bulk_insert([addr_obj for (i, addr_obj) in pending], 
+                          'fingerprint')
+    created = []
+    for ((i, addr_obj), stored_obj) in zip(pending, stored):
+        if stored_obj is not addr_obj:
+            # stored by a concurrent writer in the meantime
+            found[addr_obj.fingerprint] = stored_obj
+            outcomes[i] = MATCHED
+        else:
+            created.append(addr_obj)
+    if created:
+        addresses_created.send(sender=Address, addresses=created)
+    for (addr_obj, changed) in updates.values():
+        addr_obj.save(update_fields=sorted(changed))
+    
+    for (i, raw, entry) in entries:
+        results[i] = found[fingerprints[i]]
+        _resolved(results[i], outcomes[i])
+    return results
+
+
+def _resolve_countries(entries):
+    """Returns a name to Country mapping for the countries named in `entries`
+    creating those which do not exist yet.
+    """
+    codes = {}
+    for entry in entries:
+        if entry['country']:
+            codes.setdefault(entry['country'], entry['country_code'])
+    
+    countries = {}
+    if region_cache_enabled():
+        countries.update(regions.find_countries(codes))
+    for chunk in _chunked(n for n in codes if n not in countries):
+        for country_obj in Country.objects.filter(name__in=chunk):
+            countries[country_obj.name] = country_obj
+    
+    missing = [Country(name=name, code=_clean_country_code(code, name))
+               for (name, code) in codes.items() if name not in countries]
+    for country_obj in _regions_created(_bulk_insert(missing, 'name')):
+        countries[country_obj.name] = country_obj
+    return countries
+
+
+def _regions_created(objs):
+    """Has the region cache and the default parser learn of the regions
+    stored by `_bulk_insert`, which sends no `post_save` signals, once their
+    transaction commits. Returns `objs`.
+    """
+    def added():
+        for obj in objs:
+            regions.created(obj)
+            parser.added(obj)
+    if objs:
+        transaction.on_commit(added)
+    return objs
+
+
+def _state_key(entry, countries):
+    if not entry['state']:
+        return None
+    return (entry['state'], countries[entry['country']].pk)
+
+
+def _resolve_states(entries, countries):
+    """Returns a (name, country pk) to State mapping for the states named in
+    `entries` creating those which do not exist yet.
+    """
+    codes = {}
+    for entry in entries:
+        key = _state_key(entry, countries)
+        if key is not None:
+            codes.setdefault(key, entry['state_code'])
+    
+    states = {}
+    if region_cache_enabled():
+        states.update(regions.find_states(codes))
+    names = set(name for (name, country_pk) in codes 
+                if (name, country_pk) not in states)
+    for chunk in _chunked(names):
+        for state_obj in State.objects.filter(name__in=chunk)\
+                                      .select_related('country'):
+            key = (state_obj.name, state_obj.country_id)
+            if key in codes:
+                states[key] = state_obj
+    
+    by_pk = dict((country_obj.pk, country_obj) 
+                 for country_obj in countries.values())
+    missing = [State(name=name, code=_clean_state_code(code, name),
+                     country=by_pk[country_pk])
+               for ((name, country_pk), code) in codes.items() 
+               if (name, country_pk) not in states]
+    created = _bulk_insert(missing, 'name', 'country_id')
+    for state_obj in _regions_created(created):
+        states[(state_obj.name, state_obj.country_id)] = state_obj
+    return states
+
+
 def _to_address_str(**kwargs):
     """INTERNAL METHOD
     Used to format an Address or Addressable object to an Address string.
     """
     state = kwargs.get('state', None)
-    if state:
+    # addresses known by their raw value alone, e.g. those given a state by
+    # reverse geocoding, keep being shown by it
+    if state and (kwargs.get('street') or kwargs.get('town_city') or 
+                  not kwargs.get('raw')):
         value = kwargs.get('street', '')
         town_city = kwargs.get('town_city')
         if town_city:
@@ -154,6 +594,228 @@ def _to_address_str(**kwargs):
     return value
 
 
+def _state_str(name, country_name):
+    """INTERNAL METHOD
+    Returns the string representation of a State as used in addresses.
+    """
+    value = name
+    if value:
+        value += ', '
+    value += country_name
+    return value
+
+
+def _unless_blank(field, then):
+    return models.Case(models.When(**{field: '', 'then': Value('')}),
+                       default=then, output_field=models.CharField())
+
+
+def _raw_only(raw, street, town_city):
+    """Returns the condition under which `_to_address_str` gives the raw
+    value although there's a state.
+    """
+    return Q(**{street: '', town_city: ''}) & ~Q(**{raw: ''})
+
+
+def _address_prefix_expr(street, town_city, postal_code):
+    """INTERNAL METHOD
+    Builds an SQL expression giving the part of the `_to_address_str` string
+    preceding the state for the provided field names.
+    """
+    sep = Value(', ')
+    town_part = _unless_blank(town_city, Concat(
+        _unless_blank(street, sep), F(town_city),
+        _unless_blank(postal_code, Concat(Value(' '), F(postal_code))),
+    ))
+    return Concat(F(street), town_part, models.Case(
+        models.When(**{street: '', town_city: '', 'then': Value('')}),
+        default=sep, output_field=models.CharField()))
+
+
+def _address_display_expr(street, town_city, postal_code, state, raw):
+    """INTERNAL METHOD
+    Builds an SQL expression giving the same string as `_to_address_str` for
+    the provided field names; `state` names the State foreign key.
+    """
+    state_part = Concat(
+        F(state + '__name'), _unless_blank(state + '__name', Value(', ')), 
+        F(state + '__country__name'),
+    )
+    return models.Case(
+        models.When(**{state + '__isnull': True, 'then': F(raw)}),
+        models.When(_raw_only(raw, street, town_city), then=F(raw)),
+        default=Concat(_address_prefix_expr(street, town_city, postal_code),
+                       state_part),
+        output_field=models.CharField())
+
+
+def _formatted_expr(raw, street, town_city, postal_code, state_str):
+    """INTERNAL METHOD
+    Builds an SQL expression giving the same string as `_to_address_str` for
+    the provided field names of rows having the state whose string is 
+    `state_str`; unlike `_address_display_expr` it needs no joins so it can
+    be used in updates.
+    """
+    return models.Case(
+        models.When(_raw_only(raw, street, town_city), then=F(raw)),
+        default=Concat(_address_prefix_expr(street, town_city, postal_code),
+                       Value(state_str)),
+        output_field=models.CharField())
+
+
+# fields read by `AddressQuerySet.iter_dicts` and `iter_values`
+_DICT_VALUES = ('pk', 'street', 'town_city', 'raw', 'latitude', 'longitude',
+                'altitude', 'gps_error', 'postal_code', 'state_id', 
+                'state__name', 'state__code', 'state__country__name', 
+                'state__country__code')
+
+
+def _address_dict(row):
+    """Shapes a row of `_DICT_VALUES` as `Address.as_dict` does."""
+    addr = dict(
+        street = row['street'],
+        town_city = row['town_city'],
+        raw = row['raw'],
+        latitude = row['latitude'] if row['latitude'] else '',
+        longitude = row['longitude'] if row['longitude'] else '',
+        altitude = row['altitude'] if row['altitude'] else '',
+        gps_error = row['gps_error'] if row['gps_error'] else '',
+    )
+    if row['state__name'] is not None:
+        addr['state'] = row['state__name']
+        addr['state_code'] = row['state__code']
+        addr['postal_code'] = row['postal_code']
+        addr['country'] = row['state__country__name']
+        addr['country_code'] = row['state__country__code']
+    return addr
+
+
+# sorts after any character found in tokens, so that [term, term + 
+# _PREFIX_END) spans every token starting with term
+_PREFIX_END = u'\uffff'
+
+
+class AddressQuerySet(GeoQuerySet):
+
+    def with_display(self, name='display'):
+        """Annotates each address with its string representation, computed
+        by the database.
+        """
+        return self.annotate(**{name: _address_display_expr(
+            'street', 'town_city', 'postal_code', 'state', 'raw')})
+    
+    def autocomplete(self, prefix, limit=10):
+        """Returns up to `limit` addresses with indexed words starting with
+        each of the words of `prefix`, e.g. 'bank ro' finds addresses on a
+        Bank Road. See `ezaddress.autocomplete` for how addresses are
+        indexed.
+        """
+        terms = tokenize(prefix)
+        if not terms:
+            return self.none()
+        query = self
+        for term in terms:
+            query = query.filter(pk__in=AddressToken.objects.filter(
+                token__gte=term, token__lt=term + _PREFIX_END)\
+                .values('address_id'))
+        return query.order_by('pk')[:limit]
+    
+    def iter_dicts(self, chunk_size=2000):
+        """Yields the addresses as returned by `Address.as_dict`, in primary
+        key order, without creating model instances. Rows are read with 
+        their state and country joined, `chunk_size` at a time, so memory
+        use doesn't grow with the number of addresses.
+        """
+        for row in self._iter_rows(chunk_size):
+            yield _address_dict(row)
+    
+    def iter_values(self, chunk_size=2000):
+        """Yields the addresses as `AddressValue`s, as `iter_dicts` does."""
+        for row in self._iter_rows(chunk_size):
+            yield AddressValue._from_row(row)
+    
+    def _iter_rows(self, chunk_size):
+        queryset = self.order_by('pk').values(*_DICT_VALUES)
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else \
+                    queryset.filter(pk__gt=last_pk)
+            rows = list(chunk[:chunk_size])
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                break
+            last_pk = rows[-1]['pk']
+
+
+class AddressManager(models.Manager.from_queryset(AddressQuerySet)):
+    """Default Address manager which loads the state and country along with
+    each address so formatting addresses requires no further queries.
+    """
+    use_for_related_fields = True
+    
+    def get_queryset(self):
+        return super(AddressManager, self).get_queryset()\
+                    .select_related('state__country')
+
+
+class AddressableQuerySet(models.QuerySet):
+
+    def with_display(self, name='address_display'):
+        """Annotates each object with its address string as returned by
+        `get_address_str`, computed by the database.
+        """
+        return self.annotate(**{name: _address_display_expr(
+            'addr_street', 'addr_town', 'postal_code', 'addr_state', 
+            'addr_raw')})
+
+
+class AddressableManager(models.Manager.from_queryset(AddressableQuerySet)):
+    """A manager for Addressable models which loads the address state and
+    country along with each object.
+    """
+    
+    def get_queryset(self):
+        return super(AddressableManager, self).get_queryset()\
+                    .select_related('addr_state__country')
+
+
+def _set_formatted(obj, name, fields, save_kwargs):
+    """Sets the `name` field of `obj` to its address string before it is 
+    saved, adding it to the fields being updated when any of the address
+    `fields` is; updates of other fields leave it, and the state, alone.
+    """
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is None:
+        setattr(obj, name, obj._format_address())
+    elif set(update_fields) & set(fields):
+        setattr(obj, name, obj._format_address())
+        if name not in update_fields:
+            save_kwargs['update_fields'] = list(update_fields) + [name]
+
+
+def _set_fingerprint(obj, save_kwargs):
+    """Sets the fingerprint of the address `obj` before it is saved, adding
+    it to the fields being updated when any it's computed from is.
+    """
+    obj.fingerprint = obj.get_fingerprint()
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'fingerprint' not in update_fields and \
+       set(update_fields) & set(FINGERPRINT_FIELDS):
+        save_kwargs['update_fields'] = list(update_fields) + ['fingerprint']
+
+
+def _set_geohash(obj, save_kwargs):
+    """Sets the geohash of `obj` before it is saved, adding it to the fields
+    being updated when its latitude or longitude is.
+    """
+    obj.geohash = encode_geohash(obj.latitude, obj.longitude)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'geohash' not in update_fields and \
+       set(update_fields) & set(['latitude', 'longitude']):
+        save_kwargs['update_fields'] = list(update_fields) + ['geohash']
+
+
 @python_2_unicode_compatible
 class Country(models.Model):
     """A model for storing Country data."""
@@ -175,17 +837,16 @@ class State(models.Model):
     code = models.CharField(max_length=3, blank=True)
     country = models.ForeignKey(Country, blank=False, null=False,
                 related_name='states')
+    # reference point used for reverse geocoding, e.g. the centroid
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     
     class Meta:
         unique_together = ('name', 'country')
         ordering = ('country', 'name')
     
     def __str__(self):
-        value = self.name
-        if self.country and value:
-            value += ', '
-        value += self.country.name
-        return value
+        return _state_str(self.name, self.country.name)
 
 
 @python_2_unicode_compatible
@@ -200,18 +861,39 @@ class Address(models.Model):
     longitude = models.FloatField(blank=True, null=True)
     altitude = models.FloatField(blank=True, null=True)
     gps_error = models.PositiveSmallIntegerField(blank=True, null=True)
+    fingerprint = models.CharField(max_length=40, blank=True, null=True,
+                    editable=False, unique=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True,
+                    editable=False)
+    formatted = models.CharField(max_length=320, blank=True, editable=False)
+    
+    objects = AddressManager()
     
     class Meta:
         verbose_name_plural = 'Addresses'
         ordering = ('state', 'town_city', 'postal_code', 'street')
+        index_together = ('latitude', 'longitude')
     
     def __str__(self):
+        return self.formatted or self._format_address()
+    
+    def _format_address(self):
         return _to_address_str(**{
             'street': self.street, 'town_city': self.town_city, 
             'postal_code': self.postal_code, 'state': self.state,
             'raw': self.raw
         })
-
+    
+    def save(self, *args, **kwargs):
+        _set_fingerprint(self, kwargs)
+        _set_geohash(self, kwargs)
+        _set_formatted(self, 'formatted', FORMATTED_FIELDS, kwargs)
+        super(Address, self).save(*args, **kwargs)
+    
+    def get_fingerprint(self):
+        """Returns the hash used to match this address against others."""
+        return fingerprint(self.raw, self.street, self.town_city, 
+                           self.postal_code, self.state_id)
     
     def clean(self):
         if not self.raw:
@@ -236,6 +918,137 @@ class Address(models.Model):
                 addr['country_code'] = self.state.country.code
         return addr
 
+class AddressToken(models.Model):
+    """A normalized word of an address, or of its state or country name, 
+    indexed for autocompletion.
+    """
+    token = models.CharField(max_length=40)
+    address = models.ForeignKey(Address, related_name='+')
+    
+    class Meta:
+        index_together = ('token', 'address')
+
+
+@python_2_unicode_compatible
+class AddressValue(object):
+    """An immutable address along with the names and codes of its state and
+    country, using a fraction of the memory of an `Address` for read-only
+    uses such as caches and templates. Produce them in bulk with 
+    `Address.objects.iter_values()`; `to_address` turns them back into 
+    addresses.
+    """
+    __slots__ = ('pk', 'raw', 'street', 'town_city', 'postal_code', 
+                 'latitude', 'longitude', 'altitude', 'gps_error', 
+                 'state_id', 'state', 'state_code', 'country', 'country_code')
+    _TEXT_FIELDS = ('raw', 'street', 'town_city', 'postal_code')
+    
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            default = '' if name in self._TEXT_FIELDS else None
+            object.__setattr__(self, name, kwargs.pop(name, default))
+        if kwargs:
+            raise TypeError('Unexpected AddressValue fields: %s' % 
+                            ', '.join(sorted(kwargs)))
+    
+    @classmethod
+    def _from_row(cls, row):
+        return cls(pk=row['pk'], raw=row['raw'], street=row['street'],
+                   town_city=row['town_city'], 
+                   postal_code=row['postal_code'], 
+                   latitude=row['latitude'], longitude=row['longitude'],
+                   altitude=row['altitude'], gps_error=row['gps_error'],
+                   state_id=row['state_id'], state=row['state__name'], 
+                   state_code=row['state__code'], 
+                   country=row['state__country__name'],
+                   country_code=row['state__country__code'])
+    
+    @classmethod
+    def from_address(cls, addr):
+        state = addr.state
+        return cls(pk=addr.pk, raw=addr.raw, street=addr.street,
+                   town_city=addr.town_city, postal_code=addr.postal_code,
+                   latitude=addr.latitude, longitude=addr.longitude,
+                   altitude=addr.altitude, gps_error=addr.gps_error,
+                   state_id=addr.state_id, 
+                   state=state.name if state else None,
+                   state_code=state.code if state else None,
+                   country=state.country.name if state else None,
+                   country_code=state.country.code if state else None)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('AddressValue objects are immutable')
+    
+    def __delattr__(self, name):
+        raise AttributeError('AddressValue objects are immutable')
+    
+    def __getstate__(self):
+        return self._values()
+    
+    def __setstate__(self, state):
+        for (name, value) in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+    
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+    
+    def __eq__(self, other):
+        return isinstance(other, AddressValue) and \
+               self._values() == other._values()
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return hash(self._values())
+    
+    def __repr__(self):
+        return '<AddressValue: %s>' % self
+    
+    def __str__(self):
+        state = None
+        if self.state is not None:
+            state = _state_str(self.state, self.country or '')
+        return _to_address_str(**{
+            'street': self.street, 'town_city': self.town_city,
+            'postal_code': self.postal_code, 'state': state,
+            'raw': self.raw
+        })
+    
+    def as_dict(self):
+        """Returns the value as `Address.as_dict` does."""
+        row = dict((name, getattr(self, name)) for name in self.__slots__)
+        row.update({
+            'state__name': self.state, 'state__code': self.state_code,
+            'state__country__name': self.country,
+            'state__country__code': self.country_code,
+        })
+        return _address_dict(row)
+    
+    def to_address(self):
+        """Returns the Address this value was read from, without querying
+        the database, or else resolves the value with `to_address`.
+        """
+        if self.pk is not None:
+            addr = Address(id=self.pk, raw=self.raw, street=self.street,
+                           town_city=self.town_city, 
+                           postal_code=self.postal_code, 
+                           latitude=self.latitude, longitude=self.longitude,
+                           altitude=self.altitude, gps_error=self.gps_error,
+                           state_id=self.state_id)
+            # the fields saving it sets, the string from the names held here
+            # rather than the state read
+            addr.formatted = unicode(self)
+            addr.fingerprint = addr.get_fingerprint()
+            addr.geohash = encode_geohash(self.latitude, self.longitude)
+            return addr
+        return to_address(self._address_value())
+    
+    def _address_value(self):
+        # the address dict resolved for values read from no stored address
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if name not in ('pk', 'state_id'))
+
+
 # note: changed to using an abstract base model as opposed a mixin due to
 # migration issues; according to https://code.djangoproject.com/ticket/22601
 # model mixin are meant for sharing logic, if model fields are present then
@@ -253,6 +1066,9 @@ class Addressable(models.Model):
         abstract = True
     
     def get_address_str(self):
+        return self._format_address()
+    
+    def _format_address(self):
         return _to_address_str(**{
             'street': self.addr_street, 'town_city': self.addr_town, 
             'postal_code': self.postal_code, 'state': self.addr_state,
@@ -260,30 +1076,277 @@ class Addressable(models.Model):
         })
 
 
+class FormattedAddressable(Addressable):
+    """An Addressable model mixin which stores the address string in the
+    `addr_formatted` field when saved, so `get_address_str` needs neither 
+    the state nor the country. The string is refreshed when they're renamed.
+    """
+    addr_formatted = models.CharField(max_length=320, blank=True, 
+                        editable=False)
+    
+    class Meta:
+        abstract = True
+    
+    def get_address_str(self):
+        return self.addr_formatted or self._format_address()
+    
+    def save(self, *args, **kwargs):
+        _set_formatted(self, 'addr_formatted', ADDRESSABLE_FORMATTED_FIELDS,
+                       kwargs)
+        super(FormattedAddressable, self).save(*args, **kwargs)
+
+
+def _address_property(name):
+    def fget(self):
+        addr = getattr(self, self.address_field_name)
+        if addr is None:
+            return None if name == 'state' else ''
+        return getattr(addr, name)
+    
+    def fset(self, value):
+        values = self._address_values()
+        if name == 'state':
+            for key in ('state', 'state_code', 'country', 'country_code'):
+                values.pop(key, None)
+            if value is not None:
+                values.update(state=value.name, state_code=value.code,
+                              country=value.country.name,
+                              country_code=value.country.code)
+        else:
+            values[name] = value
+        setattr(self, self.address_field_name, values)
+    return property(fget, fset)
+
+
+class AddressableCompat(object):
+    """A mixin for models converted from Addressable to an AddressField by
+    `convert_addressables`, keeping the `addr_*` and `postal_code` 
+    attributes and `get_address_str` working on top of the address held by
+    the `address_field_name` field.
+    
+    Assigning the attributes assigns the field an address dict with the new
+    value, so declare the field lazy to resolve it only once saved.
+    """
+    address_field_name = 'address'
+    
+    addr_raw = _address_property('raw')
+    addr_street = _address_property('street')
+    addr_town = _address_property('town_city')
+    addr_state = _address_property('state')
+    postal_code = _address_property('postal_code')
+    
+    def get_address_str(self):
+        addr = getattr(self, self.address_field_name)
+        return unicode(addr) if addr is not None else ''
+    
+    def _address_values(self):
+        # the address dict of the field value, pending or resolved
+        field = self._meta.get_field(self.address_field_name)
+        pending = self.__dict__.get(getattr(field, 'pending_name', None))
+        if isinstance(pending, dict):
+            return dict(pending)
+        addr = getattr(self, self.address_field_name)
+        if addr is None:
+            return {}
+        values = {
+            'raw': addr.raw, 'street': addr.street, 
+            'town_city': addr.town_city, 'postal_code': addr.postal_code,
+        }
+        if addr.state is not None:
+            values.update(state=addr.state.name, state_code=addr.state.code,
+                          country=addr.state.country.name,
+                          country_code=addr.state.country.code)
+        return values
+
+
+def _formatted_models():
+    """Yields the models storing address strings along with the names of
+    their formatted, raw, street, town/city, postal code and state fields.
+    """
+    for model in apps.get_models():
+        if model is Address:
+            yield (model, 'formatted') + FORMATTED_FIELDS
+        elif issubclass(model, FormattedAddressable):
+            yield (model, 'addr_formatted') + ADDRESSABLE_FORMATTED_FIELDS
+
+
+def refresh_formatted(state):
+    """Rewrites the stored address strings of the addresses, and 
+    `FormattedAddressable` objects, in `state` with one UPDATE per model.
+    """
+    state_str = unicode(state)
+    for (model, name, raw, street, town_city, postal_code, state_field) \
+        in _formatted_models():
+        model._base_manager.filter(**{state_field: state}).update(**{
+            name: _formatted_expr(raw, street, town_city, postal_code, 
+                                  state_str)
+        })
+
+
+def _region_display_fields(instance):
+    """Returns the fields of a Country or State which are part of the
+    strings of the addresses in it.
+    """
+    return ('name', 'country') if isinstance(instance, State) else ('name',)
+
+
+def snapshot_region(sender, instance, raw=False, using=DEFAULT_DB_ALIAS,
+                    update_fields=None, **kwargs):
+    """`pre_save` handler keeping the stored values of the fields of a
+    Country or State shown in address strings, so `region_changed` can tell
+    whether a save changes them.
+    """
+    instance._displayed_values = None
+    fields = _region_display_fields(instance)
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    instance._displayed_values = sender._base_manager.using(using)\
+        .filter(pk=instance.pk).values_list(*fields).first()
+
+
+def region_changed(instance):
+    """Returns whether the save of a Country or State, as recorded by
+    `snapshot_region`, changed any of its fields shown in address strings.
+    """
+    stored = getattr(instance, '_displayed_values', None)
+    if stored is None:
+        return False
+    current = tuple(getattr(instance, instance._meta.get_field(name).attname)
+                    for name in _region_display_fields(instance))
+    return tuple(stored) != current
+
+
+def update_formatted(sender, instance, created=False, raw=False, **kwargs):
+    """`post_save` handler refreshing the stored address strings in a 
+    Country or State whose name changed, as their names are part of them.
+    """
+    if created or raw or not region_changed(instance):
+        return
+    if isinstance(instance, State):
+        states = [instance]
+    else:
+        states = list(instance.states.all())
+        for state in states:
+            state.country = instance
+    with transaction.atomic():
+        for state in states:
+            refresh_formatted(state)
+
+
 class GPSLocatable(models.Model):
-    """A model mixin which defines GPS lat/lng/alt fields."""
+    """A model mixin which defines GPS lat/lng/alt fields. Use `GeoManager`
+    to query these spatially.
+    """
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
     altitude  = models.FloatField(blank=True, null=True)
     gps_error = models.PositiveSmallIntegerField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True,
+                    editable=False)
 
     class Meta:
         abstract = True
+        index_together = ('latitude', 'longitude')
+    
+    def save(self, *args, **kwargs):
+        _set_geohash(self, kwargs)
+        super(GPSLocatable, self).save(*args, **kwargs)
 
 
 class AddressDescriptor(ForwardManyToOneDescriptor):
     
+    def __get__(self, instance, instance_type=None):
+        if instance is not None and \
+           self.field.pending_name in instance.__dict__:
+            self.field.resolve_pending(instance)
+        return super(AddressDescriptor, self).__get__(instance, instance_type)
+    
+    @instrumented('descriptor')
     def __set__(self, instance, value):
+        instance.__dict__.pop(self.field.pending_name, None)
+        if self.field.lazy and isinstance(value, (basestring, dict)):
+            # resolved when the instance is saved or the value is read
+            instance.__dict__[self.field.pending_name] = value
+            instance.__dict__.setdefault(self.field.attname, None)
+            return
         super(AddressDescriptor, self).__set__(instance, to_address(value))
 
 
 class AddressField(models.ForeignKey):
+    """A foreign key to Address which accepts any value `to_address` does.
+    
+    Values are resolved into addresses as they are assigned unless `lazy` is
+    set, in which case strings and dicts are kept pending until the instance
+    is saved or the field read. `resolve_pending_addresses` resolves the 
+    pending values of many instances at once.
+    """
     description = 'An address'
     
-    def __init__(self, **kwargs):
+    def __init__(self, lazy=False, **kwargs):
         kwargs['to'] = 'ezaddress.Address'
+        self.lazy = lazy
         super(AddressField, self).__init__(**kwargs)
     
+    def deconstruct(self):
+        name, path, args, kwargs = super(AddressField, self).deconstruct()
+        if self.lazy:
+            kwargs['lazy'] = True
+        return name, path, args, kwargs
+    
     def contribute_to_class(self, cls, name, virtual_only=False):
         super(ForeignObject, self).contribute_to_class(cls, name, virtual_only)
         setattr(cls, self.name, AddressDescriptor(self))
+    
+    @property
+    def pending_name(self):
+        return '_%s_pending' % self.name
+    
+    def resolve_pending(self, instance):
+        value = instance.__dict__.pop(self.pending_name)
+        setattr(instance, self.name, to_address(value))
+    
+    def pre_save(self, model_instance, add):
+        if self.pending_name in model_instance.__dict__:
+            self.resolve_pending(model_instance)
+        return super(AddressField, self).pre_save(model_instance, add)
+    
+    def clean(self, value, model_instance):
+        if model_instance is not None and \
+           self.pending_name in model_instance.__dict__:
+            # validated by `to_address` once resolved
+            return value
+        return super(AddressField, self).clean(value, model_instance)
+
+
+def resolve_pending_addresses(objs):
+    """Resolves the pending values of the lazy AddressFields of `objs` with 
+    a single `to_addresses` call and returns `objs` as a list.
+    """
+    objs, pending = list(objs), []
+    for obj in objs:
+        for field in obj._meta.concrete_fields:
+            if isinstance(field, AddressField) and \
+               field.pending_name in obj.__dict__:
+                pending.append((obj, field, 
+                                obj.__dict__.pop(field.pending_name)))
+    
+    addrs = to_addresses(value for (obj, field, value) in pending)
+    for ((obj, field, value), addr_obj) in zip(pending, addrs):
+        setattr(obj, field.name, addr_obj)
+    return objs
+
+
+class AddressAwareQuerySet(models.QuerySet):
+    """A QuerySet for models with lazy AddressFields whose `bulk_create`
+    resolves the pending addresses of all the objects in one batch first.
+    """
+    
+    def bulk_create(self, objs, batch_size=None):
+        objs = resolve_pending_addresses(objs)
+        return super(AddressAwareQuerySet, self).bulk_create(objs, batch_size)
+
+
+class AddressAwareManager(models.Manager.from_queryset(AddressAwareQuerySet)):
+    pass
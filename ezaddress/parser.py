@@ -0,0 +1,191 @@
+"""
+ezaddress raw address parsing
+"""
+import re
+import threading
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .cache import regions
+from .utils import normalize
+
+
+
+__all__ = ['AddressParser', 'parser', 'parse']
+
+
+class AddressParser(object):
+    """Splits raw address strings such as 'No 1 Bank Road, Eko 720015,
+    Lagos, Nigeria' into the entries of an address dict.
+    
+    Parts are separated by commas and read from the end: an optional
+    country, a state, an optional postal code, the town/city and lastly the
+    street. Countries and states are recognised by their name or code using
+    an in-memory lookup of the stored ones, loaded on first use; strings
+    whose state isn't known, or whose country can't be told, aren't parsed.
+    
+    The lookup is loaded again whenever the version of the region cache 
+    changes, so with `EZADDRESS_REGION_CACHE_BACKEND` set regions created 
+    or changed by other processes are recognised too.
+    """
+    # a postal code ending the town/city part, or making up a part of its own
+    POSTAL_CODE_RE = re.compile(
+        r'(?:^|\s)(\d{4,10}|[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2})$',
+        re.IGNORECASE)
+    # words commonly following state names
+    STATE_SUFFIX_RE = re.compile(r'\s+(?:state|province|region)$')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lookup = None
+        self._version = None
+    
+    def _load(self):
+        Country = apps.get_model('ezaddress', 'Country')
+        State = apps.get_model('ezaddress', 'State')
+        countries, states, state_codes = {}, {}, {}
+        for country in Country.objects.order_by('pk'):
+            countries.setdefault(normalize(country.name), country)
+        for country in Country.objects.exclude(code='').order_by('pk'):
+            countries.setdefault(normalize(country.code), country)
+        for state in State.objects.select_related('country').order_by('pk'):
+            states.setdefault(normalize(state.name), []).append(state)
+            if state.code:
+                key = (state.country_id, normalize(state.code))
+                state_codes.setdefault(key, state)
+        return countries, states, state_codes
+    
+    def _get_lookup(self):
+        version = regions.version()
+        lookup = self._lookup
+        if lookup is None or version != self._version:
+            with self._lock:
+                if self._lookup is None or version != self._version:
+                    self._lookup, self._version = self._load(), version
+                lookup = self._lookup
+        return lookup
+    
+    def clear(self):
+        """Drops the country and state lookup, which is loaded again when
+        next needed.
+        """
+        with self._lock:
+            self._lookup = None
+    
+    def add(self, obj):
+        """Adds a newly created Country or State to the lookup."""
+        lookup = self._lookup
+        if lookup is None:
+            return
+        countries, states, state_codes = lookup
+        if obj._meta.model_name == 'country':
+            countries.setdefault(normalize(obj.name), obj)
+            if obj.code:
+                countries.setdefault(normalize(obj.code), obj)
+        else:
+            states.setdefault(normalize(obj.name), []).append(obj)
+            if obj.code:
+                key = (obj.country_id, normalize(obj.code))
+                state_codes.setdefault(key, obj)
+    
+    def added(self, obj):
+        """Adds a Country or State created by this process to the lookup
+        once `RegionCache.created` has counted its creation, which has the
+        parsers of other processes load theirs again.
+        """
+        previous = self._version
+        self.add(obj)
+        version = regions.version()
+        # unless other processes changed regions meanwhile, the lookup is
+        # up to date
+        if version is not None and previous is not None and \
+           version == (previous[0], (previous[1] or 0) + 1):
+            self._version = version
+    
+    def _find_state(self, value, country, lookup):
+        countries, states, state_codes = lookup
+        name = normalize(value)
+        for key in (name, self.STATE_SUFFIX_RE.sub('', name)):
+            candidates = [state for state in states.get(key, ())
+                          if country is None or 
+                             state.country_id == country.pk]
+            if len(candidates) > 1:
+                # the name is taken by states of several countries
+                return None
+            if candidates:
+                return candidates[0]
+        if country is not None:
+            return state_codes.get((country.pk, name))
+        return None
+    
+    def parse(self, raw):
+        """Returns the address dict for `raw`, or None if it can't be
+        parsed.
+        """
+        return self._parse(raw, self._get_lookup())
+    
+    def _parse(self, raw, lookup):
+        countries, states, state_codes = lookup
+        parts = [part.strip() for part in raw.split(',') if part.strip()]
+        if len(parts) < 2:
+            return None
+        
+        country = countries.get(normalize(parts[-1]))
+        if country is not None:
+            parts.pop()
+        state = self._find_state(parts[-1], country, lookup) \
+                if parts else None
+        if state is None:
+            return None
+        parts.pop()
+        
+        postal_code = ''
+        if parts:
+            match = self.POSTAL_CODE_RE.search(parts[-1])
+            if match:
+                postal_code = match.group(1)
+                parts[-1] = parts[-1][:match.start()].strip()
+                if not parts[-1]:
+                    parts.pop()
+        if not parts:
+            return None
+        
+        return {
+            'raw': raw,
+            'street': ', '.join(parts[:-1]),
+            'town_city': parts[-1],
+            'postal_code': postal_code,
+            'state': state.name,
+            'state_code': state.code,
+            'country': state.country.name,
+            'country_code': state.country.code,
+        }
+    
+    def parse_many(self, raws):
+        """Yields the address dict, or None, for each of `raws`."""
+        lookup = self._get_lookup()
+        for raw in raws:
+            yield self._parse(raw, lookup)
+
+
+parser = AddressParser()
+
+
+def parse(raw):
+    """Parses `raw` with the default parser; see `AddressParser`."""
+    return parser.parse(raw)
+
+
+def update_parser(sender, instance, created=False, using=DEFAULT_DB_ALIAS,
+                  **kwargs):
+    """Signal handler keeping the lookup of the default parser in step with
+    the database, as `update_regions` does for the region cache.
+    """
+    if created:
+        transaction.on_commit(lambda: parser.added(instance), using=using)
+    else:
+        # and again once committed, should other threads reload the lookup
+        # in the meantime
+        parser.clear()
+        transaction.on_commit(parser.clear, using=using)
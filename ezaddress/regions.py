@@ -0,0 +1,201 @@
+"""
+ezaddress reference data loading
+"""
+import csv
+import io
+import json
+import os
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .cache import regions
+from .geocoder import geocoder
+from .models import Country, State, _bulk_insert, _chunked, \
+     _clean_country_code, _clean_state_code
+from .parser import parser
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    unicode = str
+
+
+__all__ = ['DEFAULT_REGIONS_FILE', 'read_regions', 'load_regions']
+
+
+# ISO 3166-1 countries and their ISO 3166-2 top level subdivisions
+DEFAULT_REGIONS_FILE = os.path.join(os.path.dirname(__file__), 'data', 
+                                    'iso3166.csv')
+
+
+def _read_csv(path):
+    if sys.version > '3':
+        with io.open(path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield row
+    else:
+        with open(path, 'rb') as f:
+            for row in csv.DictReader(f):
+                yield dict((k.decode('utf-8'), (v or '').decode('utf-8'))
+                           for (k, v) in row.items())
+
+
+def read_regions(path):
+    """Yields the rows of a regions file as dicts with `country_code`, 
+    `country`, `state_code` and `state` entries. The file may be a CSV file
+    with those columns, a JSON file holding a list of such objects or a JSON
+    lines (.jsonl) file; a row with a blank state only defines a country.
+    Rows may also hold the `latitude` and `longitude` of the reference point
+    of their state, used for reverse geocoding.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        rows = _read_csv(path)
+    elif ext == '.jsonl':
+        rows = (json.loads(line) for line in io.open(path, encoding='utf-8')
+                if line.strip())
+    elif ext == '.json':
+        with io.open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+    else:
+        raise ValueError('Unsupported regions file: %s' % path)
+    
+    for row in rows:
+        values = dict((key, unicode(row.get(key) or '').strip()) for key in 
+                      ('country_code', 'country', 'state_code', 'state'))
+        values['point'] = _read_point(row)
+        yield values
+
+
+def _read_point(row):
+    latitude, longitude = row.get('latitude'), row.get('longitude')
+    if latitude in (None, '') or longitude in (None, ''):
+        return None
+    try:
+        point = (float(latitude), float(longitude))
+    except (TypeError, ValueError):
+        point = None
+    if point is None or not (-90 <= point[0] <= 90 and 
+                             -180 <= point[1] <= 180):
+        raise ValueError('Invalid latitude/longitude for %s: %s, %s' % (
+                         row.get('state') or row.get('country'), 
+                         latitude, longitude))
+    return point
+
+
+def _updated_codes(objs, codes):
+    """Returns a code to pks mapping for the objects whose code differs from
+    the non-blank one in `codes`, which is keyed by object.
+    """
+    updates = {}
+    for obj in objs:
+        code = codes[obj]
+        if code and code != obj.code:
+            updates.setdefault(code, []).append(obj.pk)
+    return updates
+
+
+def _load_batch(rows, stats):
+    country_codes = OrderedDict()
+    for row in rows:
+        if row['country']:
+            country_codes.setdefault(row['country'], row['country_code'])
+    
+    # countries
+    countries = {}
+    for chunk in _chunked(country_codes):
+        for country in Country.objects.filter(name__in=chunk):
+            countries[country.name] = country
+    
+    updates = _updated_codes(countries.values(), dict(
+        (c, _clean_country_code(country_codes[c.name], c.name)) 
+        for c in countries.values()))
+    for (code, pks) in updates.items():
+        stats['countries_updated'] += Country.objects.filter(pk__in=pks)\
+                                                     .update(code=code)
+    
+    missing = [Country(name=name, code=_clean_country_code(code, name))
+               for (name, code) in country_codes.items() 
+               if name not in countries]
+    for country in _bulk_insert(missing, 'name'):
+        countries[country.name] = country
+        stats['countries_created'] += 1
+    
+    # states
+    state_codes, state_points = OrderedDict(), {}
+    for row in rows:
+        if row['state'] and row['country']:
+            key = (row['state'], countries[row['country']].pk)
+            state_codes.setdefault(key, row['state_code'])
+            if row.get('point'):
+                state_points.setdefault(key, row['point'])
+    
+    states = {}
+    for chunk in _chunked(state_codes):
+        query = State.objects.filter(name__in=set(k[0] for k in chunk),
+                                     country__in=set(k[1] for k in chunk))\
+                             .order_by()
+        for state in query:
+            key = (state.name, state.country_id)
+            if key in state_codes:
+                states[key] = state
+    
+    updates = _updated_codes(states.values(), dict(
+        (s, _clean_state_code(state_codes[(s.name, s.country_id)], s.name))
+        for s in states.values()))
+    for (code, pks) in updates.items():
+        stats['states_updated'] += State.objects.filter(pk__in=pks)\
+                                                .update(code=code)
+    for (key, state) in states.items():
+        point = state_points.get(key)
+        if point and point != (state.latitude, state.longitude):
+            stats['states_updated'] += State.objects.filter(pk=state.pk)\
+                .update(latitude=point[0], longitude=point[1])
+    
+    missing = []
+    for ((name, country_id), code) in state_codes.items():
+        if (name, country_id) not in states:
+            point = state_points.get((name, country_id), (None, None))
+            missing.append(State(name=name, country_id=country_id,
+                                 code=_clean_state_code(code, name),
+                                 latitude=point[0], longitude=point[1]))
+    stats['states_created'] += len(_bulk_insert(missing, 'name', 'country_id'))
+
+
+def load_regions(rows, batch_size=500, progress=None):
+    """Creates or updates the countries and states of `rows`, as yielded by
+    `read_regions`, one batch of rows per transaction. Existing rows are
+    matched by name and only have their code updated, so loading the same
+    rows again changes nothing. `progress` is called with the number of
+    rows loaded so far after each batch.
+    
+    Returns a dict of counts of the countries and states created and 
+    updated.
+    """
+    stats = dict(rows=0, countries_created=0, countries_updated=0,
+                 states_created=0, states_updated=0)
+    
+    def flush(batch):
+        with transaction.atomic():
+            _load_batch(batch, stats)
+        stats['rows'] += len(batch)
+        if progress:
+            progress(stats['rows'])
+    
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    
+    # bulk operations send no signals
+    regions.invalidate()
+    geocoder.clear()
+    parser.clear()
+    return stats
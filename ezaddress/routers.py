@@ -0,0 +1,101 @@
+"""
+ezaddress database routing
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+
+__all__ = ['ReplicaRouter', 'replica_alias', 'pin_to_primary', 'unpin',
+           'pinned_to_primary']
+
+
+_local = threading.local()
+
+
+def replica_alias():
+    return getattr(settings, 'EZADDRESS_REPLICA_DATABASE', None)
+
+
+class pin_to_primary(object):
+    """Sends the reads of the current thread to the primary database, so 
+    the rows it wrote are read back even before they reach the replica.
+    
+    Called on its own the pin lasts until `unpin` is called, which is done
+    as each request starts and finishes. Used as a context manager, e.g. 
+    by tasks running outside of requests, the pin is lifted on exit unless
+    the thread was pinned already.
+    """
+    
+    def __init__(self):
+        self._pinned = pinned_to_primary()
+        _local.pinned = True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.pinned = self._pinned
+
+
+def unpin():
+    _local.pinned = False
+
+
+def pinned_to_primary():
+    return getattr(_local, 'pinned', False)
+
+
+def reset_pinning(sender, **kwargs):
+    """Signal handler lifting the pin of the thread handling a request as 
+    it starts and finishes.
+    """
+    unpin()
+
+
+class ReplicaRouter(object):
+    """A database router sending the reads of ezaddress models to the 
+    database named by the `EZADDRESS_REPLICA_DATABASE` setting, and their
+    writes to the default one.
+    
+    Address resolution looks countries, states and addresses up on the 
+    replica and only turns to the primary to create rows; once it has, the
+    reads of the thread go to the primary until the request ends, see
+    `pin_to_primary`.
+    """
+    
+    def _routed(self, model):
+        return model._meta.app_label == 'ezaddress'
+    
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and self._routed(model) and not pinned_to_primary():
+            return alias
+        return None
+    
+    def db_for_write(self, model, **hints):
+        if self._routed(model):
+            return DEFAULT_DB_ALIAS
+        # objects related to rows read from the replica are written to the
+        # primary too, whatever their model
+        instance = hints.get('instance')
+        alias = replica_alias()
+        if alias and instance is not None and instance._state.db == alias:
+            return DEFAULT_DB_ALIAS
+        return None
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same ezaddress rows as the primary, so those
+        # may be related to objects of either; other objects must come from
+        # the primary
+        alias = replica_alias()
+        if not alias or not (self._routed(obj1) or self._routed(obj2)):
+            return None
+        for obj in (obj1, obj2):
+            db = obj._state.db
+            if db != DEFAULT_DB_ALIAS and \
+               (db != alias or not self._routed(obj)):
+                return None
+        return True
@@ -0,0 +1,56 @@
+"""
+ezaddress signals
+"""
+import threading
+from collections import Counter
+
+from django.dispatch import Signal
+
+
+
+__all__ = ['address_resolved', 'addresses_created', 'ResolutionCounter', 
+           'MATCHED', 'UPDATED', 'CREATED']
+
+
+# outcomes of resolving a value into an address
+MATCHED = 'matched'     # an existing address was returned unchanged
+UPDATED = 'updated'     # an existing address had its GPS values updated
+CREATED = 'created'     # a new address was stored
+
+
+# sent by `to_address` and `to_addresses` for each value resolved into an
+# address, with the address and one of the outcomes above
+address_resolved = Signal(providing_args=['address', 'outcome'])
+
+# sent by `to_addresses` with the addresses it stores using `bulk_create`,
+# which sends no `post_save` signals
+addresses_created = Signal(providing_args=['addresses'])
+
+
+class ResolutionCounter(object):
+    """Counts address resolutions by outcome while connected to the 
+    `address_resolved` signal.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+    
+    def __call__(self, sender, outcome, **kwargs):
+        with self._lock:
+            self.counts[outcome] += 1
+    
+    def connect(self):
+        address_resolved.connect(self, weak=False, dispatch_uid=id(self))
+        return self
+    
+    def disconnect(self):
+        address_resolved.disconnect(dispatch_uid=id(self))
+    
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+    
+    @property
+    def writes(self):
+        return self.counts[UPDATED] + self.counts[CREATED]
@@ -1,3 +1,15 @@
 """
 ezaddress.tests package
-"""
\ No newline at end of file
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+
+def run_commit_hooks(using=DEFAULT_DB_ALIAS):
+    """Runs the `on_commit` callbacks registered so far, as the commit of
+    the transaction wrapping a TestCase, which never happens, would.
+    """
+    connection = connections[using]
+    hooks, connection.run_on_commit = connection.run_on_commit, []
+    for (sids, func) in hooks:
+        func()
@@ -0,0 +1,12 @@
+"""
+Coroutines for the asyncio tests; requires python 3.5 or later.
+"""
+import asyncio
+
+
+
+async def gather(*coros):
+    """Runs `coros` concurrently on the running loop, returning their 
+    results, or the exceptions they raised, in order.
+    """
+    return await asyncio.gather(*coros, return_exceptions=True)
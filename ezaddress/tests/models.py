@@ -0,0 +1,47 @@
+from django.db import models
+
+from ezaddress.geo import GeoManager
+from ezaddress.models import Addressable, AddressableCompat, \
+     AddressableManager, AddressField, AddressAwareManager, \
+     FormattedAddressable, GPSLocatable
+
+
+
+class Office(Addressable):
+    name = models.CharField(max_length=50)
+    
+    objects = AddressableManager()
+
+
+class Branch(FormattedAddressable):
+    name = models.CharField(max_length=50)
+
+
+class Shop(Addressable):
+    """An Addressable model being converted to an AddressField."""
+    name = models.CharField(max_length=50)
+    address = AddressField(blank=True, null=True)
+
+
+class Store(AddressableCompat, models.Model):
+    """An Addressable model converted to an AddressField."""
+    name = models.CharField(max_length=50)
+    address = AddressField(lazy=True, blank=True, null=True)
+
+
+class Contact(models.Model):
+    name = models.CharField(max_length=50)
+    address = AddressField(blank=True, null=True)
+
+
+class Delivery(models.Model):
+    reference = models.CharField(max_length=20)
+    address = AddressField(lazy=True)
+    
+    objects = AddressAwareManager()
+
+
+class Site(GPSLocatable):
+    name = models.CharField(max_length=50)
+    
+    objects = GeoManager()
@@ -0,0 +1,84 @@
+import sys
+from unittest import skipIf
+
+from django.core.exceptions import ValidationError
+from django.test import TransactionTestCase, override_settings
+
+from ezaddress.models import Address, Country
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from ezaddress import aio
+    from ezaddress.tests.coroutines import gather
+
+
+
+@skipIf(sys.version_info < (3, 5), 'requires python 3.5 or later')
+class AsyncResolutionTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.resolver = aio.AddressResolver()
+        self.hops = []
+        run = self.resolver.run
+        def counting_run(func, *args, **kwargs):
+            self.hops.append(func)
+            return run(func, *args, **kwargs)
+        self.resolver.run = counting_run
+        
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.addCleanup(self.resolver.shutdown)
+    
+    def run_all(self, *coros):
+        return self.loop.run_until_complete(gather(*coros))
+    
+    def test_concurrent_values_are_resolved_in_one_batch(self):
+        values = [{
+            'raw': '%s Bank Road, Eko, Lagos, Nigeria' % (i % 5),
+            'street': '%s Bank Road' % (i % 5), 'town_city': 'Eko',
+            'state': 'Lagos', 'country': 'Nigeria',
+        } for i in range(20)] + ['1 Alu Avenue']
+        
+        results = self.run_all(*[self.resolver.resolve(v) for v in values])
+        self.assertEqual(len(self.hops), 1)
+        self.assertEqual(Address.objects.count(), 6)
+        self.assertEqual(results[0].pk, results[5].pk)
+        self.assertEqual(results[-1].raw, '1 Alu Avenue')
+    
+    def test_batches_are_limited_in_size(self):
+        self.resolver.max_batch = 4
+        values = ['%d Alu Avenue' % i for i in range(10)]
+        results = self.run_all(*[self.resolver.resolve(v) for v in values])
+        self.assertEqual(len(self.hops), 3)
+        self.assertEqual([addr.raw for addr in results], values)
+    
+    def test_pool_size(self):
+        self.assertEqual(self.resolver.workers, 4)
+        with override_settings(EZADDRESS_RESOLVER_WORKERS=2):
+            resolver = aio.AddressResolver()
+        self.addCleanup(resolver.shutdown)
+        self.assertEqual(resolver._executor._max_workers, 2)
+        self.assertEqual(aio.AddressResolver(workers=1).workers, 1)
+    
+    def test_invalid_values_fail_alone(self):
+        results = self.run_all(self.resolver.resolve('1 Alu Avenue'),
+                               self.resolver.resolve(1.5))
+        self.assertEqual(results[0].raw, '1 Alu Avenue')
+        self.assertIsInstance(results[1], ValidationError)
+    
+    def test_module_functions(self):
+        addrs, = self.run_all(aio.ato_addresses(['1 Alu Avenue', 'X']))
+        addr, = self.run_all(aio.ato_address('1 Alu Avenue'))
+        self.assertEqual(addr.pk, addrs[0].pk)
+        
+        queryset = Address.objects.filter(raw='X')
+        found = self.run_all(aio.aget(Address.objects, raw='X'),
+                             aio.afirst(queryset), aio.acount(queryset),
+                             aio.alist(Address.objects.order_by('pk')))
+        self.assertEqual(found[0].pk, addrs[1].pk)
+        self.assertEqual(found[1].pk, addrs[1].pk)
+        self.assertEqual(found[2], 1)
+        self.assertEqual(found[3], addrs)
+        
+        missing, = self.run_all(aio.aget(Country.objects, name='Nigeria'))
+        self.assertIsInstance(missing, Country.DoesNotExist)
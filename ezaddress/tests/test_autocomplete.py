@@ -0,0 +1,124 @@
+import json
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from ezaddress.autocomplete import address_tokens
+from ezaddress.dedupe import merge_addresses
+from ezaddress.forms import AddressWidget
+from ezaddress.models import Address, State, to_address, to_addresses
+from ezaddress.tests import run_commit_hooks
+from ezaddress.views import autocomplete
+
+
+
+@override_settings(EZADDRESS_AUTOCOMPLETE=True)
+class AutocompleteTestCase(TestCase):
+
+    def setUp(self):
+        self.addr = to_address({
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'postal_code': '720015',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+        })
+        self.others = to_addresses(['5 Bankole Street, Ikeja',
+                                    '2 Airport Road, Abuja'])
+    
+    def search(self, prefix, limit=10):
+        addrs = Address.objects.autocomplete(prefix, limit)
+        return [addr.pk for addr in addrs]
+    
+    def test_address_tokens(self):
+        self.assertEqual(address_tokens(self.addr), [
+            '1', '720015', 'bank', 'eko', 'lagos', 'nigeria', 'no', 'road'])
+    
+    def test_prefix_search(self):
+        self.assertEqual(self.search('ban'),
+                         [self.addr.pk, self.others[0].pk])
+        self.assertEqual(self.search('Bank  Ro'), [self.addr.pk])
+        self.assertEqual(self.search('road'),
+                         [self.addr.pk, self.others[1].pk])
+        self.assertEqual(self.search('nig'), [self.addr.pk])
+        self.assertEqual(self.search('ro', limit=1), [self.addr.pk])
+        self.assertEqual(self.search('  '), [])
+        self.assertEqual(self.search('zz'), [])
+    
+    def test_search_issues_single_query(self):
+        with self.assertNumQueries(1):
+            self.search('bank road eko')
+    
+    def test_index_follows_changes(self):
+        self.addr.raw, self.addr.street = '7 Marina, Eko', '7 Marina'
+        self.addr.save()
+        self.assertEqual(self.search('bank'), [self.others[0].pk])
+        self.assertEqual(self.search('marina'), [self.addr.pk])
+        
+        # gps updates leave the index alone
+        with self.assertNumQueries(4):
+            to_address({'raw': self.addr.raw, 'street': '7 Marina',
+                        'town_city': 'Eko', 'postal_code': '720015',
+                        'state': 'Lagos', 'country': 'Nigeria',
+                        'latitude': 6.45})
+        
+        # states saved with the same names leave the index alone
+        lagos = State.objects.get(name='Lagos')
+        lagos.latitude = 6.5
+        lagos.save()
+        with CaptureQueriesContext(connection) as queries:
+            run_commit_hooks()
+        self.assertFalse([q for q in queries 
+                          if 'ezaddress_addresstoken' in q['sql']])
+        
+        lagos.name = 'Eko State'
+        lagos.save()
+        self.assertEqual(self.search('eko st'), [])
+        run_commit_hooks()
+        self.assertEqual(self.search('eko st'), [self.addr.pk])
+        
+        self.others[1].delete()
+        self.assertEqual(self.search('road'), [])
+    
+    def test_merged_addresses_keep_their_tokens(self):
+        merge_addresses(self.others[0], [self.others[1]])
+        self.assertEqual(self.search('bankole'), [self.others[0].pk])
+        self.assertEqual(self.search('airport'), [])
+    
+    def test_nothing_is_indexed_when_disabled(self):
+        with self.settings(EZADDRESS_AUTOCOMPLETE=False):
+            addr = to_address('9 Broad Street')
+        self.assertEqual(self.search('broad'), [])
+        
+        out = StringIO()
+        call_command('rebuild_address_index', stdout=out)
+        self.assertEqual(out.getvalue(), 'Indexed 4 addresses.\n')
+        self.assertEqual(self.search('broad'), [addr.pk])
+    
+    def test_view(self):
+        request = RequestFactory().get('/', {'q': 'bank r', 'limit': 'x'})
+        data = json.loads(autocomplete(request).content.decode('utf-8'))
+        self.assertEqual(data['results'], [{
+            'id': self.addr.pk,
+            'text': str(self.addr),
+            'address': self.addr.as_dict(),
+        }])
+        
+        for limit in ('-1', '0'):
+            request = RequestFactory().get('/', {'q': 'road', 'limit': limit})
+            data = json.loads(autocomplete(request).content.decode('utf-8'))
+            self.assertEqual(len(data['results']), 1)
+
+
+class AddressWidgetTestCase(TestCase):
+
+    def test_autocomplete_url_attribute(self):
+        widget = AddressWidget(autocomplete_url='/address/autocomplete/')
+        self.assertIn('data-autocomplete-url="/address/autocomplete/"',
+                      widget.render('address', ''))
+        self.assertNotIn('data-autocomplete-url',
+                         AddressWidget().render('address', ''))
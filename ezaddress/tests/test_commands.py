@@ -0,0 +1,522 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from ezaddress.dedupe import find_duplicate_addresses, merge_addresses
+from ezaddress.models import Address, Country, State, to_address
+from ezaddress.parser import parser
+from ezaddress.tests.models import Contact, Shop, Store
+
+
+
+class DedupeAddressesTestCase(TestCase):
+
+    def setUp(self):
+        ng = Country.objects.create(name='Nigeria', code='NG')
+        self.lagos = State.objects.create(name='Lagos', code='LG', country=ng)
+    
+    def _create_legacy(self, **kwargs):
+        # mimic rows stored before fingerprints were introduced
+        Address.objects.bulk_create([Address(**kwargs)])
+        return Address.objects.order_by('pk').last()
+    
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('dedupe_addresses', *args, stdout=out, **kwargs)
+        return out.getvalue()
+    
+    def test_fingerprint_folds_case_whitespace_and_punctuation(self):
+        addr1 = Address.objects.create(raw='x', street='No. 1 Bank Road', 
+                                       town_city='Eko', state=self.lagos)
+        addr2 = Address(raw='y', street='no 1  bank road', 
+                        town_city='EKO', state=self.lagos)
+        self.assertEqual(addr1.fingerprint, addr2.get_fingerprint())
+        self.assertNotEqual(addr1.fingerprint, 
+                            Address(raw='no 1 bank road').get_fingerprint())
+    
+    def test_to_address_matches_normalized_address(self):
+        addr = to_address({'raw': 'No 1 Bank Road', 'street': 'No 1 Bank Road',
+                           'town_city': 'Eko', 'state': 'Lagos', 
+                           'country': 'Nigeria'})
+        match = to_address({'raw': 'no. 1 bank road', 'street': 'NO. 1 BANK RD.',
+                            'town_city': 'eko', 'state': 'Lagos', 
+                            'country': 'Nigeria'})
+        self.assertNotEqual(addr.pk, match.pk)
+        match = to_address({'raw': 'no. 1 bank road', 'street': 'no. 1 bank road',
+                            'town_city': 'eko', 'state': 'Lagos', 
+                            'country': 'Nigeria'})
+        self.assertEqual(addr.pk, match.pk)
+    
+    def test_backfill_and_merge(self):
+        addr1 = self._create_legacy(raw='1 Alu Avenue')
+        addr2 = self._create_legacy(raw='1, Alu Avenue')
+        addr3 = self._create_legacy(raw='2 Alu Avenue')
+        addr4 = Address.objects.create(raw='3 Alu Avenue')
+        addr5 = self._create_legacy(raw='3 Alu Avenue.')
+        contact = Contact.objects.create(name='Ade', address=addr2)
+        
+        output = self.call_command(batch_size=2)
+        self.assertIn('Fingerprinted 2 addresses and merged 2 duplicates', 
+                      output)
+        self.assertEqual(
+            sorted(Address.objects.values_list('pk', flat=True)),
+            [addr1.pk, addr3.pk, addr4.pk])
+        self.assertEqual(Contact.objects.get(pk=contact.pk).address_id, addr1.pk)
+        self.assertFalse(Address.objects.filter(fingerprint=None).exists())
+    
+    def test_saved_fields_update_the_fingerprint(self):
+        addr = Address.objects.create(raw='1 Alu Avenue')
+        addr.raw = '2 Alu Avenue'
+        addr.save(update_fields=['raw'])
+        self.assertEqual(Address.objects.get().fingerprint, 
+                         Address(raw='2 Alu Avenue').get_fingerprint())
+    
+    def test_forced_backfill_ignores_stale_fingerprints(self):
+        addr1 = Address.objects.create(raw='1 Alu Avenue')
+        addr2 = Address.objects.create(raw='2 Alu Avenue')
+        # changed behind the models' back, the stored fingerprints are stale
+        Address.objects.filter(pk=addr1.pk).update(raw='2 Alu Avenue')
+        Address.objects.filter(pk=addr2.pk).update(raw='3 Alu Avenue')
+        
+        output = self.call_command(batch_size=1, force=True)
+        self.assertIn('Fingerprinted 2 addresses and merged 0 duplicates', 
+                      output)
+        for addr in Address.objects.all():
+            self.assertEqual(addr.fingerprint, addr.get_fingerprint())
+        self.assertEqual(Address.objects.count(), 2)
+    
+    def test_dry_run_leaves_duplicates(self):
+        self._create_legacy(raw='1 Alu Avenue')
+        self._create_legacy(raw='1 Alu Avenue')
+        output = self.call_command(dry_run=True)
+        self.assertIn('Would have fingerprinted 1 addresses and merged 1', 
+                      output)
+        self.assertEqual(Address.objects.filter(fingerprint=None).count(), 2)
+    
+    def test_merge_addresses(self):
+        addr1 = Address.objects.create(raw='1 Alu Avenue')
+        addr2 = Address.objects.create(raw='1 Alu Avenue, Eko')
+        Contact.objects.create(name='Ade', address=addr2)
+        merge_addresses(addr1, [addr2.pk])
+        self.assertEqual(Contact.objects.get().address_id, addr1.pk)
+        self.assertFalse(Address.objects.filter(pk=addr2.pk).exists())
+
+
+class MergeDuplicateAddressesTestCase(TestCase):
+
+    def setUp(self):
+        ng = Country.objects.create(name='Nigeria', code='NG')
+        self.lagos = State.objects.create(name='Lagos', code='LG', country=ng)
+        self.abuja = State.objects.create(name='Abuja', code='FC', country=ng)
+        def create(street, town_city, postal_code='', state=self.lagos):
+            return Address.objects.create(
+                raw='%s, %s' % (street, town_city), street=street, 
+                town_city=town_city, postal_code=postal_code, state=state)
+        self.addrs = [
+            create('12 Broad Street', 'Lagos Island', '101001'),
+            create('12 Broad St.', 'Lagos Island'),
+            create('12 Broad Street', 'Lagos Islnd', '101001'),
+            create('12 Broad Street', 'Lagos Island', '101002'),
+            create('12 Broad Street', 'Lagos Island', state=self.abuja),
+            create('7 Marina Road', 'Lagos Island'),
+            create('7 Marina Rd', 'Lagos Island'),
+            create('40 Allen Avenue', 'Ikeja'),
+            Address.objects.create(raw='1 Alu Avenue, Ikeja'),
+            Address.objects.create(raw='1 Alu Ave, Ikeja'),
+            # neighbours, told apart by their numbers only
+            create('14 Broad Street', 'Lagos Island', '101001'),
+            create('Flat 3, 25 Awolowo Road', 'Ikoyi'),
+            create('Flat 5, 25 Awolowo Road', 'Ikoyi'),
+        ]
+        self.contact = Contact.objects.create(name='A', address=self.addrs[2])
+    
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('merge_duplicate_addresses', *args, stdout=out, 
+                     **kwargs)
+        return out.getvalue()
+    
+    def test_finding_clusters(self):
+        pks = [addr.pk for addr in self.addrs]
+        self.assertEqual(list(find_duplicate_addresses()), [
+            [pks[8], pks[9]], [pks[0], pks[1], pks[2]], [pks[5], pks[6]]])
+        self.assertEqual(list(find_duplicate_addresses(threshold=0.95)), [
+            [pks[8], pks[9]], [pks[0], pks[1]], [pks[5], pks[6]]])
+        self.assertEqual(list(find_duplicate_addresses(
+            Address.objects.filter(state=self.abuja))), [])
+    
+    def test_neighbouring_numbers_are_not_duplicates(self):
+        neighbours = set(addr.pk for addr in self.addrs[10:])
+        for threshold in (0.7, 0.5, 0.1):
+            for cluster in find_duplicate_addresses(threshold=threshold):
+                self.assertFalse(neighbours & set(cluster), cluster)
+    
+    def test_merging_clusters(self):
+        out = self.call_command(verbosity=2)
+        self.assertEqual(out.splitlines()[-1], 
+                         'Would have merged 4 addresses into 3 others.')
+        self.assertIn('%d <- %d, %d' % (self.addrs[0].pk, self.addrs[1].pk,
+                                        self.addrs[2].pk), out)
+        self.assertEqual(Address.objects.count(), 13)
+        
+        self.assertEqual(self.call_command(merge=True), 
+                         'Merged 4 addresses into 3 others.\n')
+        self.assertEqual(Address.objects.count(), 9)
+        self.assertEqual(Contact.objects.get().address_id, self.addrs[0].pk)
+        self.assertEqual(self.call_command(merge=True), 
+                         'Merged 0 addresses into 0 others.\n')
+
+
+class LoadRegionsTestCase(TestCase):
+
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('load_ezaddress_regions', *args, stdout=out, **kwargs)
+        return out.getvalue()
+    
+    def _write_regions(self, ext, content):
+        fd, path = tempfile.mkstemp(suffix=ext)
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+    
+    def test_loading_bundled_regions(self):
+        output = self.call_command(batch_size=1000)
+        self.assertIn('Loaded 1000 rows...', output)
+        self.assertGreater(Country.objects.count(), 240)
+        self.assertGreater(State.objects.count(), 3000)
+        lagos = State.objects.get(name='Lagos')
+        self.assertEqual((lagos.code, lagos.country.code), ('LA', 'NG'))
+        
+        # loading again changes nothing
+        with CaptureQueriesContext(connection) as queries:
+            output = self.call_command(batch_size=1000)
+        self.assertFalse([q for q in queries
+                          if q['sql'].startswith(('INSERT', 'UPDATE'))])
+        self.assertIn('0 countries created, 0 updated; 0 states created, '
+                      '0 updated', output)
+    
+    def test_existing_regions_are_updated(self):
+        ng = Country.objects.create(name='Nigeria')
+        State.objects.create(name='Lagos', code='LG', country=ng)
+        path = self._write_regions('.csv', 
+            'country_code,country,state_code,state\n'
+            'NG,Nigeria,LA,Lagos\n'
+            'NG,Nigeria,KN,Kano\n'
+            'GH,Ghana,,\n')
+        self.addCleanup(parser.clear)
+        self.assertIsNone(parser.parse('Kano, Kano, Nigeria'))
+        output = self.call_command(path)
+        self.assertEqual(parser.parse('Kano, Kano, Nigeria')['state'], 'Kano')
+        self.assertIn('Loaded 3 rows: 1 countries created, 1 updated; '
+                      '1 states created, 1 updated', output)
+        self.assertEqual(Country.objects.get(name='Nigeria').code, 'NG')
+        self.assertEqual(State.objects.get(name='Lagos').code, 'LA')
+        self.assertEqual(State.objects.get(name='Kano').country, ng)
+        
+        # nothing is written at verbosity 0
+        self.assertEqual(self.call_command(path, verbosity=0), '')
+    
+    def test_loading_state_points(self):
+        ng = Country.objects.create(name='Nigeria')
+        State.objects.create(name='Lagos', country=ng)
+        path = self._write_regions('.csv', 
+            'country,state,latitude,longitude\n'
+            'Nigeria,Lagos,6.52,3.37\n'
+            'Nigeria,Kano,12.0,8.52\n'
+            'Nigeria,Oyo,,\n')
+        output = self.call_command(path)
+        self.assertIn('2 states created, 1 updated', output)
+        points = dict((s.name, (s.latitude, s.longitude)) 
+                      for s in State.objects.all())
+        self.assertEqual(points, {'Lagos': (6.52, 3.37), 
+                                  'Kano': (12.0, 8.52), 'Oyo': (None, None)})
+        
+        with self.assertRaises(CommandError):
+            self.call_command(self._write_regions('.csv',
+                'country,state,latitude,longitude\n'
+                'Nigeria,Kano,120,8.52\n'))
+    
+    def test_loading_json_files(self):
+        rows = [{'country_code': 'NG', 'country': 'Nigeria', 
+                 'state_code': 'LA', 'state': 'Lagos'},
+                {'country': 'Ghana', 'state': 'Accra'}]
+        for (ext, content) in (
+                ('.json', json.dumps(rows)), 
+                ('.jsonl', '\n'.join(json.dumps(row) for row in rows))):
+            self.call_command(self._write_regions(ext, content))
+            self.assertEqual(State.objects.count(), 2)
+            self.assertEqual(State.objects.get(name='Accra').country.name, 
+                             'Ghana')
+    
+    def test_invalid_files_are_rejected(self):
+        with self.assertRaises(CommandError):
+            self.call_command(self._write_regions('.txt', ''))
+        path = self._write_regions('.jsonl', json.dumps(
+            {'country': 'Nigeria', 'country_code': 'Nigeria, Republic of'}))
+        with self.assertRaises(CommandError):
+            self.call_command(path)
+
+
+class DumpAddressesTestCase(TestCase):
+
+    def setUp(self):
+        to_address({'raw': 'No. 1 Bank Road, Eko, Lagos, Nigeria', 
+                    'street': 'No. 1 Bank Road', 'town_city': 'Eko', 
+                    'state': 'Lagos', 'country': 'Nigeria', 
+                    'latitude': 6.45, 'longitude': 3.39})
+        to_address('1 Alu Avenue')
+        self.expected = [addr.as_dict() 
+                         for addr in Address.objects.order_by('pk')]
+    
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('dump_addresses', *args, stdout=out, **kwargs)
+        return out.getvalue()
+    
+    def test_dumping_json_lines(self):
+        output = self.call_command()
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                         self.expected)
+    
+    def test_dumping_csv_to_file(self):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        
+        output = self.call_command(path)
+        self.assertEqual(output, 'Wrote 2 addresses to %s.\n' % path)
+        with io.open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[0]['state_code'], self.expected[0]['state_code'])
+        self.assertEqual(float(rows[0]['latitude']), 6.45)
+        self.assertEqual((rows[1]['raw'], rows[1]['state']), 
+                         ('1 Alu Avenue', ''))
+
+
+class ImportAddressesTestCase(TestCase):
+
+    def setUp(self):
+        self.existing = to_address('1 Alu Avenue')
+    
+    def write_file(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+    
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('import_addresses', *args, stdout=out, **kwargs)
+        return out.getvalue()
+    
+    def test_importing_csv(self):
+        path = self.write_file('.csv', 
+            u'raw,street,town_city,state,country,latitude,gps_error\n'
+            u'"2 Marina, Eko",2 Marina,Eko,Lagos,Nigeria,6.45,\n'
+            u'1 Alu Avenue,,,,,,\n'
+            u'3 Broad Street,,,,,north,\n'
+            u',4 Ring Road,,,,,\n'
+            u'5 Ring Road,,,,,,x\n')
+        rejects = self.write_file('.jsonl', u'')
+        
+        out = self.call_command(path, rejects=rejects, chunk_size=2)
+        self.assertRegexpMatches(out.splitlines()[-1], 
+            r'^Imported 2 rows and rejected 3 \(\d+ rows/s\)\.$')
+        self.assertEqual(len(out.splitlines()), 4)
+        
+        addr = Address.objects.get(street='2 Marina')
+        self.assertEqual((str(addr), addr.latitude, addr.gps_error),
+                         ('2 Marina, Eko, Lagos, Nigeria', 6.45, None))
+        self.assertEqual(Address.objects.count(), 2)
+        with io.open(rejects, encoding='utf-8') as f:
+            errors = [json.loads(line) for line in f]
+        self.assertEqual([e['error'] for e in errors], [
+            'Invalid value for latitude', 'Missing raw value',
+            'Invalid value for gps_error'])
+        self.assertEqual(errors[0]['row']['raw'], '3 Broad Street')
+    
+    def test_importing_json_lines_in_worker_processes(self):
+        rows = [{'raw': '%d Marina' % i, 'latitude': str(i)} 
+                for i in range(10)]
+        rows[4] = {'raw': '4 Marina', 'state': 'Lagos', 'state_code': 'LAG1',
+                   'country': 'Nigeria'}
+        lines = [json.dumps(row) for row in rows] + ['{"raw": ', '[]']
+        path = self.write_file('.jsonl', u'\n'.join(lines) + u'\n')
+        rejects = self.write_file('.jsonl', u'')
+        
+        out = self.call_command(path, workers=2, chunk_size=3,
+                                rejects=rejects, verbosity=0)
+        self.assertRegexpMatches(out, 
+            r'^Imported 9 rows and rejected 3 \(\d+ rows/s\)\.\n$')
+        self.assertEqual(Address.objects.get(raw='9 Marina').latitude, 9.0)
+        self.assertFalse(Address.objects.filter(raw='4 Marina').exists())
+        with io.open(rejects, encoding='utf-8') as f:
+            errors = [json.loads(line)['error'] for line in f]
+        self.assertEqual(errors, ['Invalid state code (too long): LAG1',
+                                  'Invalid JSON', 'Not an address object'])
+    
+    def test_rows_the_database_rejects_are_rejected(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TRIGGER reject_boom BEFORE INSERT ON "
+                "ezaddress_address WHEN NEW.raw = 'boom' "
+                "BEGIN SELECT RAISE(ABORT, 'no booms'); END")
+        rows = [{'raw': '2 Marina'}, {'raw': 'boom'}, {'raw': 'x' * 201},
+                {'raw': '3 Marina', 'street': '3 Marina', 
+                 'town_city': 'x' * 51, 'state': 'Lagos', 
+                 'country': 'Nigeria'}]
+        path = self.write_file('.jsonl', 
+            u'\n'.join(json.dumps(row) for row in rows) + u'\n')
+        rejects = self.write_file('.jsonl', u'')
+        
+        out = self.call_command(path, rejects=rejects, verbosity=0)
+        self.assertRegexpMatches(out, r'^Imported 1 rows and rejected 3 ')
+        self.assertTrue(Address.objects.filter(raw='2 Marina').exists())
+        with io.open(rejects, encoding='utf-8') as f:
+            errors = [json.loads(line)['error'] for line in f]
+        self.assertEqual(errors, ['Value too long for raw',
+                                  'Value too long for town_city',
+                                  'no booms'])
+    
+    def test_dry_run_writes_nothing(self):
+        path = self.write_file('.jsonl', u'{"raw": "2 Marina"}\n{}\n')
+        out = self.call_command(path, dry_run=True, verbosity=0)
+        self.assertRegexpMatches(out, r'^Would have imported 1 rows and '
+                                      r'rejected 1 ')
+        self.assertEqual(Address.objects.count(), 1)
+    
+    def test_reimporting_dumped_addresses(self):
+        to_address({'raw': '2 Marina, Eko', 'street': '2 Marina', 
+                    'town_city': 'Eko', 'state': 'Lagos', 
+                    'country': 'Nigeria', 'longitude': 3.39})
+        count = Address.objects.count()
+        out = StringIO()
+        call_command('dump_addresses', stdout=out)
+        path = self.write_file('.jsonl', out.getvalue())
+        
+        with CaptureQueriesContext(connection) as queries:
+            output = self.call_command(path, verbosity=0)
+        self.assertTrue(output.startswith(
+            'Imported %d rows and rejected 0 ' % count), output)
+        self.assertEqual(Address.objects.count(), count)
+        self.assertFalse([q for q in queries 
+                          if q['sql'].startswith(('INSERT', 'UPDATE'))])
+    
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            self.call_command('/nonexistent/addresses.csv')
+
+
+class ConvertAddressablesTestCase(TestCase):
+
+    def setUp(self):
+        ng = Country.objects.create(name='Nigeria', code='NG')
+        self.lagos = State.objects.create(name='Lagos', code='LG', country=ng)
+        self.existing = to_address({
+            'raw': 'No 1 Bank Road, Eko, Lagos', 'street': 'No 1 Bank Road',
+            'town_city': 'Eko', 'state': 'Lagos', 'country': 'Nigeria'})
+        self.shops = [
+            Shop.objects.create(name='A', addr_raw='No 1 Bank Road, Eko',
+                                addr_street='no 1 bank road', 
+                                addr_town='Eko', addr_state=self.lagos),
+            Shop.objects.create(name='B', addr_street='2 Marina', 
+                                addr_town='Eko', postal_code='720015',
+                                addr_state=self.lagos),
+            Shop.objects.create(name='C'),
+            Shop.objects.create(name='D', addr_raw='1 Alu Avenue'),
+            Shop.objects.create(name='E', addr_raw='1 Alu Avenue'),
+        ]
+    
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('convert_addressables', *args, stdout=out, **kwargs)
+        return out.getvalue()
+    
+    def test_objects_point_at_deduplicated_addresses(self):
+        out = self.call_command('tests.Shop', batch_size=2)
+        self.assertEqual(out, 'Converted objects up to pk %d...\n'
+                              'Converted objects up to pk %d...\n'
+                              'Converted objects up to pk %d...\n'
+                              'Converted 4 objects.\n' % (
+                              self.shops[1].pk, self.shops[3].pk, 
+                              self.shops[4].pk))
+        
+        shops = list(Shop.objects.order_by('pk'))
+        self.assertEqual(shops[0].address_id, self.existing.pk)
+        self.assertEqual(str(shops[1].address), 
+                         '2 Marina, Eko 720015, Lagos, Nigeria')
+        self.assertEqual(shops[1].address.raw, str(shops[1].address))
+        self.assertIsNone(shops[2].address)
+        self.assertEqual(shops[3].address_id, shops[4].address_id)
+        self.assertEqual(Address.objects.count(), 3)
+        for shop in shops[1:]:
+            self.assertEqual(shop.get_address_str(), 
+                             str(shop.address) if shop.address else '')
+    
+    def test_objects_keep_their_state(self):
+        pt = Country.objects.create(name='Portugal', code='PT')
+        algarve = State.objects.create(name='Lagos', country=pt)
+        shop = Shop.objects.create(name='F', addr_street='1 Rua Direita',
+                                   addr_town='Lagos', addr_state=algarve)
+        self.call_command('tests.Shop', verbosity=0)
+        shop.refresh_from_db()
+        self.assertEqual(shop.address.state, algarve)
+        self.assertEqual(str(shop.address), 
+                         '1 Rua Direita, Lagos, Lagos, Portugal')
+    
+    def test_conversion_resumes(self):
+        self.call_command('tests.Shop', start_after=self.shops[2].pk)
+        self.assertEqual(Shop.objects.exclude(address=None).count(), 2)
+        
+        out = self.call_command('tests.Shop', verbosity=0)
+        self.assertEqual(out, 'Converted 2 objects.\n')
+        self.assertEqual(Shop.objects.exclude(address=None).count(), 4)
+        self.assertEqual(self.call_command('tests.Shop', verbosity=0),
+                         'Converted 0 objects.\n')
+    
+    def test_invalid_arguments(self):
+        with self.assertRaises(CommandError):
+            self.call_command('tests.Nothing')
+        with self.assertRaises(CommandError):
+            self.call_command('tests.Shop', field='name')
+    
+    def test_compatibility_attributes(self):
+        store = Store.objects.create(name='A', address=self.existing)
+        store = Store.objects.get(pk=store.pk)
+        self.assertEqual(store.addr_raw, 'No 1 Bank Road, Eko, Lagos')
+        self.assertEqual(store.addr_street, 'No 1 Bank Road')
+        self.assertEqual(store.addr_town, 'Eko')
+        self.assertEqual(store.addr_state, self.lagos)
+        self.assertEqual(store.postal_code, '')
+        self.assertEqual(store.get_address_str(), 
+                         'No 1 Bank Road, Eko, Lagos, Nigeria')
+        
+        with self.assertNumQueries(0):
+            store.addr_street = '2 Marina'
+            store.postal_code = '720015'
+        store.save()
+        self.assertEqual(Store.objects.get(pk=store.pk).get_address_str(),
+                         '2 Marina, Eko 720015, Lagos, Nigeria')
+        self.assertEqual(Address.objects.get(pk=self.existing.pk).street, 
+                         'No 1 Bank Road')
+        
+        store.addr_state = None
+        store.save()
+        self.assertIsNone(store.address.state)
+        self.assertEqual(store.get_address_str(), store.addr_raw)
+        
+        empty = Store(name='B')
+        self.assertEqual((empty.addr_raw, empty.addr_state), ('', None))
+        self.assertEqual(empty.get_address_str(), '')
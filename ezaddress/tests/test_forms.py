@@ -1,8 +1,13 @@
-from django.forms import Form, ValidationError
-from django.test import TestCase
+from django.db import connection
+from django.forms import CharField, Form, ModelForm, ValidationError, \
+     formset_factory, modelformset_factory
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ezaddress.forms import AddressField, AddressWidget
-from ezaddress.models import Address
+from ezaddress.forms import AddressField, AddressFormMixin, \
+     AddressFormSetMixin
+from ezaddress.models import Address, Country, State
+from ezaddress.tests.models import Contact
 
 
 
@@ -10,6 +15,24 @@ class TestForm(Form):
     address = AddressField()
 
 
+class TravelForm(AddressFormMixin, Form):
+    origin = AddressField()
+    destination = AddressField(required=False)
+
+
+class ContactEntryForm(Form):
+    name = CharField()
+    address = AddressField()
+
+
+class ContactForm(ModelForm):
+    address = AddressField()
+    
+    class Meta:
+        model = Contact
+        fields = ['name', 'address']
+
+
 class AddressFieldTestCase(TestCase):
     
     def setUp(self):
@@ -34,3 +57,85 @@ class AddressFieldTestCase(TestCase):
         addr = self.field.to_python({'raw': 'No 1 Bank Road'})
         self.assertEqual(addr.raw, 'No 1 Bank Road')
     
+
+
+@override_settings(EZADDRESS_PARSER='ezaddress.parser.parse')
+class AddressFormSetTestCase(TestCase):
+
+    def setUp(self):
+        ng = Country.objects.create(name='Nigeria', code='NG')
+        State.objects.create(name='Lagos', code='LA', country=ng)
+        State.objects.create(name='Kano', code='KN', country=ng)
+    
+    def formset_data(self, addresses, prefix='form'):
+        data = {
+            '%s-TOTAL_FORMS' % prefix: str(len(addresses)),
+            '%s-INITIAL_FORMS' % prefix: '0',
+        }
+        for (i, address) in enumerate(addresses):
+            data['%s-%d-name' % (prefix, i)] = 'Contact %d' % i
+            data['%s-%d-address' % (prefix, i)] = address
+        return data
+    
+    def addresses(self, count):
+        return ['%d Broad Street, Ikoyi, %s' % (i, ('Lagos', 'Kano')[i % 2])
+                for i in range(count)]
+    
+    def test_addresses_are_resolved_in_one_batch(self):
+        base = formset_factory(ContactEntryForm, extra=0)
+        batched = type('BatchedFormSet', (AddressFormSetMixin, base), {})
+        
+        with CaptureQueriesContext(connection) as plain:
+            formset = base(self.formset_data(self.addresses(20)))
+            self.assertTrue(formset.is_valid())
+        Address.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            formset = batched(self.formset_data(self.addresses(20)))
+            self.assertTrue(formset.is_valid())
+        self.assertLess(len(queries), 10)
+        self.assertGreater(len(plain), 40)
+        
+        self.assertEqual(
+            [str(f.cleaned_data['address']) for f in formset.forms[:2]],
+            ['0 Broad Street, Ikoyi, Lagos, Nigeria', 
+             '1 Broad Street, Ikoyi, Kano, Nigeria'])
+        self.assertEqual(Address.objects.count(), 20)
+    
+    def test_model_formsets_are_saved(self):
+        base = modelformset_factory(Contact, form=ContactForm, extra=0)
+        batched = type('BatchedFormSet', (AddressFormSetMixin, base), {})
+        formset = batched(self.formset_data(self.addresses(4)))
+        self.assertTrue(formset.is_valid())
+        contacts = formset.save()
+        self.assertEqual(contacts[3].address.state.name, 'Kano')
+        self.assertEqual(Address.objects.count(), 4)
+    
+    def test_repeated_values_share_an_address(self):
+        base = formset_factory(ContactForm, extra=0)
+        batched = type('BatchedFormSet', (AddressFormSetMixin, base), {})
+        formset = batched(self.formset_data(['1 Marina, Lagos'] * 3))
+        self.assertTrue(formset.is_valid())
+        pks = set(f.cleaned_data['address'].pk for f in formset.forms)
+        self.assertEqual(len(pks), 1)
+    
+    def test_field_errors_are_preserved(self):
+        base = formset_factory(ContactForm, extra=0)
+        batched = type('BatchedFormSet', (AddressFormSetMixin, base), {})
+        data = self.formset_data(['1 Marina, Lagos', '', '2 Marina, Lagos'])
+        formset = batched(data)
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(formset.errors[0], {})
+        self.assertEqual(list(formset.errors[1]), ['address'])
+        self.assertEqual(formset.forms[2].cleaned_data['address'].raw,
+                         '2 Marina, Lagos')
+    
+    def test_form_addresses_are_resolved_together(self):
+        form = TravelForm({'origin': '1 Marina, Lagos', 
+                           'destination': '2 Bompai Road, Nassarawa, Kano'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['destination'].state.name, 'Kano')
+        self.assertEqual(Address.objects.count(), 2)
+        
+        form = TravelForm({'origin': {'raw': '1 Marina', 'latitude': 'x'}})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ['origin'])
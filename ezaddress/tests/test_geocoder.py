@@ -0,0 +1,147 @@
+import random
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from ezaddress import geocoder as geocoder_module
+from ezaddress.geo import distance
+from ezaddress.geocoder import StateIndex, backfill_states, geocoder, \
+     reverse_geocode, reverse_geocode_many
+from ezaddress.models import Address, State, to_address
+from ezaddress.regions import load_regions
+from ezaddress.tests.models import Contact
+
+
+
+class StateIndexTestCase(TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.states = [State(name=str(i), latitude=rng.uniform(-85, 85),
+                             longitude=rng.uniform(-180, 180))
+                       for i in range(300)]
+        self.points = [(rng.uniform(-90, 90), rng.uniform(-180, 180))
+                       for i in range(200)]
+        self.index = StateIndex(self.states + [State(name='x')])
+    
+    def brute_force(self, lat, lng):
+        return min(self.states, key=lambda s: 
+                   distance(lat, lng, s.latitude, s.longitude))
+    
+    def test_nearest_state_is_found(self):
+        self.assertEqual(len(self.index), 300)
+        for (lat, lng) in self.points:
+            self.assertIs(self.index.nearest(lat, lng),
+                          self.brute_force(lat, lng))
+    
+    def test_batch_lookups_match_single_ones(self):
+        expected = [self.index.nearest(lat, lng) for (lat, lng) in 
+                    self.points]
+        self.assertEqual(self.index.nearest_many(self.points), expected)
+        
+        numpy = geocoder_module.numpy
+        self.addCleanup(setattr, geocoder_module, 'numpy', numpy)
+        geocoder_module.numpy = None
+        self.assertEqual(self.index.nearest_many(self.points), expected)
+    
+    def test_lookups_across_the_antimeridian(self):
+        index = StateIndex([State(name='east', latitude=0, longitude=179.5),
+                            State(name='west', latitude=0, longitude=170)])
+        self.assertEqual(index.nearest(0, -179.9).name, 'east')
+        self.assertEqual(index.nearest_many([(0, -179.9)])[0].name, 'east')
+    
+    def test_states_beyond_max_distance_are_ignored(self):
+        index = StateIndex([State(name='a', latitude=6.5, longitude=3.4)])
+        self.assertIsNone(index.nearest(9.05, 7.49, max_distance=100))
+        self.assertEqual(index.nearest(9.05, 7.49, max_distance=600).name, 
+                         'a')
+        self.assertEqual(index.nearest_many([(9.05, 7.49), (6.6, 3.3)], 
+                                            max_distance=100), 
+                         [None, index.states[0]])
+        self.assertIsNone(StateIndex([]).nearest(0, 0))
+
+
+class ReverseGeocodingTestCase(TestCase):
+
+    def setUp(self):
+        geocoder.clear()
+        self.addCleanup(geocoder.clear)
+        load_regions([
+            {'country': 'Nigeria', 'country_code': 'NG', 'state': 'Lagos',
+             'state_code': 'LA', 'point': (6.52, 3.37)},
+            {'country': 'Nigeria', 'country_code': 'NG', 'state': 'Kano',
+             'state_code': 'KN', 'point': (12.0, 8.52)},
+            {'country': 'Nigeria', 'country_code': 'NG', 'state': 'Oyo',
+             'state_code': 'OY', 'point': None},
+        ])
+        self.lagos = State.objects.get(name='Lagos')
+    
+    def test_reverse_geocoding(self):
+        self.assertEqual(reverse_geocode(6.45, 3.39), self.lagos)
+        self.assertEqual(str(reverse_geocode(11.9, 8.6)), 'Kano, Nigeria')
+        self.assertEqual([str(s) for s in reverse_geocode_many(
+                          [(6.45, 3.39), (11.9, 8.6)])],
+                         ['Lagos, Nigeria', 'Kano, Nigeria'])
+        
+        # the index follows changes to states
+        self.lagos.latitude, self.lagos.longitude = 12.1, 8.5
+        self.lagos.save()
+        self.assertEqual(reverse_geocode(12.2, 8.5), self.lagos)
+    
+    def test_backfilling_states(self):
+        existing = to_address({
+            'raw': '2 Marina, Eko', 'street': '2 Marina', 'town_city': 'Eko',
+            'state': 'Lagos', 'country': 'Nigeria'})
+        addrs = [
+            Address.objects.create(raw='Eko market', latitude=6.45, 
+                                   longitude=3.39),
+            Address.objects.create(raw='2 Marina Eko', street='2 Marina', 
+                                   town_city='Eko', latitude=6.45, 
+                                   longitude=3.4),
+            Address.objects.create(raw='Kano market', town_city='Kano',
+                                   latitude=11.9, longitude=8.6),
+            Address.objects.create(raw='Gulf of Guinea', latitude=0, 
+                                   longitude=3),
+            Address.objects.create(raw='Somewhere'),
+        ]
+        Contact.objects.create(name='A', address=addrs[1])
+        Address.objects.filter(pk=addrs[4].pk).update(fingerprint=None)
+        
+        out = StringIO()
+        call_command('backfill_address_states', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue(), 'Would have set the state of 4 of '
+                                         '4 addresses.\n')
+        
+        stats = backfill_states(batch_size=2, max_distance=300)
+        self.assertEqual(stats, {'examined': 4, 'updated': 3})
+        states = dict(Address.objects.values_list('raw', 'state__name'))
+        self.assertEqual(states, {
+            '2 Marina, Eko': 'Lagos', 'Eko market': 'Lagos', 
+            'Kano market': 'Kano', 'Gulf of Guinea': None, 
+            'Somewhere': None})
+        self.assertEqual(str(Address.objects.get(raw='Kano market')),
+                         'Kano, Kano, Nigeria')
+        
+        # now a duplicate of an existing address, which it's merged into;
+        # only the addresses given a state are fingerprinted
+        self.assertEqual(Contact.objects.get().address_id, existing.pk)
+        self.assertEqual(list(Address.objects.filter(fingerprint=None)
+                              .values_list('raw', flat=True)), ['Somewhere'])
+    
+    def test_backfilling_raw_only_addresses(self):
+        addr = Address.objects.create(raw='Eko market', latitude=6.45, 
+                                      longitude=3.39)
+        self.assertEqual(backfill_states(), {'examined': 1, 'updated': 1})
+        
+        # given a state, the address is still shown by its raw value
+        addr = Address.objects.get(pk=addr.pk)
+        self.assertEqual(addr.state, self.lagos)
+        self.assertEqual((addr.formatted, str(addr), addr._format_address()),
+                         ('Eko market',) * 3)
+        self.assertEqual(Address.objects.with_display()
+                         .get(pk=addr.pk).display, 'Eko market')
+        self.lagos.name = 'Eko'
+        self.lagos.save()
+        self.assertEqual(Address.objects.get(pk=addr.pk).formatted,
+                         'Eko market')
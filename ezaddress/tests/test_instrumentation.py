@@ -0,0 +1,120 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ezaddress.cache import regions
+from ezaddress.forms import AddressField as AddressFormField
+from ezaddress.instrumentation import StatsReporter
+from ezaddress.models import Address, to_address, to_addresses
+from ezaddress.signals import CREATED, MATCHED
+from ezaddress.tests import run_commit_hooks
+from ezaddress.tests.models import Contact
+
+
+
+REPORTS = []
+
+
+def record(report):
+    REPORTS.append(report)
+
+
+def fail(report):
+    raise RuntimeError('broken callback')
+
+
+@override_settings(
+    EZADDRESS_INSTRUMENTATION='ezaddress.tests.test_instrumentation.record')
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        del REPORTS[:]
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+        }
+    
+    def test_nothing_is_reported_when_disabled(self):
+        with self.settings(EZADDRESS_INSTRUMENTATION=None):
+            to_address(self.addr_dict)
+        self.assertEqual(REPORTS, [])
+    
+    def test_failing_callbacks_are_logged(self):
+        with self.settings(EZADDRESS_INSTRUMENTATION=[
+                'ezaddress.tests.test_instrumentation.fail',
+                'ezaddress.tests.test_instrumentation.record']):
+            with self.assertLogs('ezaddress', 'ERROR'):
+                to_address('1 Alu Avenue')
+        self.assertEqual(len(REPORTS), 1)
+    
+    def test_resolution_is_reported(self):
+        with CaptureQueriesContext(connection) as queries:
+            to_address(self.addr_dict)
+        to_address('1 Alu Avenue')
+        
+        created, raw = REPORTS
+        self.assertEqual(created['operation'], 'to_address')
+        self.assertEqual(created['queries'], len(queries))
+        self.assertEqual(created['outcomes'], {CREATED: 1})
+        self.assertEqual((created['raw'], created['cache_hits']), (0, 0))
+        self.assertGreater(created['duration'], 0)
+        self.assertEqual(raw['outcomes'], {CREATED: 1})
+        self.assertEqual(raw['raw'], 1)
+    
+    def test_nested_calls_are_reported_once(self):
+        contact = Contact(name='Ade')
+        contact.address = self.addr_dict
+        self.assertEqual(len(REPORTS), 1)
+        self.assertEqual(REPORTS[0]['operation'], 'descriptor')
+        self.assertEqual(REPORTS[0]['outcomes'], {CREATED: 1})
+        
+        field = AddressFormField()
+        field.to_python(dict(self.addr_dict, latitude='6.45'))
+        self.assertEqual(REPORTS[1]['operation'], 'form_field')
+        self.assertEqual(REPORTS[1]['queries'], 4)
+        self.assertEqual(Address.objects.get().latitude, 6.45)
+    
+    def test_bulk_resolution_is_reported(self):
+        to_address('1 Alu Avenue')
+        to_addresses(['1 Alu Avenue', '2 Alu Avenue', self.addr_dict])
+        self.assertEqual(REPORTS[1]['operation'], 'to_addresses')
+        self.assertEqual(REPORTS[1]['outcomes'], {CREATED: 2, MATCHED: 1})
+        self.assertEqual(REPORTS[1]['raw'], 2)
+    
+    @override_settings(EZADDRESS_REGION_CACHE=True)
+    def test_region_cache_hits_are_reported(self):
+        regions.clear()
+        self.addCleanup(regions.clear)
+        to_address(self.addr_dict)
+        run_commit_hooks()
+        to_address(self.addr_dict)
+        to_addresses([self.addr_dict])
+        self.assertEqual([r['cache_hits'] for r in REPORTS], [0, 2, 2])
+
+
+class StatsReporterTestCase(TestCase):
+
+    class Client(object):
+        def __init__(self):
+            self.calls = []
+        
+        def timing(self, name, value):
+            self.calls.append(('timing', name))
+        
+        def incr(self, name, value):
+            self.calls.append(('incr', name, value))
+    
+    def test_report_is_sent_to_client(self):
+        client = self.Client()
+        StatsReporter(client)({
+            'operation': 'to_address', 'duration': 0.01, 'queries': 3,
+            'outcomes': {MATCHED: 1}, 'raw': 1, 'cache_hits': 0})
+        self.assertEqual(client.calls, [
+            ('timing', 'ezaddress.to_address.time'),
+            ('incr', 'ezaddress.to_address.queries', 3),
+            ('incr', 'ezaddress.to_address.matched', 1),
+            ('incr', 'ezaddress.to_address.raw', 1),
+        ])
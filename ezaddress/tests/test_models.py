@@ -1,8 +1,20 @@
+import pickle
+import threading
+from unittest import skipIf
+
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ezaddress.models import to_address
+from ezaddress import geo
+from ezaddress.cache import AddressMemo, RegionCache, addresses, regions
+from ezaddress.models import to_address, to_addresses
+from ezaddress.signals import ResolutionCounter, CREATED, MATCHED, UPDATED
 from ezaddress.models import *
+from ezaddress.models import _create_or_get, resolve_pending_addresses
+from ezaddress.tests import run_commit_hooks
+from ezaddress.tests.models import Branch, Contact, Delivery, Office, Site
 
 
 
@@ -146,6 +158,66 @@ class AddressTestCase(BaseTestCase):
         country = state.country
         self.assertEqual(country.name, addr_dict.get('country'))
         self.assertEqual(country.code, addr_dict.get('country_code'))
+    
+    def test_iter_dicts_matches_as_dict(self):
+        self.addr3.latitude, self.addr3.gps_error = 6.5, 0
+        self.addr3.save()
+        expected = [addr.as_dict() for addr in Address.objects.order_by('pk')]
+        with self.assertNumQueries(3):
+            self.assertEqual(list(Address.objects.iter_dicts(chunk_size=2)),
+                             expected)
+        self.assertEqual(list(Address.objects.filter(state=self.ng_lg)\
+                                             .iter_dicts()), expected[:2])
+    
+    def test_iter_values_match_addresses(self):
+        self.addr3.latitude = 6.5
+        self.addr3.save()
+        addrs = list(Address.objects.order_by('pk'))
+        with self.assertNumQueries(2):
+            values = list(Address.objects.iter_values(chunk_size=3))
+        self.assertEqual([v.pk for v in values], [a.pk for a in addrs])
+        for (value, addr) in zip(values, addrs):
+            self.assertEqual(str(value), str(addr))
+            self.assertEqual(value.as_dict(), addr.as_dict())
+            self.assertEqual(value, AddressValue.from_address(addr))
+        self.assertEqual(values[2].latitude, 6.5)
+    
+    def test_address_values_are_immutable(self):
+        value = AddressValue.from_address(self.addr1)
+        with self.assertRaises(AttributeError):
+            value.street = '7 Marina'
+        with self.assertRaises(AttributeError):
+            del value.street
+        with self.assertRaises(AttributeError):
+            value.extra = 1
+        with self.assertRaises(TypeError):
+            AddressValue(street='7 Marina', extra=1)
+        
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+        self.assertEqual(len(set([value, AddressValue.from_address(
+                                            self.addr1)])), 1)
+    
+    def test_address_values_round_trip(self):
+        value = next(Address.objects.filter(pk=self.addr1.pk).iter_values())
+        with self.assertNumQueries(0):
+            addr = to_address(value)
+            self.assertEqual(str(addr), str(self.addr1))
+        self.assertEqual(addr.pk, self.addr1.pk)
+        self.assertEqual(addr.state_id, self.ng_lg.pk)
+        stored = Address.objects.get(pk=self.addr1.pk)
+        self.assertEqual((addr.formatted, addr.fingerprint, addr.geohash),
+                         (stored.formatted, stored.fingerprint, 
+                          stored.geohash))
+        self.assertEqual(to_addresses([value])[0].pk, self.addr1.pk)
+        
+        # values not read from stored addresses are resolved
+        value = AddressValue(raw=self.addr1.raw, street='No 1 Bank Road',
+                             town_city='Eko', postal_code='720015',
+                             state='Lagos', country='Nigeria')
+        self.assertEqual(to_address(value).pk, self.addr1.pk)
+        self.assertEqual(to_addresses([value])[0].pk, self.addr1.pk)
+        self.assertEqual(to_address(AddressValue(raw='9 Broad Street')).raw,
+                         '9 Broad Street')
 
 
 class AddressFieldTestCase(TestCase):
@@ -277,3 +349,674 @@ class AddressFieldTestCase(TestCase):
         with self.assertRaises(ValueError):
             to_address(addr_dict)
 
+
+
+class ToAddressesTestCase(TestCase):
+
+    def setUp(self):
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'postal_code': '720015',
+            'state': 'Lagos',
+            'state_code': 'LG',
+            'country': 'Nigeria',
+            'country_code': 'NG'
+        }
+    
+    def _make_dicts(self, count):
+        return [dict(self.addr_dict, street='%s Bank Road' % i,
+                     raw='%s Bank Road, Eko' % i) for i in range(count)]
+    
+    def test_results_are_returned_in_input_order(self):
+        addr = to_address('1 Alu Avenue')
+        values = [None, self.addr_dict, addr, 'No 2 Bank Road', {'street': 'x'}]
+        results = to_addresses(values)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0], None)
+        self.assertEqual(results[1].street, self.addr_dict['street'])
+        self.assertEqual(results[1].state.name, 'Lagos')
+        self.assertEqual(results[1].state.country.code, 'NG')
+        self.assertIs(results[2], addr)
+        self.assertEqual(results[3].raw, 'No 2 Bank Road')
+        self.assertEqual(results[4], None)
+        self.assertTrue(all(r.pk for r in (results[1], results[3])))
+    
+    def test_existing_rows_are_matched(self):
+        existing = to_address(self.addr_dict)
+        raw_only = to_address({'raw': '1 Alu Avenue'})
+        results = to_addresses([self.addr_dict, {'raw': '1 Alu Avenue'}])
+        self.assertEqual(results[0].pk, existing.pk)
+        self.assertEqual(results[1].pk, raw_only.pk)
+        self.assertEqual(Address.objects.count(), 2)
+        self.assertEqual(Country.objects.count(), 1)
+        self.assertEqual(State.objects.count(), 1)
+    
+    def test_repeated_values_map_to_same_new_row(self):
+        results = to_addresses([self.addr_dict, dict(self.addr_dict),
+                                {'raw': '1 Alu Avenue'}, '1 Alu Avenue',
+                                {'raw': '1 Alu Avenue'}])
+        self.assertEqual(Address.objects.count(), 2)
+        self.assertEqual(results[0].pk, results[1].pk)
+        self.assertEqual(results[2].pk, results[3].pk)
+        self.assertEqual(results[2].pk, results[4].pk)
+    
+    def test_strings_match_raw_only_addresses(self):
+        existing = to_address('1 Alu Avenue')
+        results = to_addresses(['1 Alu Avenue', {'raw': '1 alu avenue'},
+                                '2 Alu Avenue', '2 Alu Avenue'])
+        self.assertEqual(results[0].pk, existing.pk)
+        self.assertEqual(results[1].pk, existing.pk)
+        self.assertEqual(results[2].pk, results[3].pk)
+        self.assertEqual(Address.objects.count(), 2)
+    
+    def test_inconsistent_dict_falls_back_to_raw(self):
+        addr_dict = dict(self.addr_dict)
+        del addr_dict['country']
+        result = to_addresses([addr_dict])[0]
+        self.assertEqual(result.raw, addr_dict['raw'])
+        self.assertEqual(result.street, '')
+        self.assertEqual(result.state, None)
+    
+    def test_invalid_codes_are_rejected(self):
+        addr_dict = dict(self.addr_dict, state_code='Something;Invalid')
+        with self.assertRaises(ValueError):
+            to_addresses([addr_dict])
+        self.assertEqual(Address.objects.count(), 0)
+    
+    def test_invalid_value_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            to_addresses([1.5])
+    
+    def test_states_sharing_a_name_are_told_apart(self):
+        bw = Country.objects.create(name='Botswana', code='BW')
+        gh = Country.objects.create(name='Ghana', code='GH')
+        State.objects.create(name='Central', code='CE', country=bw)
+        central = State.objects.create(name='Central', code='CP', country=gh)
+        value = {'raw': '1 Castle Road, Cape Coast', 
+                 'street': '1 Castle Road', 'town_city': 'Cape Coast', 
+                 'state': 'Central', 'country': 'Ghana'}
+        other = dict(value, raw='2 Castle Road', street='2 Castle Road')
+        
+        self.assertEqual(to_address(value).state, central)
+        self.assertEqual(to_addresses([other])[0].state, central)
+        with override_settings(EZADDRESS_REGION_CACHE=True):
+            regions.clear()
+            self.addCleanup(regions.clear)
+            self.assertEqual(to_address(value).state, central)
+            self.assertEqual(to_addresses([other, dict(value, 
+                             country='Botswana')])[0].state, central)
+        self.assertEqual(State.objects.count(), 2)
+    
+    def test_repeated_values_add_gps_values_to_new_addresses(self):
+        located = dict(self.addr_dict, latitude=6.45, longitude=3.39)
+        addrs = to_addresses([self.addr_dict, located])
+        self.assertEqual(addrs[0].pk, addrs[1].pk)
+        stored = Address.objects.get(pk=addrs[0].pk)
+        self.assertEqual((stored.latitude, stored.geohash), 
+                         (6.45, geo.encode_geohash(6.45, 3.39)))
+    
+    def test_query_count_is_independent_of_batch_size(self):
+        to_address(self.addr_dict)
+        dicts = self._make_dicts(100)
+        
+        # country, state & address lookups, insert within a savepoint and
+        # pk re-fetch
+        with self.assertNumQueries(7):
+            to_addresses(dicts[:20])
+        with self.assertNumQueries(7):
+            to_addresses(dicts[20:])
+        self.assertEqual(Address.objects.count(), 101)
+
+
+@override_settings(EZADDRESS_REGION_CACHE=True)
+class RegionCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        regions.clear()
+        super(RegionCacheTestCase, self).setUp()
+        self.ng_lg = State.objects.create(name='Lagos', code='LG', country=self.ng)
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'postal_code': '720015',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+        }
+    
+    def tearDown(self):
+        regions.clear()
+    
+    def test_lookups_are_served_from_cache(self):
+        regions.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(regions.country('Nigeria'), self.ng)
+            self.assertEqual(regions.country_by_code('GH'), self.gh)
+            self.assertEqual(regions.state('Lagos', self.ng), self.ng_lg)
+            self.assertEqual(regions.state_by_code(self.ng, 'LG'), self.ng_lg)
+            self.assertEqual(str(regions.state('Lagos', self.ng)), 
+                             'Lagos, Nigeria')
+    
+    def test_to_address_skips_region_queries(self):
+        to_address(self.addr_dict)
+        # address lookup only
+        with self.assertNumQueries(1):
+            to_address(self.addr_dict)
+        
+        # nor are regions looked up for values without any
+        value = {'raw': '1 Alu Avenue', 'street': '1 Alu Avenue'}
+        to_address(value)
+        with self.assertNumQueries(1):
+            to_address(value)
+    
+    def test_missing_entries_fall_through_to_database(self):
+        regions.warm()
+        Country.objects.bulk_create([Country(name='Senegal', code='SN')])
+        self.assertEqual(regions.country('Senegal').code, 'SN')
+        with self.assertRaises(Country.DoesNotExist):
+            regions.country('Mali')
+        
+        # misses are remembered until regions are created
+        with self.assertNumQueries(0):
+            with self.assertRaises(Country.DoesNotExist):
+                regions.country('Mali')
+        mali = Country.objects.create(name='Mali', code='ML')
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(regions.country('Mali'), mali)
+    
+    def test_cache_is_updated_on_save_and_delete(self):
+        regions.warm()
+        Country.objects.create(name='Senegal', code='SN')
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(regions.country('Senegal').code, 'SN')
+        
+        # rows rolled back aren't cached
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                Country.objects.create(name='Mali', code='ML')
+                raise DatabaseError
+        run_commit_hooks()
+        with self.assertRaises(Country.DoesNotExist):
+            regions.country('Mali')
+        
+        self.ng_lg.name = 'Eko'
+        self.ng_lg.save()
+        self.assertEqual(regions.state('Eko', self.ng).pk, self.ng_lg.pk)
+        with self.assertRaises(State.DoesNotExist):
+            regions.state('Lagos', self.ng)
+        
+        self.gh.delete()
+        with self.assertRaises(Country.DoesNotExist):
+            regions.country('Ghana')
+    
+    @override_settings(EZADDRESS_REGION_CACHE_BACKEND='default')
+    def test_shared_backend_invalidates_other_processes(self):
+        other = RegionCache()
+        other.warm()
+        with self.assertRaises(Country.DoesNotExist):
+            other.country('Mali')
+        mali = Country.objects.create(name='Mali', code='ML')
+        run_commit_hooks()
+        self.assertEqual(other.country('Mali'), mali)
+        
+        self.gh.name = 'Gold Coast'
+        self.gh.save()
+        
+        # others keep their cache until the change is committed
+        with self.assertNumQueries(0):
+            self.assertEqual(other.country('Ghana').pk, self.gh.pk)
+        run_commit_hooks()
+        with self.assertRaises(Country.DoesNotExist):
+            other.country('Ghana')
+        self.assertEqual(other.country('Gold Coast').pk, self.gh.pk)
+
+
+@override_settings(EZADDRESS_ADDRESS_CACHE=True)
+class AddressMemoTestCase(BaseTestCase):
+
+    def setUp(self):
+        addresses.clear()
+        self.addCleanup(addresses.clear)
+        super(AddressMemoTestCase, self).setUp()
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road', 'town_city': 'Eko',
+            'postal_code': '720015', 'state': 'Lagos', 'country': 'Nigeria',
+        }
+        self.addr = to_address(self.addr_dict)
+    
+    def test_repeated_values_are_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(to_address(self.addr_dict).pk, self.addr.pk)
+        # spelling variants share entries
+        variant = dict(self.addr_dict, street='no 1  BANK road')
+        with self.assertNumQueries(1):
+            self.assertEqual(to_address(variant).pk, self.addr.pk)
+        
+        raw = to_address('1 Alu Avenue')
+        with self.assertNumQueries(1):
+            self.assertEqual(to_address(' 1  alu AVENUE').pk, raw.pk)
+        self.assertEqual(addresses.stats(), {
+            'size': 2, 'hits': 3, 'misses': 2, 'evictions': 0, 
+            'hit_rate': 0.6})
+    
+    def test_hits_report_outcomes_and_update_gps_values(self):
+        counter = ResolutionCounter().connect()
+        self.addCleanup(counter.disconnect)
+        addr = to_address(dict(self.addr_dict, latitude=6.45))
+        self.assertEqual(Address.objects.get(pk=self.addr.pk).latitude, 6.45)
+        self.assertEqual(addr.latitude, 6.45)
+        with self.assertNumQueries(1):
+            to_address(dict(self.addr_dict, latitude=6.45))
+        self.assertEqual(counter.counts, {UPDATED: 1, MATCHED: 1})
+        self.assertEqual(addresses.stats()['hits'], 2)
+    
+    def test_entries_are_dropped_when_addresses_change(self):
+        self.addr.street = '7 Marina'
+        self.addr.save()
+        self.assertEqual(addresses.stats()['size'], 0)
+        self.assertNotEqual(to_address(self.addr_dict).pk, self.addr.pk)
+        
+        raw = to_address('1 Alu Avenue')
+        raw.delete()
+        self.assertIsNotNone(to_address('1 Alu Avenue').pk)
+        self.assertEqual(addresses.stats()['hits'], 0)
+    
+    @override_settings(EZADDRESS_ADDRESS_CACHE_SIZE=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        first = to_address('1 Alu Avenue')
+        to_address(self.addr_dict)
+        to_address('2 Alu Avenue')
+        stats = addresses.stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+        with self.assertNumQueries(1):
+            to_address(self.addr_dict)
+        self.assertEqual(to_address('1 Alu Avenue').pk, first.pk)
+        self.assertEqual(addresses.stats()['misses'], 4)
+    
+    @override_settings(EZADDRESS_ADDRESS_CACHE_TTL=0)
+    def test_entries_expire(self):
+        addresses.clear()
+        to_address(self.addr_dict)
+        to_address(self.addr_dict)
+        self.assertEqual(addresses.stats()['hits'], 0)
+    
+    @override_settings(EZADDRESS_ADDRESS_CACHE_BACKEND='default')
+    def test_shared_backend_entries_are_checked_when_read(self):
+        other = AddressMemo()
+        key = other.key(self.addr_dict)
+        addresses.set(key, self.addr)
+        fetch = lambda pk, value: Address.objects.filter(pk=pk, 
+                                      fingerprint=value).first()
+        self.assertEqual(other.get(key, fetch).pk, self.addr.pk)
+        
+        # updated by another process, bypassing its signals
+        Address.objects.filter(pk=self.addr.pk).update(fingerprint='x')
+        self.assertIsNone(other.get(key, fetch))
+        self.assertIsNone(addresses._get(key))
+        self.assertEqual(other.stats()['hit_rate'], 0.5)
+
+
+class AddressManagerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(AddressManagerTestCase, self).setUp()
+        self.ng_lg = State.objects.create(name='Lagos', code='LG', country=self.ng)
+        self.gh_ac = State.objects.create(name='Accra', code='AC', country=self.gh)
+        Address.objects.create(
+                raw='No 1 Bank Road, Eko 720015, Lagos, Nigeria ::',
+                street='No 1 Bank Road', town_city='Eko', 
+                postal_code='720015', state=self.ng_lg)
+        Address.objects.create(
+                raw='5243 Koffi Avenue, Accra, Ghana ::',
+                street='5243 Koffi Avenue', state=self.gh_ac)
+        Address.objects.create(
+                raw='Akanta 982201, Accra, Ghana ::',
+                town_city='Akanta', postal_code='982201', state=self.gh_ac)
+        Address.objects.create(raw='Accra, Ghana ::', state=self.gh_ac)
+        Address.objects.create(raw='1 Alu Avenue')
+    
+    def test_formatting_addresses_issues_single_query(self):
+        with self.assertNumQueries(1):
+            for addr in Address.objects.all():
+                str(addr)
+                addr.as_dict()
+    
+    def test_display_annotation_matches_string_representation(self):
+        expected = sorted(str(addr) for addr in Address.objects.all())
+        with self.assertNumQueries(1):
+            display = Address.objects.with_display()\
+                             .values_list('display', flat=True)
+            self.assertEqual(expected, sorted(display))
+        self.assertIn('Akanta 982201, Accra, Ghana', expected)
+    
+    def test_addressable_manager(self):
+        Office.objects.create(name='HQ', addr_street='No 1 Bank Road',
+                              addr_town='Eko', postal_code='720015',
+                              addr_state=self.ng_lg)
+        Office.objects.create(name='Annex', addr_raw='1 Alu Avenue')
+        with self.assertNumQueries(1):
+            expected = sorted(o.get_address_str() for o in Office.objects.all())
+        with self.assertNumQueries(1):
+            display = Office.objects.with_display()\
+                            .values_list('address_display', flat=True)
+            self.assertEqual(expected, sorted(display))
+    
+    def test_formatted_column_needs_no_joins(self):
+        expected = sorted(addr._format_address() 
+                          for addr in Address.objects.all())
+        with self.assertNumQueries(1):
+            formatted = sorted(str(addr) for addr in 
+                               Address.objects.select_related(None))
+        self.assertEqual(formatted, expected)
+        
+        stored = to_addresses(['9 Broad Street', {
+            'raw': 'x', 'street': '7 Marina', 'town_city': 'Eko',
+            'state': 'Lagos', 'country': 'Nigeria'}])
+        self.assertEqual([addr.formatted for addr in stored], 
+                         ['9 Broad Street', '7 Marina, Eko, Lagos, Nigeria'])
+        
+        # only saving address fields formats the address again
+        addr = Address._base_manager.get(street='No 1 Bank Road')
+        with self.assertNumQueries(1):
+            addr.latitude = 6.45
+            addr.save(update_fields=['latitude'])
+        addr.town_city = 'Ikoyi'
+        addr.save(update_fields=['town_city'])
+        self.assertEqual(Address._base_manager.get(pk=addr.pk).formatted,
+                         'No 1 Bank Road, Ikoyi 720015, Lagos, Nigeria')
+    
+    def test_renaming_regions_refreshes_formatted_column(self):
+        Branch.objects.create(name='HQ', addr_street='2 Ring Road',
+                              addr_state=self.gh_ac)
+        self.gh_ac.name = 'Greater Accra'
+        with CaptureQueriesContext(connection) as queries:
+            self.gh_ac.save()
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        
+        # saves leaving the names alone leave the strings alone
+        self.gh_ac.latitude = 5.6
+        with CaptureQueriesContext(connection) as queries:
+            self.gh_ac.save()
+            self.gh.save(update_fields=['code'])
+            self.gh.save()
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        
+        self.gh.name = 'Republic of Ghana'
+        self.gh.save()
+        
+        expected = sorted(addr._format_address() 
+                          for addr in Address.objects.all())
+        formatted = sorted(Address.objects.values_list('formatted', 
+                                                       flat=True))
+        self.assertEqual(formatted, expected)
+        self.assertIn('Akanta 982201, Greater Accra, Republic of Ghana', 
+                      formatted)
+        self.assertEqual(Branch.objects.get().get_address_str(),
+                         '2 Ring Road, Greater Accra, Republic of Ghana')
+
+
+class ConcurrentResolutionTestCase(TransactionTestCase):
+
+    def _resolve_concurrently(self, func, values, workers=8):
+        results, errors = [], []
+        barrier = threading.Barrier(workers) if hasattr(threading, 'Barrier') \
+                  else None
+        
+        def worker():
+            try:
+                if barrier:
+                    barrier.wait()
+                results.extend(func(value) for value in values)
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=worker) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+    
+    def test_concurrent_writers_create_no_duplicates(self):
+        values = [{
+            'raw': '%s Bank Road, Eko, Lagos, Nigeria' % i,
+            'street': '%s Bank Road' % i, 'town_city': 'Eko',
+            'state': 'Lagos', 'country': 'Nigeria',
+        } for i in range(5)] + ['1 Alu Avenue']
+        
+        results = self._resolve_concurrently(to_address, values)
+        self.assertEqual(len(results), 8 * len(values))
+        self.assertEqual(len(set(r.pk for r in results)), len(values))
+        self.assertEqual(Address.objects.count(), len(values))
+        self.assertEqual(Country.objects.count(), 1)
+        self.assertEqual(State.objects.count(), 1)
+    
+    def test_concurrent_bulk_writers_create_no_duplicates(self):
+        values = ['%s Alu Avenue' % i for i in range(20)]
+        results = self._resolve_concurrently(to_addresses, [values])
+        self.assertEqual(Address.objects.count(), 20)
+        for result in results:
+            self.assertEqual([r.raw for r in result], values)
+    
+    def test_other_integrity_errors_are_raised(self):
+        # no conflicting row to return for a missing country
+        with self.assertRaises(IntegrityError):
+            _create_or_get(State(name='Ikeja'), name='Ikeja')
+
+
+class ResolutionOutcomeTestCase(TestCase):
+
+    def setUp(self):
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+            'latitude': 6.45,
+            'longitude': 3.39,
+        }
+        self.counter = ResolutionCounter().connect()
+    
+    def tearDown(self):
+        self.counter.disconnect()
+    
+    def test_unchanged_address_is_not_saved_again(self):
+        to_address(self.addr_dict)
+        # country, state and address lookups only
+        with self.assertNumQueries(3):
+            to_address(dict(self.addr_dict))
+        with self.assertNumQueries(3):
+            to_address(dict(self.addr_dict, latitude=None))
+        self.assertEqual(self.counter.counts, {CREATED: 1, MATCHED: 2})
+    
+    def test_changed_gps_values_are_updated(self):
+        addr = to_address(self.addr_dict)
+        with CaptureQueriesContext(connection) as queries:
+            to_address(dict(self.addr_dict, latitude=6.5))
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"latitude"', updates[0])
+        self.assertNotIn('"longitude"', updates[0])
+        self.assertEqual(Address.objects.get(pk=addr.pk).latitude, 6.5)
+        self.assertEqual(self.counter.counts, {CREATED: 1, UPDATED: 1})
+    
+    def test_bulk_outcomes(self):
+        to_address(self.addr_dict)
+        to_addresses([dict(self.addr_dict), dict(self.addr_dict, altitude=10),
+                      '1 Alu Avenue', '1 Alu Avenue'])
+        self.assertEqual(self.counter.counts,
+                         {CREATED: 2, MATCHED: 2, UPDATED: 1})
+        self.assertEqual(self.counter.writes, 3)
+        self.assertEqual(Address.objects.get(raw=self.addr_dict['raw'])\
+                                        .altitude, 10)
+
+
+class SpatialQueryTestCase(TestCase):
+
+    def setUp(self):
+        points = [
+            ('Lagos', 6.5244, 3.3792),
+            ('Ikeja', 6.6018, 3.3515),
+            ('Ibadan', 7.3775, 3.9470),
+            ('Abuja', 9.0765, 7.3986),
+            ('London', 51.5074, -0.1278),
+            ('Suva', -18.1416, 178.4419),
+            ('Apia', -13.8333, -171.7667),
+            ('Nowhere', None, None),
+        ]
+        for (name, latitude, longitude) in points:
+            Site.objects.create(name=name, latitude=latitude, 
+                                longitude=longitude)
+    
+    def names(self, items):
+        return [obj.name for obj in items]
+    
+    def test_geohash_encoding(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, 11), 
+                         'u4pruydqqvj')
+        self.assertEqual(geo.encode_geohash(None, 10.40744), '')
+    
+    def test_geohash_is_kept_up_to_date(self):
+        site = Site.objects.get(name='Lagos')
+        self.assertEqual(site.geohash, geo.encode_geohash(6.5244, 3.3792))
+        site.latitude = 6.45
+        site.save(update_fields=['latitude'])
+        self.assertEqual(Site.objects.get(pk=site.pk).geohash, 
+                         geo.encode_geohash(6.45, 3.3792))
+    
+    def test_resolved_addresses_have_geohash(self):
+        addr = to_address({'raw': 'Lagos', 'latitude': 6.5, 'longitude': 3.4})
+        bulk = to_addresses([{'raw': 'Ikeja', 'latitude': 6.6, 
+                              'longitude': 3.35}])[0]
+        to_address({'raw': 'Lagos', 'latitude': 6.6})
+        self.assertEqual(Address.objects.get(pk=addr.pk).geohash, 
+                         geo.encode_geohash(6.6, 3.4))
+        self.assertEqual(Address.objects.get(fingerprint=bulk.fingerprint)\
+                                        .geohash, geo.encode_geohash(6.6, 3.35))
+    
+    def test_within_bbox(self):
+        found = Site.objects.within_bbox(6, 3, 8, 4).order_by('name')
+        self.assertEqual(self.names(found), ['Ibadan', 'Ikeja', 'Lagos'])
+        self.assertEqual(Site.objects.within_bbox(-90, -180, 90, 180).count(),
+                         7)
+    
+    def test_within_bbox_across_antimeridian(self):
+        found = Site.objects.within_bbox(-20, 170, -10, -170).order_by('name')
+        self.assertEqual(self.names(found), ['Apia', 'Suva'])
+    
+    def test_within_radius(self):
+        found = Site.objects.within_radius(6.5244, 3.3792, 150)
+        self.assertEqual(self.names(found), ['Lagos', 'Ikeja', 'Ibadan'])
+        self.assertEqual(found[0].distance, 0)
+        self.assertAlmostEqual(found[2].distance, 
+                               geo.distance(6.5244, 3.3792, 7.3775, 3.9470))
+        self.assertEqual(self.names(Site.objects.within_radius(
+            -16, 179.9, 1000)), ['Suva', 'Apia'])
+    
+    def test_nearest(self):
+        found = Site.objects.nearest(9.0, 7.0, k=2)
+        self.assertEqual(self.names(found), ['Abuja', 'Ibadan'])
+        found = Site.objects.filter(name__in=['Lagos', 'London'])\
+                            .nearest(-33.9, 151.2)
+        self.assertEqual(self.names(found), ['Lagos'])
+        self.assertEqual(len(Site.objects.nearest(0, 0, k=100)), 7)
+    
+    def test_address_queries(self):
+        to_address({'raw': 'Ikeja', 'latitude': 6.6018, 'longitude': 3.3515})
+        found = Address.objects.within_radius(6.5244, 3.3792, 10)
+        self.assertEqual([addr.raw for addr in found], ['Ikeja'])
+    
+    @skipIf(geo.numpy is None, 'numpy is not installed')
+    def test_numpy_refine_matches_python(self):
+        points = [(lat / 10.0, lng / 10.0) 
+                  for lat in range(-900, 901, 90) 
+                  for lng in range(-1800, 1801, 90)]
+        vectorized = geo._distances(6.5, 3.4, points)
+        self.assertGreaterEqual(len(points), geo.NUMPY_REFINE_THRESHOLD)
+        for (point, value) in zip(points, vectorized):
+            self.assertAlmostEqual(value, geo.distance(6.5, 3.4, *point), 6)
+
+
+class LazyAddressFieldTestCase(TestCase):
+
+    def setUp(self):
+        self.addr_dict = {
+            'raw': 'No. 1 Bank Road, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road',
+            'town_city': 'Eko',
+            'state': 'Lagos',
+            'country': 'Nigeria',
+        }
+    
+    def test_assignment_is_resolved_on_save(self):
+        with self.assertNumQueries(0):
+            delivery = Delivery(reference='D1', address=self.addr_dict)
+            delivery.address = '1 Alu Avenue'
+            delivery.full_clean()
+        self.assertEqual(Address.objects.count(), 0)
+        
+        delivery.save()
+        self.assertEqual(Address.objects.get().raw, '1 Alu Avenue')
+        self.assertEqual(Delivery.objects.get().address_id, 
+                         delivery.address_id)
+    
+    def test_reading_pending_value_resolves_it(self):
+        delivery = Delivery(reference='D1')
+        delivery.address = self.addr_dict
+        self.assertEqual(delivery.address.street, 'No. 1 Bank Road')
+        with self.assertNumQueries(0):
+            self.assertEqual(delivery.address.town_city, 'Eko')
+    
+    def test_addresses_and_keys_are_assigned_immediately(self):
+        addr = to_address('1 Alu Avenue')
+        delivery = Delivery(reference='D1', address=self.addr_dict)
+        delivery.address = addr
+        self.assertEqual(delivery.address_id, addr.pk)
+        delivery.save()
+        self.assertEqual(Address.objects.count(), 1)
+    
+    def test_eager_fields_resolve_on_assignment(self):
+        contact = Contact(name='Ade')
+        contact.address = '1 Alu Avenue'
+        self.assertIsNotNone(contact.address_id)
+    
+    def test_resolving_pending_addresses_in_bulk(self):
+        deliveries = [Delivery(reference='D%d' % i, 
+                               address=dict(self.addr_dict, raw='%d' % i,
+                                            street='%d Bank Road' % i))
+                      for i in range(20)]
+        deliveries.append(Delivery(reference='X', address='1 Alu Avenue'))
+        with self.assertNumQueries(15):
+            resolve_pending_addresses(deliveries)
+        self.assertEqual(Address.objects.count(), 21)
+        self.assertEqual(deliveries[5].address.street, '5 Bank Road')
+        self.assertEqual(deliveries[-1].address.raw, '1 Alu Avenue')
+        with self.assertNumQueries(0):
+            resolve_pending_addresses(deliveries)
+    
+    def test_bulk_create_resolves_addresses_in_one_batch(self):
+        def deliveries(start, count):
+            return [Delivery(reference='D%d' % i, 
+                             address=dict(self.addr_dict, raw='%d' % i,
+                                          street='%d Bank Road' % i))
+                    for i in range(start, start + count)]
+        
+        Delivery.objects.bulk_create(deliveries(0, 1))
+        with CaptureQueriesContext(connection) as queries:
+            Delivery.objects.bulk_create(deliveries(1, 10))
+        with self.assertNumQueries(len(queries)):
+            Delivery.objects.bulk_create(deliveries(11, 80))
+        self.assertEqual(Delivery.objects.count(), 91)
+        delivery = Delivery.objects.get(reference='D42')
+        self.assertEqual(delivery.address.street, '42 Bank Road')
@@ -0,0 +1,121 @@
+from django.test import TestCase, override_settings
+
+from ezaddress.models import Address, Country, State, to_address, \
+     to_addresses
+from ezaddress.parser import AddressParser, parser
+from ezaddress.tests import run_commit_hooks
+
+
+
+class AddressParserTestCase(TestCase):
+
+    def setUp(self):
+        ng = Country.objects.create(name='Nigeria', code='NG')
+        gb = Country.objects.create(name='United Kingdom', code='GB')
+        State.objects.create(name='Lagos', code='LA', country=ng)
+        State.objects.create(name='England', code='ENG', country=gb)
+        self.parser = AddressParser()
+        parser.clear()
+        self.addCleanup(parser.clear)
+    
+    def test_parsing_full_address(self):
+        self.assertEqual(self.parser.parse(
+            'No. 1 Bank Road, Ikoyi, Eko 720015, Lagos, Nigeria'), {
+            'raw': 'No. 1 Bank Road, Ikoyi, Eko 720015, Lagos, Nigeria',
+            'street': 'No. 1 Bank Road, Ikoyi',
+            'town_city': 'Eko',
+            'postal_code': '720015',
+            'state': 'Lagos',
+            'state_code': 'LA',
+            'country': 'Nigeria',
+            'country_code': 'NG',
+        })
+    
+    def test_parsing_variants(self):
+        parsed = self.parser.parse('10 Downing St, London, SW1A 2AA, '
+                                   'england, GB')
+        self.assertEqual((parsed['street'], parsed['town_city'], 
+                          parsed['postal_code'], parsed['state']),
+                         ('10 Downing St', 'London', 'SW1A 2AA', 'England'))
+        
+        # country told from the state; state given by code or with suffix
+        parsed = self.parser.parse('Eko, Lagos State')
+        self.assertEqual((parsed['street'], parsed['town_city'], 
+                          parsed['country']), ('', 'Eko', 'Nigeria'))
+        parsed = self.parser.parse('1 Bank Road, Eko, LA, NG')
+        self.assertEqual(parsed['state'], 'Lagos')
+    
+    def test_unparseable_strings(self):
+        for raw in ('1 Alu Avenue', '1 Alu Avenue, Kano, Nigeria',
+                    'Lagos, Nigeria', '1 Bank Road, Eko, LA', '', ', ,'):
+            self.assertIsNone(self.parser.parse(raw), raw)
+    
+    def test_states_sharing_a_name_need_a_country(self):
+        gh = Country.objects.create(name='Ghana', code='GH')
+        bw = Country.objects.create(name='Botswana', code='BW')
+        State.objects.create(name='Central', country=gh)
+        State.objects.create(name='Central', country=bw)
+        self.assertIsNone(self.parser.parse('Cape Coast, Central'))
+        self.assertEqual(self.parser.parse('Cape Coast, Central, Ghana')
+                         ['country'], 'Ghana')
+    
+    def test_lookup_is_loaded_once(self):
+        raws = ['%d Bank Road, Eko, Lagos, Nigeria' % i for i in range(50)]
+        with self.assertNumQueries(3):
+            parsed = list(self.parser.parse_many(raws))
+        self.assertEqual(parsed[7]['street'], '7 Bank Road')
+        
+        # new regions are added, changed ones drop the lookup
+        parser.parse('x, y')
+        ng = Country.objects.get(code='NG')
+        State.objects.create(name='Kano', country=ng)
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(parser.parse('Kano, Kano')['state'], 'Kano')
+        State.objects.filter(name='Kano').get().save()
+        self.assertIsNone(parser._lookup)
+    
+    @override_settings(EZADDRESS_REGION_CACHE_BACKEND='default')
+    def test_lookup_follows_other_processes(self):
+        other = AddressParser()
+        self.assertIsNone(other.parse('Kano, Kano'))
+        
+        # regions created, by signals or in bulk, or renamed here
+        ng = Country.objects.get(code='NG')
+        kano = State.objects.create(name='Kano', country=ng)
+        to_addresses([{'raw': 'Ibadan, Oyo', 'town_city': 'Ibadan', 
+                       'state': 'Oyo', 'country': 'Nigeria'}])
+        run_commit_hooks()
+        self.assertEqual(other.parse('Kano, Kano')['state'], 'Kano')
+        self.assertEqual(other.parse('Ibadan, Oyo')['state'], 'Oyo')
+        kano.name = 'Kano State'
+        kano.save()
+        run_commit_hooks()
+        self.assertIsNone(other.parse('Kano, Kano'))
+        
+        # this process's own creations don't have its lookup loaded again
+        parser.parse('x, y')
+        State.objects.create(name='Ogun', country=ng)
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(parser.parse('Abeokuta, Ogun')['state'], 
+                             'Ogun')
+    
+    @override_settings(EZADDRESS_PARSER='ezaddress.parser.parse')
+    def test_parsing_in_to_address(self):
+        addr = to_address('1 Bank Road, Eko 720015, Lagos, Nigeria')
+        self.assertEqual((addr.street, addr.town_city, addr.postal_code),
+                         ('1 Bank Road', 'Eko', '720015'))
+        self.assertEqual(addr.state.name, 'Lagos')
+        
+        same = to_address({'raw': 'x', 'street': '1 bank road', 
+                           'town_city': 'EKO', 'postal_code': '720015',
+                           'state': 'Lagos', 'country': 'Nigeria'})
+        self.assertEqual(same.pk, addr.pk)
+        
+        addrs = to_addresses(['1 Bank Road, Eko 720015, Lagos, Nigeria', 
+                              '1 Alu Avenue'])
+        self.assertEqual(addrs[0].pk, addr.pk)
+        self.assertEqual((addrs[1].raw, addrs[1].street), 
+                         ('1 Alu Avenue', ''))
+        self.assertEqual(Address.objects.count(), 2)
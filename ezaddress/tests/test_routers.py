@@ -0,0 +1,122 @@
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ezaddress.models import Address, Country, State, to_address, \
+     to_addresses
+from ezaddress.routers import pin_to_primary, pinned_to_primary, unpin
+from ezaddress.tests.models import Contact
+
+
+
+@override_settings(DATABASE_ROUTERS=['ezaddress.routers.ReplicaRouter'],
+                   EZADDRESS_REPLICA_DATABASE='replica')
+class ReplicaRouterTestCase(TestCase):
+    multi_db = True
+    
+    def setUp(self):
+        unpin()
+        self.addCleanup(unpin)
+        # regions are replicated; addresses are written to both databases
+        # where the replica is meant to have caught up
+        for alias in ('default', 'replica'):
+            ng = Country.objects.using(alias).create(name='Nigeria', 
+                                                     code='NG')
+            State.objects.using(alias).create(name='Lagos', code='LA', 
+                                              country=ng)
+    
+    def replicate(self, addr):
+        Address.objects.using('replica').bulk_create([addr])
+    
+    def value(self, street):
+        return {'raw': street + ', Ikoyi', 'street': street, 
+                'town_city': 'Ikoyi', 'state': 'Lagos', 'country': 'Nigeria'}
+    
+    def test_matches_are_read_from_the_replica(self):
+        addr = to_address(self.value('1 Marina'))
+        self.replicate(addr)
+        unpin()
+        
+        with CaptureQueriesContext(connections['default']) as primary, \
+             CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(to_address(self.value('1 Marina')).pk, addr.pk)
+            self.assertEqual(to_addresses([self.value('1 Marina')])[0].pk,
+                             addr.pk)
+        self.assertEqual(len(primary), 0)
+        self.assertGreater(len(replica), 0)
+        self.assertFalse(pinned_to_primary())
+    
+    def test_reads_are_pinned_to_the_primary_after_creates(self):
+        addr = to_address(self.value('1 Marina'))
+        self.assertTrue(pinned_to_primary())
+        self.assertFalse(Address.objects.using('replica').exists())
+        # read back although the replica has yet to catch up
+        self.assertEqual(to_address(self.value('1 Marina')).pk, addr.pk)
+        self.assertEqual(Address.objects.get(pk=addr.pk), addr)
+        self.assertEqual(Address.objects.count(), 1)
+    
+    def test_rows_missing_from_a_lagging_replica_are_not_duplicated(self):
+        addr = to_address(self.value('1 Marina'))
+        unpin()
+        self.assertEqual(to_address(self.value('1 Marina')).pk, addr.pk)
+        self.assertEqual(to_addresses([self.value('1 Marina'), 
+                                       self.value('2 Marina')])[0].pk, 
+                         addr.pk)
+        self.assertEqual(Address.objects.using('default').count(), 2)
+    
+    def test_replica_rows_are_written_to_the_primary(self):
+        addr = to_address(self.value('1 Marina'))
+        self.replicate(addr)
+        unpin()
+        
+        addr = Address.objects.get(pk=addr.pk)
+        self.assertEqual(addr._state.db, 'replica')
+        Contact.objects.create(name='A', address=addr)
+        addr.latitude = 6.45
+        addr.save()
+        self.assertEqual(Address.objects.using('default')
+                                .get(pk=addr.pk).latitude, 6.45)
+        self.assertEqual(Contact.objects.get().address_id, addr.pk)
+        
+        # objects holding a replica row are saved to the primary as well
+        contact = Contact(name='B', address=addr)
+        contact.save()
+        self.assertEqual(contact._state.db, 'default')
+        self.assertEqual(Contact.objects.using('default').count(), 2)
+        self.assertFalse(Contact.objects.using('replica').exists())
+    
+    def test_relations_are_only_allowed_to_ezaddress_rows(self):
+        addr = to_address(self.value('1 Marina'))
+        self.replicate(addr)
+        unpin()
+        
+        contact = Contact.objects.using('replica').create(name='A')
+        with self.assertRaises(ValueError):
+            contact.address = Address.objects.using('default').get()
+        contact = Contact.objects.create(name='B')
+        contact.address = Address.objects.using('replica').get()
+    
+    def test_requests_unpin_threads(self):
+        # as done by the test client, keep the connections of the test open
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        
+        pin_to_primary()
+        request_started.send(sender=self.__class__)
+        self.assertFalse(pinned_to_primary())
+        pin_to_primary()
+        request_finished.send(sender=self.__class__)
+        self.assertFalse(pinned_to_primary())
+    
+    def test_pinning_is_scoped_by_context_managers(self):
+        with pin_to_primary():
+            self.assertTrue(pinned_to_primary())
+            to_address(self.value('1 Marina'))
+        self.assertFalse(pinned_to_primary())
+        
+        pin_to_primary()
+        with pin_to_primary():
+            pass
+        self.assertTrue(pinned_to_primary())
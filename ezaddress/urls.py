@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from . import views
+
+
+
+urlpatterns = [
+    url(r'^autocomplete/$', views.autocomplete, name='ezaddress-autocomplete'),
+]
@@ -0,0 +1,78 @@
+"""
+ezaddress utilities
+"""
+import hashlib
+import re
+
+
+
+# python 3 fixes
+import sys
+if sys.version > '3':
+    unicode = str
+
+
+__all__ = ['normalize', 'fingerprint', 'tokenize', 'clean_gps_values']
+
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]', re.UNICODE)
+_WHITESPACE_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def normalize(value):
+    """Folds case, punctuation and whitespace out of an address component so
+    that spelling variants such as 'No. 1  Bank Rd' and 'no 1 bank rd' are
+    considered equal.
+    """
+    value = _PUNCTUATION_RE.sub(' ', unicode(value or ''))
+    return _WHITESPACE_RE.sub(' ', value).strip().lower()
+
+
+def fingerprint(raw='', street='', town_city='', postal_code='', 
+                state_id=None):
+    """Returns the identity hash of an address. Addresses with a street or
+    town/city are identified by their components, others by the raw value.
+    """
+    if street or town_city:
+        parts = ['a', street, town_city, postal_code, state_id or '']
+    else:
+        parts = ['r', raw]
+    key = '|'.join(normalize(part) for part in parts)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def tokenize(*values):
+    """Returns the distinct normalized words of `values`, in order."""
+    tokens = []
+    for value in values:
+        for token in normalize(value).split():
+            if token not in tokens:
+                tokens.append(token)
+    return tokens
+
+
+def clean_gps_values(value):
+    """Coerces the latitude, longitude and altitude entries of an address 
+    dict to floats and its gps_error entry to an int, in place, blank ones
+    becoming None. Raises ValueError with the name of an invalid entry.
+    """
+    for field in ('latitude', 'longitude', 'altitude'):
+        if field in value:
+            if value[field]:
+                try:
+                    value[field] = float(value[field])
+                except (TypeError, ValueError):
+                    raise ValueError(field)
+            else:
+                value[field] = None
+    
+    field = 'gps_error'
+    if field in value:
+        if value[field] in ('', None):
+            value[field] = None
+        else:
+            try:
+                value[field] = int(value[field])
+            except (TypeError, ValueError):
+                raise ValueError(field)
+    return value
@@ -0,0 +1,26 @@
+from django.http import JsonResponse
+from django.utils.encoding import force_text
+
+from .models import Address
+
+
+
+# upper bound on the number of suggestions a client may ask for
+MAX_SUGGESTIONS = 50
+
+
+def autocomplete(request):
+    """Returns addresses matching the `q` query parameter as JSON, for use
+    by `AddressWidget`. At most `limit` addresses are returned.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 
+                           MAX_SUGGESTIONS))
+    except ValueError:
+        limit = 10
+    
+    addrs = Address.objects.autocomplete(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [
+        {'id': addr.pk, 'text': force_text(addr), 'address': addr.as_dict()}
+        for addr in addrs
+    ]})
@@ -0,0 +1,207 @@
+"""
+A stand-alone benchmark runner script, timing the hot paths of the app on
+an SQLite test database.
+
+    python runbenchmarks.py [--number N] [--rows N [N ...]] [--only TEXT]
+                            [--json PATH]
+
+Each benchmark reports the mean time and number of queries per operation.
+Bulk benchmarks are run once per `--rows` size and report per-row figures.
+Use `--json` to keep results for comparison across releases.
+"""
+import argparse
+import json
+import sys
+import timeit
+
+from runtests import django_sandbox
+
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, bulk=False):
+    """Registers a benchmark. The decorated function is given the number of
+    operations to run, prepares any data needed and returns the operation:
+    a function of the operation index, or of no arguments for bulk ones.
+    """
+    def decorator(func):
+        BENCHMARKS.append((name, bulk, func))
+        return func
+    return decorator
+
+
+def _addr_dict(i):
+    return {
+        'raw': '%d Bank Road, Eko 720015, Lagos, Nigeria' % i,
+        'street': '%d Bank Road' % i,
+        'town_city': 'Eko',
+        'postal_code': '720015',
+        'state': 'Lagos',
+        'state_code': 'LA',
+        'country': 'Nigeria',
+        'country_code': 'NG',
+        'latitude': 6.45,
+        'longitude': 3.39,
+    }
+
+
+def _stored(n):
+    from ezaddress.models import Address, to_addresses
+    to_addresses(_addr_dict(i) for i in range(n))
+    return list(Address.objects.order_by('pk')[:n])
+
+
+@benchmark('to_address: new string')
+def bench_new_string(n):
+    from ezaddress.models import to_address
+    return lambda i: to_address('%d Alu Avenue' % i)
+
+
+@benchmark('to_address: existing string')
+def bench_existing_string(n):
+    from ezaddress.models import to_address, to_addresses
+    to_addresses('%d Alu Avenue' % i for i in range(n))
+    return lambda i: to_address('%d Alu Avenue' % i)
+
+
+@benchmark('to_address: new dict')
+def bench_new_dict(n):
+    from ezaddress.models import to_address
+    return lambda i: to_address(_addr_dict(i))
+
+
+@benchmark('to_address: existing dict')
+def bench_existing_dict(n):
+    from ezaddress.models import to_address
+    _stored(n)
+    return lambda i: to_address(_addr_dict(i))
+
+
+@benchmark('_to_address_str')
+def bench_to_address_str(n):
+    from ezaddress.models import _to_address_str
+    addrs = _stored(n)
+    return lambda i: _to_address_str(
+        street=addrs[i].street, town_city=addrs[i].town_city,
+        postal_code=addrs[i].postal_code, state=addrs[i].state,
+        raw=addrs[i].raw)
+
+
+@benchmark('Address.__str__')
+def bench_address_str(n):
+    addrs = _stored(n)
+    return lambda i: str(addrs[i])
+
+
+@benchmark('Address.as_dict')
+def bench_as_dict(n):
+    addrs = _stored(n)
+    return lambda i: addrs[i].as_dict()
+
+
+@benchmark('forms.AddressField.to_python')
+def bench_form_field(n):
+    from ezaddress.forms import AddressField
+    field = AddressField()
+    _stored(n)
+    def op(i):
+        value = _addr_dict(i)
+        value.update(latitude='6.45', longitude='3.39', gps_error='5')
+        return field.to_python(value)
+    return op
+
+
+@benchmark('to_addresses: new dicts', bulk=True)
+def bench_bulk_new(n):
+    from ezaddress.models import to_addresses
+    values = [_addr_dict(i) for i in range(n)]
+    return lambda: to_addresses(values)
+
+
+@benchmark('to_addresses: existing dicts', bulk=True)
+def bench_bulk_existing(n):
+    from ezaddress.models import to_addresses
+    values = [_addr_dict(i) for i in range(n)]
+    to_addresses(values)
+    return lambda: to_addresses(values)
+
+
+@benchmark('AddressQuerySet.iter_dicts', bulk=True)
+def bench_iter_dicts(n):
+    from ezaddress.models import Address
+    _stored(n)
+    return lambda: sum(1 for _ in Address.objects.iter_dicts())
+
+
+def run_benchmark(name, bulk, func, n):
+    """Runs a benchmark within a transaction which is rolled back, so each
+    starts from an empty database, and returns its results.
+    """
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+    
+    with transaction.atomic():
+        op = func(n)
+        calls = [op] if bulk else [(lambda i=i: op(i)) for i in range(n)]
+        with CaptureQueriesContext(connection) as queries:
+            start = timeit.default_timer()
+            for call in calls:
+                call()
+            elapsed = timeit.default_timer() - start
+        transaction.set_rollback(True)
+    
+    if len(queries) >= connection.queries_limit:
+        print('warning: query count of %s is capped at %d' % (
+              name, connection.queries_limit))
+    return {
+        'name': name if not bulk else '%s [%d rows]' % (name, n),
+        'ops': n,
+        'mean_us': elapsed / n * 1e6,
+        'queries_per_op': len(queries) / float(n),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Runs ezaddress benchmarks.')
+    parser.add_argument('--number', type=int, default=1000,
+        help='Number of operations timed per benchmark.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000],
+        help='Row counts for bulk benchmarks, e.g. --rows 1000 100000.')
+    parser.add_argument('--only', default='',
+        help='Only run benchmarks whose name contains this text.')
+    parser.add_argument('--json',
+        help='File to write the results to as JSON.')
+    return parser.parse_args(argv)
+
+
+@django_sandbox
+def run_benchmarks():
+    from django.test.runner import DiscoverRunner
+    
+    args = parse_args(sys.argv[1:])
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        results = []
+        for (name, bulk, func) in BENCHMARKS:
+            if args.only not in name:
+                continue
+            for n in (args.rows if bulk else [args.number]):
+                result = run_benchmark(name, bulk, func, n)
+                results.append(result)
+                print('%-50s %10.1f us/op %8.2f queries/op' % (
+                      result['name'], result['mean_us'],
+                      result['queries_per_op']))
+    finally:
+        runner.teardown_databases(old_config)
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -2,8 +2,11 @@
 A stand-alone test runner script, configuring the minimum settings required
 for tests to execute.
 """
+import atexit
 import os
+import shutil
 import sys
+import tempfile
 
 
 
@@ -11,16 +14,33 @@ import sys
 BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
 sys.path.insert(0, BASE_DIR)
 
+# test databases are files, so tests may use several connections 
+# concurrently, kept in a directory of their own which is removed on exit
+TEST_DB_DIR = tempfile.mkdtemp(prefix='ezaddress-tests-')
+atexit.register(shutil.rmtree, TEST_DB_DIR, True)
+
 # minimum settings required for app's tests
 SETTINGS_DICT = {
     'BASE_DIR': BASE_DIR,
     'INSTALLED_APPS': (
         'ezaddress',
+        'ezaddress.tests',
     ),
     'DATABASES': {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'TEST': {
+                'NAME': os.path.join(TEST_DB_DIR, 'test_db.sqlite3'),
+            },
+        },
+        # a stand-in for a read replica, for tests of replica routing
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+            'TEST': {
+                'NAME': os.path.join(TEST_DB_DIR, 'test_replica.sqlite3'),
+            },
         },
     },
 }
@@ -52,7 +72,7 @@ def run_tests():
     TestRunner = get_runner(settings)
     
     # now we run the tests
-    test_runner = TestRunner(verbosity=1, interactive=True)
+    test_runner = TestRunner(verbosity=1, interactive=False)
     failures = test_runner.run_tests(['ezaddress.tests'])
     sys.exit(bool(failures))
 
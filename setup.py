@@ -19,7 +19,10 @@ setup(
     description='A django application for working with and handling addresses.',
     long_description=open(os.path.join(os.path.dirname(__file__), 
                                        'README.md')).read(),
-    packages=['ezaddress'],
+    packages=['ezaddress', 'ezaddress.migrations', 'ezaddress.management',
+              'ezaddress.management.commands'],
+    package_data={'ezaddress': ['data/*.csv']},
+    extras_require={'numpy': ['numpy']},
     test_suite='runtests.run_tests',
     classifiers=[
         'Development Status :: 3 - Alpha',